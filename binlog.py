@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Fixed-width binary log: a 16-byte header followed by records of
+#   time (epoch seconds), temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run
+# The file is memory-mapped by the readers: columns are NumPy views on the mapped file,
+# and the time window is found by binary search, so only the pages in range are read.
+# memmap: https://numpy.org/doc/stable/reference/generated/numpy.memmap.html
+# e.g.
+#  python monitor.py -b -o monitor.bin
+#  python plotter.py -i monitor.bin -D 30
+import os, sys, time, datetime
+import struct
+from bisect import bisect_left, bisect_right
+import numpy as np
+sys.path.append(os.path.dirname(__file__))
+from sparselog import toEpoch
+
+# FORMAT
+magic    = b'CCMB'
+version  = 1
+binext   = '.bin'
+hdrsize  = 16
+logdtype = np.dtype([
+  ('time',     '<f8'),
+  ('temp',     '<f4'), ('setp',     '<f4'),
+  ('temp_YM1', '<f4'), ('temp_YM2', '<f4'),
+  ('dewp_YM1', '<f4'), ('dewp_YM2', '<f4'),
+  ('air',      'i1' ), ('dry',      'i1' ), ('run', 'i1'), ('pad', 'i1'),
+])
+
+
+def isBinaryLog(fname):
+    return fname.lower().endswith(binext)
+
+
+class BinaryLogWriter(object):
+    """Drop-in for csv.writer that appends fixed-width binary records."""
+
+    def __init__(self,logfile):
+        self.logfile = logfile
+        if logfile.tell()==0:
+            logfile.write(struct.pack('<4sHH8x',magic,version,logdtype.itemsize))
+
+    def writerow(self,row):
+        tval   = toEpoch(row[0])
+        record = np.array([(tval,)+tuple(row[1:10])+(0,)],dtype=logdtype)
+        self.logfile.write(record.tobytes())
+
+
+def mapLog(fname):
+    """Memory-map binary log as array of records; an incomplete last record is ignored."""
+    with open(fname,'rb') as logfile:
+        head = logfile.read(hdrsize)
+    if len(head)<hdrsize or head[:4]!=magic:
+        raise IOError("'%s' is not a binary monitoring log!"%(fname))
+    vers, recsize = struct.unpack('<HH',head[4:8])
+    if vers!=version or recsize!=logdtype.itemsize:
+        raise IOError("Unknown binary log version %d (record size %d)!"%(vers,recsize))
+    nrecs = (os.path.getsize(fname)-hdrsize)//recsize
+    if nrecs==0:
+        return np.empty(0,dtype=logdtype)
+    return np.memmap(fname,dtype=logdtype,mode='r',offset=hdrsize,shape=(nrecs,))
+
+
+class ColumnView(object):
+    """Sequence over a column for bisect, reading only the probed records."""
+
+    def __init__(self,column):
+        self.column = column
+
+    def __len__(self):
+        return len(self.column)
+
+    def __getitem__(self,index):
+        return self.column[index]
+
+
+def getWindow(log,tmin=None,tmax=None):
+    """Return the records in [tmin,tmax] as a view, by binary search on the time column."""
+    times = ColumnView(log['time']) # strided view, no copy
+    imin  = bisect_left(times,tmin) if tmin!=None else 0
+    imax  = bisect_right(times,tmax) if tmax!=None else len(log)
+    return log[imin:imax]
+
+
+def toDatetime64(times):
+    """Convert epoch seconds to local datetime64 for plotting; copies only the given window."""
+    if len(times)==0:
+        return np.empty(0,dtype='datetime64[ms]')
+    tlast  = float(times[-1])
+    offset = (datetime.datetime.fromtimestamp(tlast)-datetime.datetime.utcfromtimestamp(tlast)).total_seconds()
+    return ((times+offset)*1000).astype('int64').astype('datetime64[ms]')
+
+
+def readBinaryLog(fname,tback=None):
+    """Read binary log into rows like sparselog.readLog, for the monitor backlog."""
+    log    = mapLog(fname)
+    window = getWindow(log,time.mktime(tback.timetuple()) if tback else None)
+    rows   = [ ]
+    for record in window.tolist():
+        rows.append([datetime.datetime.fromtimestamp(record[0])]+list(record[1:10]))
+    return rows
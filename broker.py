@@ -0,0 +1,239 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Local broker daemon owning the single connection to the SimServ protocol server of the chamber.
+# Clients connect to its Unix domain socket and speak the same SimServ protocol as to the chamber;
+# chamber_commands.ClimateChamber (and batch_chamber_commands) use the broker automatically,
+# if its socket exists for the chamber's IP and port (see getBrokerPath).
+# The requests of all clients are queued and sent to the chamber in pipelined batches, in order.
+# GET replies are kept as a snapshot and answered from it while younger than maxage seconds;
+# any other command (SET, START, STOP, ...) is always forwarded and clears the snapshot.
+# e.g.
+#  python broker.py &
+#  python monitor.py      # via broker
+#  python status.py       # via broker, without competing with the monitor on the chamber
+import os, sys, time
+import socket, threading
+import signal
+from collections import deque
+sys.path.append(os.path.dirname(__file__))
+from utils import warning
+from chamber_commands import ClimateChamber, getBrokerPath, defaultip, cmd_dict, SR, CR, LF
+
+# READ COMMANDS: answered from the snapshot and retried after a failure
+getids   = set(i for d in cmd_dict['GET'].values() for i in d.values())
+setids   = set(i for k in cmd_dict if k!='GET' for d in cmd_dict[k].values()
+                 for i in (d.values() if isinstance(d,dict) else [d]))
+readargs = { 19204: 0, 19031: 1 } # IDs shared by GET and SET: a read up to this many arguments
+
+
+def isRead(command):
+    """Return True if the raw SimServ command only reads."""
+    parts = command.split(SR)
+    try:
+        cmdid = int(parts[0])
+    except ValueError:
+        return False
+    if cmdid not in getids:
+        return False
+    if cmdid in setids:
+        return cmdid in readargs and len(parts)-2<=readargs[cmdid]
+    return True
+
+
+class Request(object):
+    """One command of a client, waiting for its reply."""
+    __slots__ = ('command','reply','done')
+
+    def __init__(self,command):
+        self.command = command
+        self.reply   = None # reply without terminator; None if the chamber could not be reached
+        self.done    = threading.Event()
+
+
+class SimServBroker(object):
+    """Serialize and pipeline the commands of many clients over one chamber connection."""
+
+    def __init__(self,ip=defaultip,port=2049,path=None,maxage=1.,nbatch=32,**kwargs):
+        self.ip       = ip
+        self.port     = port
+        self.path     = path or getBrokerPath(ip,port)
+        self.maxage   = maxage # maximal age of snapshot replies in seconds
+        self.nbatch   = nbatch # maximal number of commands per pipeline
+        self.chamber  = ClimateChamber(ip,port,broker=False,**kwargs) # never connect to ourselves
+        self.queue    = deque()
+        self.pending  = threading.Condition()
+        self.snapshot = { } # raw GET command -> (time, reply)
+        self.running  = True
+        self.nclients = 0
+        self.nreqs    = 0
+        self.nhits    = 0
+        self.nsent    = 0
+        self.nbatches = 0
+        self.nerrors  = 0
+
+    def start(self):
+        """Listen on the Unix socket and start the chamber thread."""
+        os.makedirs(os.path.dirname(self.path) or '.',mode=0o700,exist_ok=True) # private: clients only trust their own socket
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                probe.close()
+                raise IOError("Another broker is already listening on '%s'!"%(self.path))
+            except (ConnectionRefusedError,FileNotFoundError):
+                os.remove(self.path) # stale socket of a broker that was killed
+        self.server = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        os.chmod(self.path,0o600)
+        self.server.listen(16)
+        threading.Thread(target=self.forward,name="BrokerChamber",daemon=True).start()
+        print("Broker for %s:%s listening on '%s'..."%(self.ip,self.port,self.path))
+
+    def serve(self):
+        """Accept clients until stopped."""
+        while self.running:
+            try:
+                conn, addr = self.server.accept()
+            except OSError:
+                break
+            self.nclients += 1
+            threading.Thread(target=self.handle,args=(conn,),name="BrokerClient",daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        with self.pending:
+            self.pending.notify_all()
+        self.server.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.chamber.close()
+
+    def handle(self,conn):
+        """Read the commands of one client, and return the replies in order."""
+        buffer = b''
+        try:
+            while self.running:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                buffer += data
+                if CR not in buffer:
+                    continue
+                *commands, buffer = buffer.split(CR)
+                requests = [Request(c.lstrip(LF)) for c in commands if c.strip(LF)]
+                with self.pending:
+                    self.queue.extend(requests)
+                    self.pending.notify()
+                replies = [ ]
+                for request in requests:
+                    request.done.wait()
+                    if request.reply==None:
+                        raise IOError("Chamber could not be reached")
+                    replies.append(request.reply+CR+LF)
+                conn.sendall(b''.join(replies))
+        except (IOError,OSError): # client sees a closed connection, and may reconnect and retry
+            pass
+        finally:
+            conn.close()
+
+    def forward(self):
+        """Send the queued commands to the chamber in batches."""
+        while self.running:
+            with self.pending:
+                while self.running and not self.queue:
+                    self.pending.wait()
+                batch = [self.queue.popleft() for i in range(min(self.nbatch,len(self.queue)))]
+            if batch:
+                self.sendBatch(batch)
+
+    def sendBatch(self,batch):
+        """Answer fresh GETs from the snapshot, send the rest in one pipeline."""
+        tnow     = time.time()
+        commands = [ ] # unique commands to send
+        indices  = [ ] # request -> index in commands, or None if answered
+        written  = False
+        self.nreqs += len(batch)
+        for request in batch:
+            command = request.command
+            if not isRead(command):
+                written = True
+                self.snapshot.clear()
+            elif not written:
+                entry = self.snapshot.get(command,None)
+                if entry and tnow-entry[0]<=self.maxage:
+                    request.reply = entry[1]
+                    request.done.set()
+                    self.nhits += 1
+                    indices.append(None)
+                    continue
+                if command in commands: # same GET twice before any write: send once
+                    indices.append(commands.index(command))
+                    continue
+            indices.append(len(commands))
+            commands.append(command)
+        if not commands:
+            return
+        ncmds = len(commands)
+        def exchange(client,cmdstr,command):
+            client.send(command)
+            data = b''
+            while data.count(CR)<ncmds:
+                data += client.recv(512)
+            return [r.lstrip(LF) for r in data.split(CR)[:ncmds]]
+        retry = all(isRead(c) for c in commands)
+        try:
+            replies = self.chamber.query("%d command(s)"%(ncmds),b''.join(c+CR for c in commands),exchange=exchange,retry=retry)
+        except IOError as err:
+            warning("Broker could not reach the chamber: %s"%(err))
+            replies = [None]*ncmds
+            self.nerrors += 1
+        self.nsent    += ncmds
+        self.nbatches += 1
+        tdone = time.time()
+        ilast = max([i for i, c in enumerate(commands) if not isRead(c)],default=-1)
+        for command, reply in zip(commands[ilast+1:],replies[ilast+1:]): # only reads after the last write
+            if reply!=None and reply.startswith(b'1'):
+                self.snapshot[command] = (tdone,reply)
+        for request, index in zip(batch,indices):
+            if index!=None:
+                request.reply = replies[index]
+                request.done.set()
+
+    def getStats(self):
+        return ("%d clients, %d requests: %d from snapshot, %d sent to the chamber in %d pipelines, %d failed pipelines"%(
+                self.nclients,self.nreqs,self.nhits,self.nsent,self.nbatches,self.nerrors))
+
+
+def main(args):
+    broker = SimServBroker(args.ip,args.port,path=args.path,maxage=args.maxage,nbatch=args.nbatch,timeout=args.timeout)
+    signal.signal(signal.SIGTERM,lambda *a: broker.stop())
+    signal.signal(signal.SIGUSR1,lambda *a: print(broker.getStats()))
+    broker.start()
+    try:
+        broker.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if broker.running:
+            broker.stop()
+        print("Broker stopped: %s"%(broker.getStats()))
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    description = '''Share one connection to the climate chamber between all local scripts.'''
+    parser = ArgumentParser(prog="broker",description=description,epilog="Good luck!")
+    parser.add_argument('-i', '--ip',        dest='ip', type=str, default=defaultip, action='store',
+                                             help="IP address of the climate chamber (default: %(default)s)" )
+    parser.add_argument('-p', '--port',      dest='port', type=int, default=2049, action='store',
+                                             help="port of the SimServ protocol server (default: %(default)s)" )
+    parser.add_argument('-s', '--socket',    dest='path', type=str, default=None, action='store',
+                                             help="path of the Unix socket; default: %s"%(getBrokerPath('IP','PORT')) )
+    parser.add_argument('-a', '--max-age',   dest='maxage', type=float, default=1., action='store',
+                                             help="answer GETs from replies younger than this many seconds; 0 to always ask the chamber (default: %(default)s)" )
+    parser.add_argument('-n', '--nbatch',    dest='nbatch', type=int, default=32, action='store',
+                                             help="maximal number of commands per pipeline (default: %(default)s)" )
+    parser.add_argument('--timeout',         dest='timeout', type=float, default=5., action='store',
+                                             help="timeout in seconds of SimServ replies (default: %(default)s)" )
+    args = parser.parse_args()
+    main(args)
@@ -1,7 +1,8 @@
 #! /usr/bin/env python
 # coding: latin-1
-import os, sys
-import socket
+import os, sys, time
+import socket, stat, tempfile
+import threading, weakref
 sys.path.append(os.path.dirname(__file__))
 from utils import warning
 if 'DISPLAY' in os.environ:
@@ -12,6 +13,21 @@ if 'DISPLAY' in os.environ:
 # CLIMATE CHAMBER IP
 defaultip = '130.60.164.198' #'169.254.219.152'
 
+# BROKER: local daemon sharing one connection to the chamber (see broker.py);
+# clients connect to its Unix socket instead of the chamber, if it exists in a private directory of the user
+brokerdir = os.environ.get('SIMSERV_BROKER_DIR',os.path.join(tempfile.gettempdir(),"simserv-%d"%(os.getuid())))
+getBrokerPath = lambda ip=defaultip, port=2049: os.path.join(brokerdir,"simserv_%s_%s.sock"%(ip,port))
+
+def isTrustedBroker(path):
+  """Return True if the broker socket and its directory belong to this user, and others cannot write to the directory."""
+  try:
+    sockstat = os.lstat(path)
+    dirstat  = os.stat(os.path.dirname(path) or '.')
+  except OSError:
+    return False
+  return (stat.S_ISSOCK(sockstat.st_mode) and sockstat.st_uid==os.getuid() and
+          dirstat.st_uid==os.getuid() and not dirstat.st_mode & stat.S_IWOTH)
+
 # SIMSERV COMMAND
 # CMD + SR + CBR + CR
 # CMD + SR + CBR + SR + ARG + CR
@@ -158,8 +174,38 @@ startRun = lambda c: sendSimServCmd(client,'START MANUAL',[1,1])
 stopRun  = lambda c: sendSimServCmd(client,'START MANUAL',[1,0])
 
 # CLIMATE CHAMBER CLASS
-class ClimateChamber(socket.socket):
-  __slots__ = ()
+class ClimateChamber(object):
+  """Connection to the SimServ protocol server of the climate chamber,
+  with connect/read timeouts and reconnection with exponential backoff.
+  Only GET commands are retried after a failure; SET, START and STOP commands never are.
+  Each command, including its reconnects and retries, takes at most 'deadline' seconds.
+  If a local broker is running for this chamber, connect to its Unix socket instead."""
+  
+  def __init__(self,ip=defaultip,port=2049,**kwargs):
+    self.ip          = ip
+    self.port        = port
+    self.timeout     = kwargs.get('timeout',     5.  ) # read timeout in seconds
+    self.conntimeout = kwargs.get('conntimeout', 5.  ) # connect timeout in seconds
+    self.retries     = kwargs.get('retries',     2   ) # retries of GET commands
+    self.deadline    = kwargs.get('deadline',    self.timeout) # maximal time per command with retries
+    self.backoff     = kwargs.get('backoff',     0.5 ) # first delay between reconnects in seconds
+    self.backoffmax  = kwargs.get('backoffmax',  60. ) # maximal delay between reconnects in seconds
+    self.broker      = kwargs.get('broker',      True) # connect via local broker, if running
+    self.sock        = None
+    self.nfails      = 0  # consecutive failed connects
+    self.tnext       = 0. # earliest time of next connect
+    self.nreconnects = 0
+    self.cache       = None
+    cache            = kwargs.get('cache',       False) # True or dict of TTLs
+    if cache:
+      self.enableCache(cache if isinstance(cache,dict) else None)
+    self.connect()
+  
+  def enableCache(self,ttls=None):
+    """Cache slow-changing values (see cache_ttls)."""
+    self.cache = SimServCache(ttls)
+    return self.cache
+  
   def getTemp(self):    return getTemp(self)
   def getSetp(self):    return getSetp(self)
   def getAir(self):     return getAir(self)
@@ -173,14 +219,313 @@ class ClimateChamber(socket.socket):
     return forceWarmUp(self,*args,**kwargs)
   def stop(self,*args,**kwargs):
     return stopClimateChamber(self,*args,**kwargs)
+  def waitFor(self,*args,**kwargs):
+    return waitFor(self,*args,**kwargs)
+  
+  def connect(self,timeout=None):
+    if timeout!=None and timeout<=0: # deadline of the command passed
+      raise socket.timeout("No time left to connect to climate chamber at %s:%s"%(self.ip,self.port))
+    timeout = min(self.conntimeout,timeout or self.conntimeout)
+    sock = self.connectBroker(timeout) if self.broker else None
+    if sock==None:
+      sock = socket.create_connection((self.ip,self.port),timeout=timeout)
+    sock.settimeout(self.timeout)
+    self.sock = sock
+  
+  def connectBroker(self,timeout=None):
+    """Connect to the Unix socket of the local broker; None if there is none."""
+    path = getBrokerPath(self.ip,self.port)
+    if not os.path.exists(path):
+      return None
+    if not isTrustedBroker(path): # could be anybody's socket
+      warning("Broker socket '%s' does not belong to you or is in a public directory; connecting directly..."%(path))
+      return None
+    sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    sock.settimeout(timeout or self.conntimeout)
+    try:
+      sock.connect(path)
+    except OSError as err: # stale socket of a stopped broker
+      sock.close()
+      warning("Broker at '%s' not available (%s); connecting directly..."%(path,err))
+      return None
+    return sock
+  
+  def reconnect(self,tstop=None):
+    """Reconnect, waiting for the backoff delay if it ends before tstop (default: in one timeout)."""
+    tnow  = time.time()
+    tstop = tstop or tnow+self.timeout
+    wait  = self.tnext-tnow
+    if self.tnext>=tstop:
+      raise IOError("Not connected to climate chamber; next reconnect in %.0f s"%(wait))
+    elif wait>0:
+      time.sleep(wait)
+    try:
+      self.connect(timeout=tstop-time.time())
+    except OSError:
+      self.nfails += 1
+      self.tnext   = time.time() + min(self.backoffmax,self.backoff*2**(self.nfails-1))
+      raise
+    self.nfails       = 0
+    self.nreconnects += 1
+    warning("Reconnected to climate chamber at %s:%s"%(self.ip,self.port))
+  
+  def close(self):
+    if self.sock!=None:
+      self.sock.close()
+      self.sock = None
+  
+  def send(self,data):
+    return self.sock.sendall(data)
+  
+  def recv(self,size):
+    data = self.sock.recv(size)
+    if not data:
+      raise ConnectionError("Connection closed by climate chamber")
+    return data
+  
+  def query(self,cmdstr,command,exchange=None,retry=None):
+    """Send command and return the unpacked reply; reconnect on failure, retry GET commands."""
+    if exchange==None:
+      exchange = querySimServ
+    if retry==None:
+      retry = cmdstr.startswith('GET')
+    ntries = 1+self.retries if retry else 1
+    tstop  = time.time()+self.deadline
+    for itry in range(ntries):
+      try:
+        if self.sock==None:
+          self.reconnect(tstop)
+        self.sock.settimeout(max(0.001,min(self.timeout,tstop-time.time()))) # replies within the deadline
+        return exchange(self,cmdstr,command)
+      except OSError as err:
+        self.close() # reply may be out of sync: start a fresh connection
+        if itry+1>=ntries or time.time()>=tstop or self.tnext>=tstop: # no retry after the deadline or during backoff
+          raise IOError("SimServ command '%s' failed: %s"%(cmdstr,err))
+        warning("SimServ command '%s' failed (%s); retrying..."%(cmdstr,err))
+  
+
+# CACHE: time-to-live in seconds of slow-changing values;
+# commands that are not listed are never cached
+cache_ttls = {
+  'GET CTRL_VAR SETPOINT': 30,
+  'GET CTRL_VAL SETPOINT': 30,
+  'GET DIGI_OUT VAL':      30,
+  'GET GRAD_UP VAL':       60,
+  'GET GRAD_DWN VAL':      60,
+  'GET PRGM NUM':          30,
+  'GET PRGM NAME':        300,
+  'GET CTRL_VAR NAME':   3600,
+  'GET CTRL_VAR UNIT':   3600,
+  'GET DIGI_OUT NAME':   3600,
+}
+writethrough = ['SET CTRL_VAR','SET CTRL_VAL','SET DIGI_OUT','SET GRAD_UP','SET GRAD_DWN']
+
+class SimServCache(object):
+  """Write-through cache of GET replies with per-command TTLs.
+  SET commands sent through the same client update the matching entry;
+  any other write (START, STOP, SET PRGM, ...) clears the whole cache."""
+  
+  def __init__(self,ttls=None):
+    self.ttls    = dict(cache_ttls if ttls==None else ttls)
+    self.entries = { } # (cmdstr, args, chamber) -> (expiry time, output)
+    self.lock    = threading.Lock()
+    self.nhits   = 0
+    self.nmisses = 0
+    self.nwrites = 0
+    self.nclears = 0
+  
+  def get(self,cmdstr,args,chamber=1):
+    """Return cached output, or None if absent or expired."""
+    if cmdstr not in self.ttls:
+      return None
+    with self.lock:
+      entry = self.entries.get((cmdstr,tuple(args),chamber),None)
+      if entry and entry[0]>time.time():
+        self.nhits += 1
+        return list(entry[1])
+      self.nmisses += 1
+    return None
+  
+  def store(self,cmdstr,args,output,chamber=1):
+    ttl = self.ttls.get(cmdstr,None)
+    if ttl:
+      with self.lock:
+        self.entries[(cmdstr,tuple(args),chamber)] = (time.time()+ttl,list(output))
+  
+  def write(self,cmdstr,args,chamber=1,code=1):
+    """Update or invalidate entries after a write command; a rejected write (code!=1) only invalidates."""
+    if cmdstr.startswith('GET'):
+      return
+    readback = getReadbackCmd(cmdstr,args)
+    with self.lock:
+      self.nwrites += 1
+      if readback and code==1 and any(cmdstr.startswith(w) for w in writethrough):
+        getstr, getargs = readback
+        ttl = self.ttls.get(getstr,None)
+        if ttl:
+          self.entries[(getstr,tuple(getargs),chamber)] = (time.time()+ttl,[str(args[-1])])
+      elif readback and code!=1:
+        self.entries.pop((readback[0],tuple(readback[1]),chamber),None)
+      else:
+        self.entries.clear()
+        self.nclears += 1
+  
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+  
+  def todict(self):
+    """Cache statistics."""
+    ntot = self.nhits+self.nmisses
+    return {
+      'cache_hits':     self.nhits,
+      'cache_misses':   self.nmisses,
+      'cache_hit_rate': self.nhits/ntot if ntot else 0.,
+      'cache_writes':   self.nwrites,
+      'cache_clears':   self.nclears,
+      'cache_entries':  len(self.entries),
+    }
+  
+
+# COMMAND STATISTICS (optional, see enableSimServStats)
+cmdstats = None
+
+# CONNECTION LOCKS: one send/recv round trip at a time per connection,
+# so that several threads (e.g. interlock watchdog and monitor) can share it
+cmdlocks = weakref.WeakKeyDictionary()
+newlock  = threading.Lock()
+
+def getCmdLock(client):
+  """Return the lock of a connection."""
+  lock = cmdlocks.get(client,None)
+  if lock==None:
+    with newlock:
+      lock = cmdlocks.setdefault(client,threading.RLock())
+  return lock
   
 
 def sendSimServCmd(client, cmdstr, args=[ ], chamber=1, verbose=False):
   """Execute command from given string."""
   command = createSimServCmdFromString(cmdstr,args,chamber=chamber,verbose=verbose)
+  cache   = getattr(client,'cache',None)
+  if cache:
+    output = cache.get(cmdstr,args,chamber)
+    if output!=None:
+      return output
+  exchange = lambda c, s, m: querySimServ(c,s,m,withcode=True)
+  with getCmdLock(client):
+    if isinstance(client,ClimateChamber):
+      code, output = client.query(cmdstr,command,exchange=exchange)
+    else:
+      code, output = exchange(client,cmdstr,command)
+  if cache:
+    if cmdstr.startswith('GET'):
+      if code==1 and output: # do not cache errors
+        cache.store(cmdstr,args,output,chamber)
+    else:
+      cache.write(cmdstr,args,chamber,code=code)
+  return output
+  
+
+def querySimServ(client, cmdstr, command, withcode=False):
+  """Send command and unpack the reply; with withcode=True, return (code, output)."""
+  if cmdstats:
+    code, output = sendSimServCmdTimed(client,cmdstr,command)
+  else:
+    client.send(command)
+    data = client.recv(512)
+    code, output = unpackSimServReply(data)[0], unpackSimServData(data)
+  return (code, output) if withcode else output
+  
+
+def pipelineSimServCmds(client, cmds, chamber=1, verbose=False):
+  """Send several commands in one go and read all replies afterwards.
+  Takes a list of (cmdstr, args) and returns a list of (code, output) in the same order.
+  GETs before the first write are answered from the cache, if the client has one and the entry is fresh.
+  Only pipelines of GET commands are retried after a connection failure."""
+  cache  = getattr(client,'cache',None)
+  cached = { } # index -> reply from the cache
+  if cache:
+    for i, (cmdstr, args) in enumerate(cmds):
+      if not cmdstr.startswith('GET'):
+        break # later reads must see the write
+      output = cache.get(cmdstr,args,chamber)
+      if output!=None:
+        cached[i] = (1,output)
+  allcmds = cmds
+  cmds    = [c for i, c in enumerate(allcmds) if i not in cached]
+  if not cmds:
+    return [cached[i] for i in range(len(allcmds))]
+  command = b''.join(createSimServCmdFromString(c,a,chamber=chamber,verbose=verbose) for c, a in cmds)
+  cmdstr  = " + ".join(c for c, a in cmds)
+  retry   = all(c.startswith('GET') for c, a in cmds)
+  ncmds   = len(cmds)
+  def exchange(client, cmdstr, command):
+    t0   = time.perf_counter()
+    client.send(command)
+    t1   = time.perf_counter()
+    data = b''
+    while data.count(CR)<ncmds:
+      data += client.recv(512)
+    t2      = time.perf_counter()
+    replies = [unpackSimServReply(r.lstrip(LF)) for r in data.split(CR)[:ncmds]]
+    t3      = time.perf_counter()
+    if cmdstats: # one round trip for all: attribute an equal share to each command
+      for (name, args), (code, output) in zip(cmds,replies):
+        cmdstats.record(name,code,(t1-t0)/ncmds,(t2-t1)/ncmds,(t3-t2)/ncmds)
+    return replies
+  with getCmdLock(client):
+    if isinstance(client,ClimateChamber):
+      replies = client.query(cmdstr,command,exchange=exchange,retry=retry)
+    else:
+      replies = exchange(client,cmdstr,command)
+  if cache: # keep the cache consistent
+    for (cmdstr, args), (code, output) in zip(cmds,replies):
+      if not cmdstr.startswith('GET'):
+        cache.write(cmdstr,args,chamber,code=code)
+      elif code==1:
+        cache.store(cmdstr,args,output,chamber)
+  if cached:
+    replies = iter(replies)
+    replies = [cached[i] if i in cached else next(replies) for i in range(len(allcmds))]
+  return replies
+  
+
+def sendSimServCmdTimed(client, cmdstr, command):
+  """Execute command, record its timing in cmdstats, and return (code, output)."""
+  t0     = time.perf_counter()
   client.send(command)
-  data = client.recv(512)
-  return unpackSimServData(data)
+  t1     = time.perf_counter()
+  data   = client.recv(512)
+  t2     = time.perf_counter()
+  output = unpackSimServData(data)
+  t3     = time.perf_counter()
+  try:
+    code = int(data.split(SR,1)[0])
+  except ValueError:
+    code = 0
+  cmdstats.record(cmdstr,code,t1-t0,t2-t1,t3-t2)
+  return code, output
+  
+
+def enableSimServStats(fname=None):
+  """Record per-command counters, error codes and latencies of all SimServ commands.
+  If a file name is given, dump the statistics there on SIGUSR1 and at exit."""
+  global cmdstats
+  import atexit, signal, threading
+  from cmdstats import SimServStats
+  if cmdstats==None:
+    cmdstats = SimServStats()
+  if fname:
+    atexit.register(cmdstats.dump,fname)
+    if hasattr(signal,'SIGUSR1'): # dump in a thread: the handler may interrupt record() holding the lock
+      signal.signal(signal.SIGUSR1,lambda signum, frame: threading.Thread(target=cmdstats.dump,args=(fname,),daemon=True).start())
+  return cmdstats
+  
+
+def getSimServStats():
+  """Return command statistics as a dictionary, if enabled."""
+  return cmdstats.todict() if cmdstats else { }
   
 
 def createSimServCmdFromString(cmdstr, args=[ ], chamber=1, verbose=False):
@@ -211,6 +556,16 @@ def ceateSimServCmd(cmdID, arglist=[ ], chamber=1, verbose=False):
   return cmd
   
 
+def unpackSimServReply(data):
+  """Split reply in response code and output, without warning."""
+  list = data.rstrip(CR+LF).split(SR)
+  try:
+    code = int(list[0])
+  except ValueError:
+    code = 0
+  return code, [o.decode() for o in list[1:]]
+  
+
 def unpackSimServData(data):
   """Format for output."""
   list = data.rstrip(CR+LF).split(SR)
@@ -222,33 +577,117 @@ def unpackSimServData(data):
   return output
   
 
-def connectClimateChamber(ip=defaultip,port=2049):
+def connectClimateChamber(ip=defaultip,port=2049,**kwargs):
   """Connect to climate chamber via give IP address."""
   try:
     socket.inet_aton(ip)
   except socket.error:
     raise IOError("Socket error! Could not find IP %s!"%ip)
-  client = socket.socket(socket.AF_INET,socket.SOCK_STREAM) # create stream socket
-  result = client.connect((ip,port)) # connect to protocol server
-  client.__class__ = ClimateChamber
+  client = ClimateChamber(ip,port,**kwargs) # connect to protocol server
   return client
   
 
-def forceWarmUp(client,target=24,gradient=3):
-  """Force warm up."""
-  if int(sendSimServCmd(client,'GET PRGM STATUS')[0])!=0:
-    sendSimServCmd(client,'STOP PRGM')
+def getReadbackCmd(cmdstr,args):
+  """Return the GET command and arguments reading back a SET command, or None.
+  By convention, the last argument of a SET command is the value."""
+  if not cmdstr.startswith('SET '):
+    return None
+  getstr = 'GET'+cmdstr[3:]
+  cmdid  = cmd_dict
+  for key in getstr.split():
+    if not isinstance(cmdid,dict) or key not in cmdid:
+      return None
+    cmdid = cmdid[key]
+  return getstr, args[:-1]
+  
+
+def isSameValue(intended,actual):
+  try:
+    return abs(float(intended)-float(actual))<1e-3
+  except ValueError:
+    return str(intended)==str(actual)
+  
+
+def writeTransaction(client,cmds,verify=True,rollback=False,verbose=False):
+  """Send a group of SET (and other) commands in one pipeline, then read back all SET commands
+  in a second pipeline. With rollback=True, the old values are read first, and restored on a mismatch.
+  Return the list of differences as dicts with 'cmd', 'args', 'intended' and 'actual' (empty if all OK)."""
+  readbacks = [(i,getReadbackCmd(c,a)) for i, (c, a) in enumerate(cmds)]
+  readbacks = [(i,r) for i, r in readbacks if r]
+  oldvalues = [ ]
+  if rollback and readbacks:
+    oldvalues = pipelineSimServCmds(client,[r for i, r in readbacks])
+  replies = pipelineSimServCmds(client,cmds)
+  for (cmdstr, args), (code, output) in zip(cmds,replies):
+    if code!=1 and cmdstr!='STOP PRGM': # stopping a stopped program is fine
+      warning("ERROR! %s (%s) for '%s' %s"%(err_dict.get(code,'UNKNOWN ERROR (%s)!'%code),code,cmdstr,args))
+  diffs = [ ]
+  if verify and readbacks:
+    actuals = pipelineSimServCmds(client,[r for i, r in readbacks])
+    for (i, (getstr, getargs)), (code, output) in zip(readbacks,actuals):
+      cmdstr, args = cmds[i]
+      actual = output[0] if output else None
+      if code!=1 or actual==None or not isSameValue(args[-1],actual):
+        diffs.append({ 'cmd': cmdstr, 'args': args, 'intended': args[-1], 'actual': actual })
+    if verbose or diffs:
+      for diff in diffs:
+        warning("Readback mismatch for '%s' %s: %s instead of %s"%(diff['cmd'],diff['args'][:-1],diff['actual'],diff['intended']))
+    if diffs and rollback and oldvalues:
+      warning("Rolling back %d command(s)..."%(len(readbacks)))
+      restore = [(cmds[i][0],list(cmds[i][1][:-1])+[old[1][0]]) for (i, r), old in zip(readbacks,oldvalues) if old[0]==1 and old[1]]
+      pipelineSimServCmds(client,restore)
+  return diffs
+  
+
+def forceWarmUp(client,target=24,gradient=3,verify=True):
+  """Force warm up in two round trips: all commands in one pipeline, then one readback pipeline.
+  Return True if the readback matches."""
   assert isinstance(target,float) or isinstance(target,int),"Target temperature (%s\u00b0C) is not a number!"%(target)
   warning("Force warm up to target temperature %.1f\u00b0C with a gradient of %.1f K/min..."%(target,gradient))
-  sendSimServCmd(client,'SET CTRL_VAR SETPOINT',[1,target])
-  sendSimServCmd(client,'SET GRAD_UP VAL', [1,gradient])
-  sendSimServCmd(client,'SET GRAD_DWN VAL',[1,gradient])
   print("Turning on compressed air and dryer...")
-  sendSimServCmd(client,'SET DIGI_OUT VAL',[7,1]) # AIR1  ON
-  sendSimServCmd(client,'SET DIGI_OUT VAL',[8,1]) # DRYER ON
   print("Starting forced warm-up to %.3f\u00b0C..."%target)
-  sendSimServCmd(client,'START MANUAL',[1,1])
+  diffs = writeTransaction(client,[
+    ('STOP PRGM',             [ ]),
+    ('SET CTRL_VAR SETPOINT', [1,target]),
+    ('SET GRAD_UP VAL',       [1,gradient]),
+    ('SET GRAD_DWN VAL',      [1,gradient]),
+    ('SET DIGI_OUT VAL',      [7,1]), # AIR1  ON
+    ('SET DIGI_OUT VAL',      [8,1]), # DRYER ON
+    ('START MANUAL',          [1,1]),
+  ],verify=verify)
   warning("Please turn the climate box off yourself!")
+  return not diffs
+  
+
+def waitFor(client,predicate,timeout=60,tmin=0.2,tmax=5.,factor=1.5,verbose=False):
+  """Poll predicate(client) until it returns a true value, or until timeout (in seconds).
+  Polls fast at first, and backs off from tmin to tmax seconds between polls.
+  Return the value of the predicate, or None on timeout."""
+  tstart = time.time()
+  tstop  = tstart+timeout
+  tpoll  = tmin
+  while True:
+    value = predicate(client)
+    if value:
+      if verbose:
+        print("Condition met after %.1f s"%(time.time()-tstart))
+      return value
+    tleft = tstop-time.time()
+    if tleft<=0:
+      warning("Condition not met within %.0f s!"%(timeout))
+      return None
+    time.sleep(min(tpoll,tleft))
+    tpoll = min(tmax,tpoll*factor)
+  
+
+# PREDICATES for waitFor
+isPrgmRunning    = lambda c: int(sendSimServCmd(c,'GET PRGM STATUS')[0]) & 1==1
+isPrgmStopped    = lambda c: int(sendSimServCmd(c,'GET PRGM STATUS')[0])==0
+isChamberRunning = lambda c: int(sendSimServCmd(c,'GET CHAMBER STATUS')[0]) & 2==2 # 3: test running
+isChamberStopped = lambda c: int(sendSimServCmd(c,'GET CHAMBER STATUS')[0]) & 2==0 # 1: test not running
+def isSetpointReached(target,tolerance=0.5):
+  """Return predicate that is true when the temperature is within tolerance of target."""
+  return lambda c: abs(getTemp(c)-target)<=tolerance
   
 
 def forceWarmUpEvent(client,**kwargs):
@@ -264,8 +703,8 @@ def stopClimateChamber(client):
   pgmstatus = int(sendSimServCmd(client,'GET PRGM STATUS')[0])
   temp = getTemp(client)
   if pgmstatus!=0:
-    prgmid   = int(sendSimServCmd(chamber,'GET PRGM NUMBER')[0])
-    prgmname = str(sendSimServCmd(chamber,'GET PRGM NAME')[0])
+    prgmid   = int(sendSimServCmd(client,'GET PRGM NUM')[0])
+    prgmname = str(sendSimServCmd(client,'GET PRGM NAME')[0])
     warning("Stop program '%s' (%d) at temperature %.1f\u00b0C without warm-up..."%(prgmname,prgmid,temp))
     sendSimServCmd(client,'STOP PRGM')
   else:
@@ -0,0 +1,129 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Light-weight instrumentation of SimServ commands:
+#   per-command counters, error-code counters and latency histograms
+# HDR histogram: http://hdrhistogram.org/
+import time
+import json
+import threading
+
+# HISTOGRAM BUCKETS
+# log-linear buckets in microseconds: each power of two is split in 2**subbits
+# linear sub-buckets, giving a relative precision of ~3% over the full range
+subbits  = 5
+subcount = 1<<subbits
+
+
+def bucketIndex(usec):
+    """Return HDR-style bucket index for a value in microseconds."""
+    if usec<subcount:
+        return usec
+    exp = usec.bit_length()-subbits-1
+    return ((exp+1)<<subbits) + (usec>>exp) - subcount
+
+
+def bucketValue(index):
+    """Return the upper edge of a bucket in microseconds."""
+    if index<subcount:
+        return index
+    exp = (index>>subbits)-1
+    return ((index&(subcount-1))+subcount+1)<<exp
+
+
+class Histogram(object):
+    """Sparse latency histogram with HDR-style buckets."""
+    __slots__ = ('counts','n','total','max')
+
+    def __init__(self):
+        self.counts = { }
+        self.n      = 0
+        self.total  = 0
+        self.max    = 0
+
+    def fill(self,seconds):
+        usec = int(seconds*1e6)
+        index = bucketIndex(usec)
+        self.counts[index] = self.counts.get(index,0)+1
+        self.n     += 1
+        self.total += usec
+        if usec>self.max:
+            self.max = usec
+
+    def percentile(self,frac):
+        if self.n==0:
+            return 0
+        target = frac*self.n
+        nsum   = 0
+        for index in sorted(self.counts):
+            nsum += self.counts[index]
+            if nsum>=target:
+                return min(bucketValue(index),self.max)
+        return self.max
+
+    def todict(self):
+        """Summary in microseconds."""
+        return {
+          'n':    self.n,
+          'mean': self.total/self.n if self.n else 0,
+          'p50':  self.percentile(0.50),
+          'p90':  self.percentile(0.90),
+          'p99':  self.percentile(0.99),
+          'max':  self.max,
+        }
+
+
+class SimServStats(object):
+    """Collect statistics of SimServ commands."""
+    phases = ('send','recv','decode','total')
+
+    def __init__(self):
+        self.lock   = threading.Lock()
+        self.tstart = time.time()
+        self.counts = { } # command -> number of calls
+        self.errors = { } # command -> { code -> number }
+        self.hists  = { } # command -> { phase -> Histogram }
+
+    def record(self,cmdstr,code,tsend,trecv,tdecode):
+        """Record one round trip; times are durations in seconds."""
+        with self.lock:
+            self.counts[cmdstr] = self.counts.get(cmdstr,0)+1
+            if code!=1:
+                codes = self.errors.setdefault(cmdstr,{ })
+                codes[code] = codes.get(code,0)+1
+            hists = self.hists.get(cmdstr)
+            if hists is None:
+                hists = self.hists[cmdstr] = { p: Histogram() for p in self.phases }
+            hists['send'].fill(tsend)
+            hists['recv'].fill(trecv)
+            hists['decode'].fill(tdecode)
+            hists['total'].fill(tsend+trecv+tdecode)
+
+    def todict(self):
+        with self.lock:
+            commands = { }
+            for cmdstr in sorted(self.counts,key=lambda c: -self.hists[c]['total'].total):
+                commands[cmdstr] = {
+                  'count':   self.counts[cmdstr],
+                  'errors':  { str(c): n for c, n in self.errors.get(cmdstr,{ }).items() },
+                  'latency': { p: h.todict() for p, h in self.hists[cmdstr].items() },
+                }
+            return {
+              'start':    self.tstart,
+              'time':     time.time(),
+              'ncalls':   sum(self.counts.values()),
+              'unit':     'us',
+              'commands': commands,
+            }
+
+    def dump(self,fname):
+        """Write statistics as JSON."""
+        with open(fname,'w') as outfile:
+            json.dump(self.todict(),outfile,indent=2)
+        print("Wrote SimServ command statistics to '%s'"%(fname))
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+            self.errors.clear()
+            self.hists.clear()
+            self.tstart = time.time()
@@ -0,0 +1,296 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Vectorized derived quantities (dewpoint, frost point, absolute humidity)
+# and a tool to recompute or add them to existing log files chunk by chunk.
+# e.g.
+#  python derived.py -i monitor.dat -o monitor_new.dat -a absh frostp
+#  python derived.py -i monitor.dat -c 6.112 17.62 243.12 # rewrite in place
+# Magnus formula: https://en.wikipedia.org/wiki/Dew_point#Calculating_the_dew_point
+import os, sys, time
+from itertools import islice, groupby
+import numpy as np
+
+# MAGNUS CONSTANTS (a [hPa], b, c [degC])
+magnus     = (6.1121, 18.678, 257.14) # over water, as in yocto_commands.computeDewPoint
+magnus_ice = (6.1115, 23.036, 279.82) # over ice
+
+# LOG COLUMNS: stamp, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run
+# (schema 2 adds tchamber_ns, tyocto_ns; extra columns are appended after them)
+yoctocols = [(3,5), (4,6)] # (temp, dewp) column index per YoctoMeteo module
+
+
+def computeDewPoint(T,RH,constants=magnus):
+    """Compute the dewpoint for arrays of temperature and relative humidity."""
+    a, b, c = constants
+    gamma = np.log(np.asarray(RH)/100.) + (b*T)/(c+T)
+    return (c*gamma)/(b-gamma)
+
+
+def computeFrostPoint(T,RH,constants=magnus_ice,water=magnus):
+    """Compute the frost point for arrays of temperature and relative humidity (over water)."""
+    aw, bw, cw = water
+    a, b, c = constants
+    pvap  = np.asarray(RH)/100.*aw*np.exp((bw*T)/(cw+T)) # vapour pressure in hPa
+    gamma = np.log(pvap/a)
+    return (c*gamma)/(b-gamma)
+
+
+def computeHumidity(T,Tdewp,constants=magnus):
+    """Invert the Magnus formula: relative humidity in % from temperature and dewpoint."""
+    a, b, c = constants
+    return 100.*np.exp((b*Tdewp)/(c+Tdewp) - (b*T)/(c+T))
+
+
+def computeAbsHumidity(T,RH,constants=magnus):
+    """Compute the absolute humidity in g/m^3."""
+    a, b, c = constants
+    pvap = a*np.exp((b*T)/(c+T))*np.asarray(RH)/100. # vapour pressure in hPa
+    return 216.7*pvap/(273.15+T)
+
+
+# DERIVED COLUMNS: name -> function(T,RH)
+derived_dict = {
+  'dewp':   computeDewPoint,
+  'frostp': computeFrostPoint,
+  'absh':   computeAbsHumidity,
+  'humi':   lambda T, RH: RH,
+}
+
+
+def recomputeColumns(cols,constants=None,oldconstants=magnus,add=[ ]):
+    """Recompute dewpoint columns with new constants and/or compute extra columns.
+    Takes a dict of the Yocto columns as float arrays (index -> array); returns a dict of
+    the replaced columns and a list of extra columns. Modules that were not connected (-1) are kept,
+    their extra columns are None."""
+    replaced, extras = { }, [ ]
+    for tcol, dcol in yoctocols:
+        temp   = cols[tcol]
+        dewp   = cols[dcol]
+        valid  = (temp!=-1) | (dewp!=-1)
+        if not valid.any():
+            extras.extend(None for name in add) # module not connected: keep -1
+            continue
+        with np.errstate(invalid='ignore',divide='ignore'): # placeholders of missing modules
+            humi = computeHumidity(temp,dewp,oldconstants)
+            if constants:
+                replaced[dcol] = np.where(valid,computeDewPoint(temp,humi,constants),-1)
+            for name in add:
+                extras.append(np.where(valid,derived_dict[name](temp,humi),-1))
+    return replaced, extras
+
+
+def gatherSlices(src,starts,lengths):
+    """Concatenate the slices src[start:start+length] of a byte array, vectorised."""
+    total   = int(lengths.sum())
+    itype   = np.int32 if len(src)<2**31 else np.int64
+    offsets = (np.cumsum(lengths)-lengths).astype(itype)
+    return src[np.repeat((starts-offsets).astype(itype),lengths)+np.arange(total,dtype=itype)]
+
+
+def formatValues(values,term=b',',ndec=4,maxint=11,fixed=None):
+    """Format a float array like '%.4f', each value followed by term, vectorised in fixed point.
+    Return the concatenated bytes and the length of each value. Values where the mask fixed is set
+    are written as '-1' (placeholder of a missing module). Values beyond maxint integer digits
+    and infinities are formatted by Python; ties of the last decimal may round differently."""
+    values  = np.asarray(values,dtype=np.float64)
+    nvals   = len(values)
+    nans    = values!=values
+    fixed   = np.zeros(nvals,dtype=bool) if fixed is None else fixed&~nans
+    special = ~nans & ~fixed & ~(np.abs(values)<10.**maxint)
+    scaled  = np.rint(np.where(nans|fixed|special,0.,np.abs(values))*10**ndec).astype(np.int64)
+    intpart = scaled//10**ndec
+    powers  = 10**np.arange(1,maxint,dtype=np.int64)
+    ndigits = np.searchsorted(powers,intpart,side='right')+1
+    nint    = int(ndigits.max()) if nvals else 1 # integer digits of the largest value
+    strings = [('%%.%df'%ndec%v).encode() for v in values[special].tolist()]
+    width   = max([1+nint+1+ndec]+[len(x) for x in strings]) # sign, integer digits, point, decimals
+    chars   = np.zeros((nvals,width+1),dtype=np.uint8)
+    chars[:,0] = ord('-')
+    chars[:,1+nint] = ord('.')
+    chars[:,width]  = ord(term)
+    for i in range(nint): # integer digits
+        chars[:,nint-i] = intpart%10+ord('0')
+        intpart //= 10
+    fracpart = scaled%10**ndec
+    for i in range(ndec): # decimals
+        chars[:,1+nint+ndec-i] = fracpart%10+ord('0')
+        fracpart //= 10
+    keep    = np.zeros((nvals,width+1),dtype=bool)
+    keep[:,0] = np.signbit(values)
+    keep[:,1:1+nint] = np.arange(nint)>=nint-ndigits[:,None] # integer digits from the first non-zero one
+    keep[:,1+nint:2+nint+ndec] = True
+    keep[:,width] = True
+    for irow, string in [(nans.nonzero()[0],b'nan'),(fixed.nonzero()[0],b'-1')]+list(zip(special.nonzero()[0],strings)):
+        chars[irow,:len(string)] = np.frombuffer(string,dtype=np.uint8)
+        keep[irow,:width] = False
+        keep[irow,:len(string)] = True
+    return chars[keep], keep.sum(axis=1)
+
+
+def parseFields(buf,starts,stops,maxdigits=15):
+    """Parse the fields buf[start:stop] of one column as floats. Plain decimals are parsed in fixed point,
+    one character position at a time over all rows, as integer mantissa divided by a power of ten,
+    which is rounded exactly like float(); 'nan' and other notations (e.g. exponents) are parsed by float()."""
+    nrows    = len(starts)
+    lengths  = stops-starts
+    minus    = buf[starts]==ord('-')
+    mantissa = np.zeros(nrows,dtype=np.int64)
+    ndigits  = np.zeros(nrows,dtype=np.int64)
+    ndec     = np.zeros(nrows,dtype=np.int64)
+    after    = np.zeros(nrows,dtype=bool) # past the decimal point
+    bad      = np.zeros(nrows,dtype=bool)
+    nosign   = np.zeros(nrows,dtype=bool)
+    for j in range(int(lengths.max())):
+        inside   = j<lengths
+        chars    = buf[np.minimum(starts+j,len(buf)-1)]
+        digits   = chars-np.uint8(ord('0'))
+        isdigit  = inside & (digits<10)
+        isdot    = inside & (chars==ord('.'))
+        mantissa = np.where(isdigit,mantissa*10+digits,mantissa)
+        ndigits += isdigit
+        ndec    += isdigit & after
+        bad     |= (isdot & after) | (inside & ~isdigit & ~isdot & ~(minus if j==0 else nosign))
+        after   |= isdot
+    values  = mantissa/10.**ndec
+    values[minus] *= -1
+    nans    = (lengths==3) & (buf[starts]==ord('n')) & (buf[np.minimum(starts+1,len(buf)-1)]==ord('a')) &\
+              (buf[np.minimum(starts+2,len(buf)-1)]==ord('n'))
+    values[nans] = np.nan
+    plain   = ~bad & (ndigits>0) & (ndigits<=maxdigits)
+    for irow in (~plain & ~nans).nonzero()[0]: # anything else, or let float() raise a clear error
+        values[irow] = float(buf[starts[irow]:stops[irow]].tobytes())
+    return values
+
+
+def processHeader(line,add=[ ],**kwargs):
+    """Pass a comment line through; extend the schema header with the names of the added columns."""
+    if line.startswith('#schema=') and add:
+        line += ''.join(',%s_YM%d'%(name,i+1) for i in range(len(yoctocols)) for name in add)
+    return (line+'\n').encode('latin-1'), 0
+
+
+def processChunk(data,**kwargs):
+    """Recompute a chunk of complete CSV lines (bytes), working on whole columns at once:
+    the fields are located, parsed and formatted with NumPy; the rows are only split and joined.
+    This runs at about 0.4M rows/s (1M rows with two added columns per module in 2.5 s),
+    against 0.25M rows/s when splitting and formatting each field in Python."""
+    data = data.replace(b'\r',b'').strip(b'\n')
+    if data.startswith(b'#') or b'\n#' in data: # header lines: pass through, process the data in between
+        chunks = [ ]
+        for header, lines in groupby(data.split(b'\n'),key=lambda l: l.startswith(b'#')):
+            if header:
+                chunks.extend(processHeader(l.decode('latin-1'),**kwargs) for l in lines)
+            else:
+                chunks.append(processChunk(b'\n'.join(lines),**kwargs))
+        return b''.join(c for c, n in chunks), sum(n for c, n in chunks)
+    if not data:
+        return b'', 0
+    buf    = np.frombuffer(data+b'\n',dtype=np.uint8)
+    ends   = np.flatnonzero(buf==ord('\n'))
+    commas = np.flatnonzero(buf==ord(','))
+    nrows  = len(ends)
+    ncomma = np.diff(np.searchsorted(commas,ends,side='right'),prepend=0) # commas per row
+    if (ncomma!=ncomma[0]).any() or b'\n\n' in data: # irregular rows: process each run of rows with the same number of columns
+        chunks = [processChunk(b'\n'.join(lines),**kwargs) for n, lines in
+                  groupby((l for l in data.split(b'\n') if l),key=lambda l: l.count(b','))]
+        return b''.join(c for c, n in chunks), sum(n for c, n in chunks)
+    ncol   = ncomma[0]+1
+    seps   = commas.reshape(nrows,ncol-1)
+    first  = lambda i: seps[:,i-1]+1 if i>0 else np.concatenate([[0],ends[:-1]+1]) # first byte of column i
+    last   = lambda i: seps[:,i] if i<ncol-1 else ends # separator after column i
+    cols   = { i: parseFields(buf,first(i),last(i)) for t in yoctocols for i in t }
+    replaced, extras = recomputeColumns(cols,**kwargs)
+
+    # ASSEMBLE rows from runs of original fields and runs of formatted values, as lists of bytes per row
+    newcols = dict(replaced)
+    newcols.update((ncol+i,v) for i, v in enumerate(extras))
+    pieces  = [ ]
+    for isnew, run in groupby(range(ncol+len(extras)),key=lambda i: i in newcols):
+        run = list(run)
+        if not isnew and run[0]==0 and run[-1]==ncol-1: # whole lines
+            pieces.append(data.split(b'\n'))
+            continue
+        if not isnew: # original fields of part of the line
+            starts  = first(run[0])
+            lengths = last(run[-1])-starts+1
+            chars   = gatherSlices(buf,starts,lengths)
+        else:
+            values  = np.column_stack([np.full(nrows,-1.) if newcols[i] is None else newcols[i] for i in run])
+            fixed   = np.tile([newcols[i] is None for i in run],nrows) # module not connected: keep -1
+            chars, lengths = formatValues(values.ravel(),fixed=fixed)
+            lengths = lengths.reshape(nrows,len(run)).sum(axis=1)
+        chars[np.cumsum(lengths)-1] = ord('\n') # end of the piece of each row
+        pieces.append(chars.tobytes().split(b'\n')[:-1])
+    return b'\n'.join(map(b','.join,zip(*pieces)))+b'\n', nrows
+
+
+def processLog(inname,outname,chunksize=1<<22,verbose=False,**kwargs):
+    """Stream through a log file and write the recomputed rows, chunksize bytes at a time."""
+    nrows  = 0
+    tstart = time.time()
+    with open(inname,'rb') as infile, open(outname,'wb') as outfile:
+        rest = b''
+        while True:
+            data = infile.read(chunksize)
+            if data:
+                data = rest+data
+                iend = data.rfind(b'\n')+1 # keep incomplete last line for next chunk
+                data, rest = data[:iend], data[iend:]
+            elif rest:
+                data, rest = rest, b''
+            else:
+                break
+            if not data.strip():
+                continue
+            chunk, n = processChunk(data,**kwargs)
+            outfile.write(chunk)
+            nrows += n
+            if verbose:
+                print("  processed %d rows (%.0f rows/s)"%(nrows,nrows/max(1e-6,time.time()-tstart)))
+    return nrows
+
+
+def main(args):
+
+    # SETTINGS
+    inname    = args.input
+    outname   = args.output or inname
+    inplace   = (outname==inname)
+    tmpname   = outname+".tmp" if inplace else outname
+    constants = tuple(args.constants) if args.constants else None
+    add       = args.add or [ ]
+    if not constants and not add:
+        print("Nothing to do: give new Magnus constants (-c) and/or derived columns to add (-a).")
+        return
+
+    # PROCESS
+    print("Processing '%s'..."%(inname))
+    tstart = time.time()
+    nrows  = processLog(inname,tmpname,chunksize=args.chunksize,verbose=args.verbose,
+                        constants=constants,oldconstants=tuple(args.oldconstants),add=add)
+    if inplace:
+        os.replace(tmpname,outname)
+    dt = time.time()-tstart
+    print("Wrote %d rows to '%s' in %.1f s (%.0f rows/s)"%(nrows,outname,dt,nrows/max(1e-6,dt)))
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    description = '''Recompute dewpoints and add derived humidity columns to monitoring logs.'''
+    parser = ArgumentParser(prog="derived",description=description,epilog="Good luck!")
+    parser.add_argument('-i', '--input',     dest='input', type=str, default="monitor.dat", action='store',
+                                             help="input log file with monitoring data (csv format)" )
+    parser.add_argument('-o', '--output',    dest='output', type=str, default=None, action='store',
+                                             help="output log file; default: rewrite input file" )
+    parser.add_argument('-c', '--constants', dest='constants', type=float, nargs=3, default=None, metavar=('A','B','C'),
+                                             help="recompute dewpoints with these Magnus constants" )
+    parser.add_argument('--old-constants',   dest='oldconstants', type=float, nargs=3, default=magnus, metavar=('A','B','C'),
+                                             help="Magnus constants used to compute the logged dewpoints (default: %(default)s)" )
+    parser.add_argument('-a', '--add',       dest='add', nargs='+', choices=sorted(derived_dict), default=None,
+                                             help="append derived columns per YoctoMeteo module" )
+    parser.add_argument('-n', '--chunksize', dest='chunksize', type=int, default=1<<22, action='store',
+                                             help="number of bytes per chunk" )
+    parser.add_argument('-v', '--verbose',   dest='verbose', default=False, action='store_true',
+                                             help="set verbose" )
+    args = parser.parse_args()
+    main(args)
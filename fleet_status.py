@@ -0,0 +1,174 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Status of many climate chambers at once: all chambers are queried concurrently
+# by a bounded pool of workers, each with its own timeouts, and the results
+# are printed in one table. Unreachable chambers are listed as such.
+# e.g.
+#  python fleet_status.py -c 130.60.164.198 130.60.164.144=tepx2
+#  python fleet_status.py -f chambers.txt -n 8 -t 3
+# chambers.txt: one 'IP[:PORT][=NAME]' per line, '#' for comments
+import os, sys, time, datetime
+import threading
+from collections import deque
+sys.path.append(os.path.dirname(__file__))
+from chamber_commands import connectClimateChamber, pipelineSimServCmds, sendSimServCmd, defaultip
+
+# STATUS COMMANDS, sent in one round trip per chamber
+status_cmds = [
+  ('temp',   'GET CTRL_VAR VAL',      [1]),
+  ('setp',   'GET CTRL_VAR SETPOINT', [1]),
+  ('air',    'GET DIGI_OUT VAL',      [7]),
+  ('dry',    'GET DIGI_OUT VAL',      [8]),
+  ('status', 'GET CHAMBER STATUS',    [ ]), # 1: not running, 3: running, +4: warnings, +8: alarms
+  ('prgm',   'GET PRGM NUM',          [ ]),
+]
+
+
+def parseChamber(spec):
+    """Parse 'IP[:PORT][=NAME]' into (name, ip, port)."""
+    name = None
+    if '=' in spec:
+        spec, name = spec.split('=',1)
+    ip, port = (spec.split(':',1)+['2049'])[:2]
+    return (name or ip), ip, int(port)
+
+
+def readChambers(fname):
+    """Read list of chambers from file."""
+    with open(fname,'r') as infile:
+        return [parseChamber(l.split('#')[0].strip()) for l in infile if l.split('#')[0].strip()]
+
+
+def countMessages(client):
+    """Count active alarms and warnings in two round trips; messages that cannot be read are skipped."""
+    output = sendSimServCmd(client,'GET MSG NUM')
+    nmsg   = int(output[0]) if output else 0
+    if nmsg<=0:
+        return 0, 0
+    cmds    = [(c,[i]) for i in range(1,nmsg+1) for c in ['GET MSG STATUS','GET MSG TYPE']]
+    replies = pipelineSimServCmds(client,cmds)
+    nalarms, nwarns = 0, 0
+    for i in range(nmsg):
+        (scode, status), (tcode, mtype) = replies[2*i], replies[2*i+1]
+        if scode!=1 or tcode!=1 or not status or not mtype:
+            continue
+        status, mtype = int(status[0]), int(mtype[0])
+        if status==1:
+            nalarms += bool(mtype & 1)
+            nwarns  += bool(mtype & 2)
+    return nalarms, nwarns
+
+
+def getChamberStatus(name,ip,port=2049,timeout=5.):
+    """Return dict with the status of one chamber; never raises."""
+    result = { 'name': name, 'ip': ip, 'port': port }
+    tstart = time.time()
+    client = None
+    try:
+        client  = connectClimateChamber(ip,port,timeout=timeout,conntimeout=timeout,retries=0)
+        replies = pipelineSimServCmds(client,[(c,a) for k, c, a in status_cmds])
+        for (key, cmdstr, args), (code, output) in zip(status_cmds,replies):
+            result[key] = float(output[0]) if code==1 and output else None
+        status, prgm = int(result['status'] or 0), int(result['prgm'] or 0)
+        if prgm>0:
+            result['run'] = "Program '%s'"%(sendSimServCmd(client,'GET PRGM NAME',[prgm])[0])
+        else:
+            result['run'] = "Manual run" if status&2 else "Not running"
+        if status&12: # only scan messages if the status flags warnings or alarms
+            result['alarms'], result['warnings'] = countMessages(client)
+        else:
+            result['alarms'], result['warnings'] = 0, 0
+    except Exception as err: # one bad chamber must not abort the table
+        result['error'] = str(err) or err.__class__.__name__
+    finally:
+        if client:
+            client.disconnect()
+    result['time'] = time.time()-tstart
+    return result
+
+
+def getFleetStatus(chambers,nworkers=8,timeout=5.,deadline=None):
+    """Query all chambers concurrently; return results in the order of the chambers.
+    Chambers that did not answer before the deadline are reported as timed out;
+    the workers are daemon threads, so a hanging chamber does not keep the process alive."""
+    if deadline==None: # connect, status, program name and messages, per round of workers
+        deadline = 4*timeout*(-(-len(chambers)//max(1,nworkers)))
+    queue   = deque(enumerate(chambers))
+    results = [None]*len(chambers)
+    def work():
+        while True:
+            try:
+                index, (name, ip, port) = queue.popleft()
+            except IndexError:
+                return
+            results[index] = getChamberStatus(name,ip,port,timeout)
+    workers = [threading.Thread(target=work,name="FleetStatus",daemon=True) for i in range(min(nworkers,len(chambers)) or 1)]
+    for worker in workers:
+        worker.start()
+    tstop = time.time()+deadline
+    for worker in workers:
+        worker.join(max(0,tstop-time.time()))
+    for index, (name, ip, port) in enumerate(chambers):
+        if results[index]==None:
+            results[index] = { 'name': name, 'ip': ip, 'port': port, 'error': "no answer within %.0f s"%(deadline), 'time': deadline }
+    return results
+
+
+def formatTable(results):
+    """Format results as an aligned table."""
+    header = ("Name","Address","Status","Temp.","Setp.","Air","Dryer","Alarms","Warn.","Time")
+    rows   = [ ]
+    onoff  = lambda v: '-' if v==None else 'ON' if v==1 else 'OFF'
+    number = lambda v, f="%.2f": '-' if v==None else f%v
+    for r in results:
+        address = "%s:%s"%(r['ip'],r['port'])
+        if 'error' in r:
+            error = r['error'] if len(r['error'])<=50 else r['error'][:24]+"..."+r['error'][-23:]
+            rows.append((r['name'],address,"UNREACHABLE: %s"%(error),'','','','','','',"%.2fs"%r['time']))
+        else:
+            rows.append((r['name'],address,r['run'],number(r['temp']),number(r['setp']),onoff(r['air']),onoff(r['dry']),
+                         "%d"%r['alarms'],"%d"%r['warnings'],"%.2fs"%r['time']))
+    widths = [max(len(str(row[i])) for row in rows+[header]) for i in range(len(header))]
+    lines  = [ ]
+    for row in [header]+rows:
+        lines.append("  "+"  ".join(str(v).ljust(w) if i<3 else str(v).rjust(w) for i, (v, w) in enumerate(zip(row,widths))).rstrip())
+    lines.insert(1,"  "+"-"*(sum(widths)+2*(len(widths)-1)))
+    return '\n'.join(lines)
+
+
+def main(args):
+
+    # CHAMBERS
+    chambers = [parseChamber(c) for c in args.chambers or [ ]]
+    if args.fname:
+        chambers += readChambers(args.fname)
+    if not chambers:
+        chambers = [parseChamber(defaultip)]
+
+    # STATUS
+    tstart  = time.time()
+    results = getFleetStatus(chambers,nworkers=args.nworkers,timeout=args.timeout)
+    print("Status of %d climate chamber%s at %s:"%(len(results),'s' if len(results)>1 else '',
+                                                   datetime.datetime.now().strftime('%d-%m-%Y %H:%M:%S')))
+    print(formatTable(results))
+    nbad = sum('error' in r for r in results)
+    nalarms = sum(r.get('alarms',0) for r in results)
+    print("Checked in %.2f s; %d unreachable, %d with alarms."%(time.time()-tstart,nbad,sum(r.get('alarms',0)>0 for r in results)))
+    if nbad or nalarms:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    description = '''Check the status of many climate chambers concurrently.'''
+    parser = ArgumentParser(prog="fleet_status",description=description,epilog="Good luck!")
+    parser.add_argument('-c', '--chambers',  dest='chambers', nargs='+', default=None, metavar='IP[:PORT][=NAME]',
+                                             help="climate chambers to check" )
+    parser.add_argument('-f', '--file',      dest='fname', type=str, default=None, action='store',
+                                             help="file with one chamber 'IP[:PORT][=NAME]' per line" )
+    parser.add_argument('-n', '--nworkers',  dest='nworkers', type=int, default=8, action='store',
+                                             help="maximal number of chambers queried at the same time (default: %(default)s)" )
+    parser.add_argument('-t', '--timeout',   dest='timeout', type=float, default=5., action='store',
+                                             help="connect and reply timeout per chamber in seconds (default: %(default)s)" )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,323 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Dewpoint interlock with state, hysteresis and debounce:
+#   ARMED      -> TRIPPED    after 'debounce' consecutive samples with temp < dewp + margin:
+#                            force warm-up once and verify it with a single readback
+#   TRIPPED    -> RECOVERING when temp > dewp + margin + hysteresis (and, if predictive, also the forecast)
+#   RECOVERING -> ARMED      after 'nclear' consecutive clear samples
+#   RECOVERING -> TRIPPED    if the condition comes back (same trip, no new warm-up)
+# The interlock can be checked by the monitor loop, and/or at a higher rate by a watchdog thread;
+# each source counts its own consecutive samples for the debounce and re-arm.
+# The watchdog fails safe: if the dewpoint of an online module is older than its bound,
+# it counts as unknown and the interlock trips (forced warm-up) instead of trusting it.
+# The predictive interlock also trips when the forecast of temperature and dewpoint
+# crosses the margin within a given horizon.
+import os, sys, time
+import threading
+from collections import deque
+sys.path.append(os.path.dirname(__file__))
+from utils import warning
+from chamber_commands import sendSimServCmd, forceWarmUp
+
+ARMED, TRIPPED, RECOVERING = 'armed', 'tripped', 'recovering'
+
+
+class Interlock(object):
+    """Stateful dewpoint interlock for all dewpoint sources of one chamber."""
+
+    def __init__(self,chamber,**kwargs):
+        self.chamber    = chamber
+        self.margin     = kwargs.get('margin',      5.   ) # minimal distance temp - dewp
+        self.hysteresis = kwargs.get('hysteresis',  1.   ) # extra distance needed to recover
+        self.debounce   = kwargs.get('debounce',    1    ) # consecutive samples to trip
+        self.nclear     = kwargs.get('nclear',      3    ) # consecutive samples to re-arm
+        self.warmup     = kwargs.get('warmup',      True ) # force warm-up on trip
+        self.target     = kwargs.get('target',      24   ) # warm-up target temperature
+        self.gradient   = kwargs.get('gradient',    3    ) # warm-up gradient
+        self.nretry     = kwargs.get('nretry',      2    ) # retries if the warm-up is not verified
+        self.state      = ARMED
+        self.counters   = { }   # source -> [consecutive samples below margin, above margin + hysteresis]
+        self.dewps      = None  # last dewpoints of the monitor, per module
+        self.tdewps     = None  # time of the last dewpoints of the monitor
+        self.verified   = None  # warm-up readback of this trip
+        self.ntrips     = 0
+        self.nwarmups   = 0     # warm-ups sent in this trip
+        self.tbad       = None  # time the current violation was first seen
+        self.tgood      = None  # time of the last sample without violation
+        self.reactions  = [ ]   # seconds from last good sample to warm-up sent, per trip
+        self.lock       = threading.RLock()
+
+    def check(self,temp,*dewps,**kwargs):
+        """Update the state with a new sample; the highest valid dewpoint counts.
+        With clear=False, the sample does not count towards recovery."""
+        counter = self.getCounter(dewps,**kwargs)
+        dewps = [d for d in dewps if d==d] # ignore NaN of offline modules
+        if not dewps or temp!=temp:
+            return self.state
+        dewp = max(dewps)
+        tnow = kwargs.get('tnow',None) or time.time() # virtual time in a replay
+        with self.lock:
+            if temp<dewp+self.margin:
+                counter[1] = 0
+                counter[0] += 1
+                if self.tbad==None:
+                    self.tbad = tnow
+                if self.state==ARMED and counter[0]>=self.debounce:
+                    self.trip(temp,dewp,tnow=tnow)
+                elif self.state==RECOVERING:
+                    warning("INTERLOCK! Temperature (%.2f\u00b0C) back within %.1f\u00b0C of dewpoint (%.2f\u00b0C)!"%(temp,self.margin,dewp))
+                    self.state = TRIPPED
+                elif self.state==TRIPPED and self.warmup and self.verified==False and self.nwarmups<=self.nretry:
+                    self.forceWarmUp() # previous warm-up did not take effect
+            else:
+                counter[0] = 0
+                self.tbad  = None
+                self.tgood = tnow
+                if temp>dewp+self.margin+self.hysteresis and kwargs.get('clear',True):
+                    counter[1] += 1
+                    if self.state==TRIPPED:
+                        print("Interlock recovering: temperature (%.2f\u00b0C) above dewpoint (%.2f\u00b0C) + %.1f\u00b0C"%(temp,dewp,self.margin+self.hysteresis))
+                        self.state = RECOVERING
+                    if self.state==RECOVERING and counter[1]>=self.nclear:
+                        print("Interlock re-armed.")
+                        self.state = ARMED
+                else:
+                    counter[1] = 0
+        return self.state
+
+    def getCounter(self,dewps,source='monitor',**kwargs):
+        """Return the sample counters of a source; remember the dewpoints of the monitor for the watchdog."""
+        if source=='monitor':
+            self.dewps  = list(dewps)
+            self.tdewps = time.time()
+        return self.counters.setdefault(source,[0,0])
+
+    def trip(self,temp,dewp,reason=None,tnow=None):
+        """Go to the tripped state and force the warm-up once.
+        The reaction time is measured on the clock of the samples (tnow), plus the time to send the warm-up."""
+        if dewp!=dewp: # fail safe
+            warning("INTERLOCK! Temperature (%.2f\u00b0C) with unknown dewpoint: %s!"%(temp,reason))
+        else:
+            if reason==None:
+                reason = "lower than" if dewp>temp else "within %.1f\u00b0C of"%self.margin
+            warning("INTERLOCK! Temperature (%.2f\u00b0C) %s dewpoint (%.2f\u00b0C)!"%(temp,reason,dewp))
+        self.state    = TRIPPED
+        self.ntrips  += 1
+        self.verified = None
+        self.nwarmups = 0
+        if self.warmup:
+            tsend = time.time()
+            self.forceWarmUp()
+            tsent = (tnow or tsend)+time.time()-tsend
+            tstart = self.tgood or self.tbad # upper bound on the time since the violation started
+            if tstart!=None:
+                self.reactions.append(tsent-tstart)
+                print("Interlock reaction time: %.3f s"%(self.reactions[-1]))
+
+    def forceWarmUp(self):
+        """Force warm-up and verify it with one readback."""
+        self.nwarmups += 1
+        try:
+            self.verified = forceWarmUp(self.chamber,target=self.target,gradient=self.gradient,verify=True)
+        except IOError as err:
+            warning("Forced warm-up failed: %s!"%(err))
+            self.verified = False
+        if not self.verified:
+            warning("Forced warm-up not verified! Retrying on next sample...")
+        return self.verified
+
+    def failSafe(self,temp,reason):
+        """Trip when a dewpoint is unknown: warm up and do not cool further on values that cannot be trusted.
+        Recovery needs fresh dewpoints again."""
+        with self.lock:
+            for counter in self.counters.values():
+                counter[1] = 0
+            if self.state==ARMED:
+                self.trip(temp,float('nan'),reason)
+            elif self.state==RECOVERING:
+                self.state = TRIPPED
+        return self.state
+
+    def isTripped(self):
+        return self.state!=ARMED
+
+
+class SlidingRegression(object):
+    """Linear regression y = a + b*t over a sliding time window, updated in O(1) per sample."""
+
+    def __init__(self,window=300.):
+        self.window  = window
+        self.samples = deque()
+        self.t0      = None
+        self.n, self.st, self.sy, self.stt, self.sty = 0, 0., 0., 0., 0.
+
+    def add(self,t,y):
+        if self.t0==None or t-self.t0>10*self.window:
+            self.rebase(t)
+        self.samples.append((t,y))
+        self.sum(t-self.t0,y,+1)
+        while self.samples[0][0]<t-self.window:
+            told, yold = self.samples.popleft()
+            self.sum(told-self.t0,yold,-1)
+
+    def sum(self,t,y,sign):
+        self.n   += sign
+        self.st  += sign*t
+        self.sy  += sign*y
+        self.stt += sign*t*t
+        self.sty += sign*t*y
+
+    def rebase(self,t0):
+        """Shift the time origin to keep the sums precise."""
+        self.t0 = t0
+        self.n, self.st, self.sy, self.stt, self.sty = 0, 0., 0., 0., 0.
+        for t, y in self.samples:
+            self.sum(t-t0,y,+1)
+
+    def slope(self):
+        """Slope per second, or 0 if not enough samples."""
+        denom = self.n*self.stt - self.st*self.st
+        if self.n<3 or denom<=0:
+            return 0.
+        return (self.n*self.sty - self.st*self.sy)/denom
+
+
+class PredictiveInterlock(Interlock):
+    """Interlock that also trips on a forecast: temperature and dewpoint are extrapolated
+    'horizon' seconds ahead from linear fits over the last 'window' seconds.
+    While the chamber cools towards a lower setpoint, it is assumed to cool
+    at least as fast as its GRAD_DWN setting; the setpoint is only trusted for one monitor step.
+    A trip only recovers once the forecast is also clear by margin + hysteresis."""
+
+    def __init__(self,chamber,**kwargs):
+        Interlock.__init__(self,chamber,**kwargs)
+        self.horizon  = kwargs.get('horizon',  120. ) # forecast horizon in seconds
+        window        = kwargs.get('window',   300. ) # regression window in seconds
+        self.tempfit  = SlidingRegression(window)
+        self.dewpfit  = SlidingRegression(window)
+        self.setp     = None
+        self.tsetp    = None # time of the last setpoint
+        self.tstep    = kwargs.get('tstep',    None ) # monitor step: age after which the setpoint is stale
+        self.graddwn  = kwargs.get('graddwn',  None ) # K/min, read from chamber if None
+        self.forecast = None # (temp, dewp) at horizon
+
+    def check(self,temp,*dewps,**kwargs):
+        """Update the fits and trip on the forecast, then do the normal check."""
+        self.getCounter(dewps,**kwargs)
+        valid = [d for d in dewps if d==d]
+        if not valid or temp!=temp:
+            return self.state
+        dewp = max(valid)
+        tnow = kwargs.get('tnow',None) or time.time() # virtual time in a replay
+        with self.lock:
+            if kwargs.get('setp',None)!=None:
+                if kwargs['setp']!=self.setp:
+                    self.setp    = kwargs['setp']
+                    self.graddwn = None # re-read after setpoint changes
+                self.tsetp = tnow
+            setp = self.setp # not passed by the watchdog: ignore once older than one monitor step (with jitter)
+            if setp!=None and self.tstep and tnow-self.tsetp>1.5*self.tstep:
+                setp = None
+            self.tempfit.add(tnow,temp)
+            self.dewpfit.add(tnow,dewp)
+            tempslope = self.tempfit.slope()
+            if setp!=None and setp<temp-0.5: # cooling down
+                if self.graddwn==None:
+                    self.graddwn = float(sendSimServCmd(self.chamber,'GET GRAD_DWN VAL',[1])[0])
+                tempslope = min(tempslope,-self.graddwn/60.)
+            temphor = temp + tempslope*self.horizon
+            if setp!=None and tempslope<0:
+                temphor = max(temphor,min(temp,setp)) # stops cooling at setpoint
+            dewphor = dewp + max(0.,self.dewpfit.slope())*self.horizon
+            self.forecast = (temphor,dewphor)
+            if self.state==ARMED and temp>=dewp+self.margin and temphor<dewphor+self.margin:
+                self.tgood = tnow
+                self.trip(temp,dewp,reason="forecast at %.2f\u00b0C in %d s, within %.1f\u00b0C of"%(
+                          temphor,self.horizon,self.margin),tnow=tnow)
+                return self.state
+            return Interlock.check(self,temp,*dewps,source=kwargs.get('source','monitor'),tnow=tnow,
+                                   clear=(temphor>=dewphor+self.margin+self.hysteresis))
+
+
+class InterlockWatchdog(threading.Thread):
+    """Check the interlock every tstep seconds, independent of the monitor loop.
+    Only cheap values are used: the chamber temperature, the dewpoints pushed by YoctoMeteo callbacks,
+    and for modules without callbacks, the last dewpoint read by the monitor.
+    Callback values are stale once older than the module's maxage, the dewpoints of the monitor
+    once older than maxage seconds; a stale dewpoint of an online module trips the interlock."""
+
+    def __init__(self,interlock,ymeteos,tstep=0.5,maxage=30.):
+        threading.Thread.__init__(self,name="InterlockWatchdog",daemon=True)
+        self.interlock = interlock
+        self.chamber   = interlock.chamber
+        self.ymeteos   = [m for m in ymeteos if m]
+        self.tstep     = tstep
+        self.maxage    = maxage # maximal age of the monitor's dewpoints in seconds
+        self.stale     = [ ]    # modules with stale dewpoints, to warn once
+        self.tstart    = time.time()
+        self.running   = True
+        self.nchecks   = 0
+        self.nerrors   = 0
+        self.tcheck    = 0. # duration of the last check
+        self.tmax      = 0. # longest check
+        self.tlast     = None
+
+    def run(self):
+        print("Interlock watchdog checking every %.2f s..."%(self.tstep))
+        self.tstart = time.time()
+        while self.running:
+            tstart = time.time()
+            try:
+                temp  = self.chamber.getTemp()
+                dewps = self.getDewps()
+                if self.stale:
+                    self.interlock.failSafe(temp,"stale dewpoint of %s"%(', '.join(self.stale)))
+                else:
+                    self.interlock.check(temp,*dewps,source='watchdog')
+            except Exception as err:
+                self.nerrors += 1
+                warning("Interlock watchdog failed to check: %s"%(err))
+            self.tlast   = time.time()
+            self.tcheck  = self.tlast-tstart
+            self.tmax    = max(self.tmax,self.tcheck)
+            self.nchecks += 1
+            time.sleep(max(0,self.tstep-self.tcheck))
+
+    def getDewps(self):
+        """Return the dewpoint per module, NaN if offline; update the list of stale modules."""
+        dewps  = self.interlock.dewps or [float('nan')]*len(self.ymeteos)
+        tdewps = self.interlock.tdewps or self.tstart # no monitor sample yet
+        stale  = [ ]
+        for i, module in enumerate(self.ymeteos):
+            if hasattr(module,'getLatest'): # pushed by callbacks
+                dewps[i] = module.getDewp()
+                if module.online and not module.isFresh():
+                    stale.append(module.get_serialNumber())
+            elif getattr(module,'online',True) and time.time()-tdewps>self.maxage:
+                stale.append(module.get_serialNumber())
+        if stale and stale!=self.stale:
+            warning("Interlock watchdog: dewpoint of %s older than allowed, failing safe!"%(', '.join(stale)))
+        elif self.stale and not stale:
+            print("Interlock watchdog: dewpoints are fresh again.")
+        self.stale = stale
+        return dewps
+
+    def stop(self,timeout=10.):
+        """Stop and wait for the running check to finish."""
+        self.running = False
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout)
+
+    def getMetrics(self):
+        """Reaction-time metrics."""
+        reactions = self.interlock.reactions
+        return {
+          'watchdog_checks':       self.nchecks,
+          'watchdog_errors':       self.nerrors,
+          'watchdog_check_time':   self.tcheck,
+          'watchdog_check_max':    self.tmax,
+          'watchdog_age':          time.time()-self.tlast if self.tlast else -1,
+          'interlock_trips':       self.interlock.ntrips,
+          'interlock_reaction':    reactions[-1] if reactions else -1,
+          'interlock_reaction_max':max(reactions) if reactions else -1,
+        }
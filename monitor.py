@@ -11,6 +11,7 @@
 import os, sys, time, datetime
 import socket
 import csv
+from contextlib import contextmanager
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.gridspec as gridspec
@@ -18,12 +19,74 @@ from matplotlib.widgets import Button
 from utils import warning, checkGUIMode
 from plotter import setTimeAxisMinorLocators
 from chamber_commands import connectClimateChamber, sendSimServCmd, unpackSimServData,\
-                             checkActiveWarnings, openActiveWarnings, getRunStatus,\
-                             checkInterlock, forceWarmUp, forceWarmUpEvent, stopClimateChamberEvent
+                             checkActiveWarnings, openActiveWarnings, getActiveWarnings, getRunStatus,\
+                             checkInterlock, forceWarmUp, forceWarmUpEvent, stopClimateChamberEvent,\
+                             stopClimateChamber, enableSimServStats
 import yocto_commands as YOCTO
-from yocto_commands import connectYoctoMeteo, disconnectYoctoMeteo
+from yocto_commands import connectYoctoMeteo, disconnectYoctoMeteo, readYoctoMeteos
+from server import startMonitorServer
+from interlock import Interlock, PredictiveInterlock, InterlockWatchdog
+from polling import Poller, parsePollingPlan
+from sparselog import CSVLogWriter, SparseLogWriter, getEventName, readLog, schema
+from sqlitelog import SQLiteLogWriter, isDatabase, readDatabase
+from binlog import BinaryLogWriter, isBinaryLog, readBinaryLog
+from replay import ReplaySource, ReplayChamber
+from snapshot import SnapshotWriter
 
 
+nan = float('nan')
+
+
+def readChamber(poller,tnow=None):
+    """Read the due channels and return temperature, setpoint, compressed air and dryer.
+    If the chamber cannot be reached, return NaN and -1 to mark a gap in the log."""
+    try:
+        values = poller.poll(tnow)
+    except IOError as err:
+        warning("Gap in monitoring data: %s"%(err))
+        return nan, nan, -1, -1
+    return values['temp'], values['setp'], values['air'], values['dry']
+
+
+@contextmanager
+def openLogger(logname,sparse=False,deadband=0.1,heartbeat=600,name='chamber'):
+    """Open writer of monitoring rows: SQLite database (.db), binary (.bin), change-only or plain csv file."""
+    if isBinaryLog(logname):
+        with open(logname,'ab') as logfile:
+            yield BinaryLogWriter(logfile)
+    elif isDatabase(logname):
+        logger = SQLiteLogWriter(logname,chamber=name)
+        try:
+            yield logger
+        finally:
+            logger.close()
+    elif sparse:
+        with open(logname,'a+') as logfile, open(getEventName(logname),'a+') as eventfile:
+            logger = SparseLogWriter(logfile,eventfile,deadband=deadband,heartbeat=heartbeat)
+            checkSchema(logname,logger)
+            try:
+                yield logger
+            finally:
+                logger.flush()
+    else:
+        with open(logname,'a+') as logfile:
+            logger = CSVLogWriter(logfile)
+            checkSchema(logname,logger)
+            yield logger
+
+
+def checkSchema(logname,logger):
+    """Warn if an existing log keeps an older schema."""
+    if logger.schema<schema:
+        warning("'%s' has log schema %d: stamps are written in whole seconds, without read times."
+                " Use a new log file for schema %d."%(logname,logger.schema,schema))
+
+
+def getCacheStats(chamber):
+    """Return cache statistics of chamber client, if any."""
+    cache = getattr(chamber,'cache',None)
+    return cache.todict() if cache else { }
+
 
 def monitor(chamber,ymeteo1=None,ymeteo2=None,**kwargs):
     """Start monitoring."""
@@ -33,97 +96,146 @@ def monitor(chamber,ymeteo1=None,ymeteo2=None,**kwargs):
     logname   = kwargs.get('out',      "data.dat" )
     dtime     = kwargs.get('dtime',         -1    )
     nsamples  = kwargs.get('nsamples',      -1    )
-    tstep     = kwargs.get('tstep',          4    )
+    tstep     = kwargs.get('tstep',          4    ) # seconds, may be fractional
     twidth    = kwargs.get('twidth',      1000    )
     ymin      = kwargs.get('ymin',           8.   )
     ymax      = kwargs.get('ymax',          40.   )
     warmup    = kwargs.get('warmup',      True    ) # force warm-up in interlock
+    port      = kwargs.get('port',        None    ) # serve dashboard, /metrics and /latest over HTTP
+    control   = kwargs.get('control',     False   ) # enable stop, warm-up and warning buttons of dashboard
+    token     = kwargs.get('token',       None    ) # dashboard buttons: token to serve them beyond localhost
+    margin    = kwargs.get('margin',        5.    ) # interlock: minimal temp - dewp
+    hysteresis= kwargs.get('hysteresis',    1.    ) # interlock: extra margin to recover
+    debounce  = kwargs.get('debounce',      1     ) # interlock: consecutive samples to trip
+    twatchdog = kwargs.get('watchdog',      0     ) # interlock watchdog period in seconds, 0 for none
+    horizon   = kwargs.get('horizon',       0     ) # predictive interlock horizon in seconds, 0 for none
+    plan      = kwargs.get('plan',        None    ) # polling intervals per channel, see polling.py
+    sparse    = kwargs.get('sparse',      False   ) # change-only logging with event stream
+    deadband  = kwargs.get('deadband',      0.1   ) # sparse: minimal change of temperatures to log
+    heartbeat = kwargs.get('heartbeat',   600     ) # sparse: maximal time between logged rows
+    clock     = kwargs.get('clock',       None    ) # virtual clock of a log replay, see replay.py
+    share     = kwargs.get('share',       True    ) # publish the latest sample in shared memory
     dtback    = datetime.timedelta(days=2) # load only 1-day backlog for plot
     dtwidth   = datetime.timedelta(seconds=twidth)
     dtmargin  = datetime.timedelta(seconds=0.15*twidth)
     title     = "Climate chamber monitor"
     if nsamples>0 and dtime<0:
         dtime   = tstep*nsamples
+    now       = clock.now if clock else datetime.datetime.now
+    epoch     = clock.time if clock else time.time
+    epochns   = (lambda: int(clock.time()*1e9)) if clock else time.time_ns
+    host      = '127.0.0.1' if control and not token else '' # buttons without token: local only
+    server    = startMonitorServer(port,host,token=token) if port else None
+    poller    = Poller(chamber,plan,tstep=tstep)
+    if server and control:
+        server.actions = {
+          'stop':     lambda: stopClimateChamber(chamber),
+          'warmup':   lambda: forceWarmUp(chamber),
+          'warnings': lambda: getActiveWarnings(chamber),
+        }
+    logkwargs = dict(sparse=sparse,deadband=deadband,heartbeat=heartbeat,name=getattr(chamber,'ip','chamber'))
+    def writeEvents(tns):
+        if hasattr(logger,'writeevents'):
+            logger.writeevents(tns,prgm=poller.values['prgm'],nwarn=poller.values['nwarn'])
+    snapshot  = SnapshotWriter(getattr(chamber,'ip','chamber'),tstep=tstep) if share else None
+    def sample(): # sample time, and the times at which the chamber and YoctoMeteo reads completed
+        tns      = epochns()
+        tstart   = time.perf_counter_ns() # monotonic, so the read times are not skewed by clock steps
+        temp, setp, air, dry = readChamber(poller,tns/1e9)
+        tchamber = tns+time.perf_counter_ns()-tstart
+        (temp_YM1,dewp_YM1), (temp_YM2,dewp_YM2) = readYoctoMeteos(ymeteo1,ymeteo2)
+        tyocto   = tns+time.perf_counter_ns()-tstart
+        return tns, tchamber, tyocto, temp, setp, air, dry, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2
+    def publish(tsec,**values): # for status.py and quick_status.py
+        if snapshot:
+            snapshot.publish(time=tsec,status=poller.values['status'],prgm=poller.values['prgm'],
+                             nwarn=poller.values['nwarn'],runstatus=poller.getRunStatus(),interlock=interlock.state,**values)
+    if horizon>0:
+        interlock = PredictiveInterlock(chamber,warmup=warmup,margin=margin,hysteresis=hysteresis,debounce=debounce,
+                                        horizon=horizon,window=kwargs.get('window',300),tstep=tstep)
+    else:
+        interlock = Interlock(chamber,warmup=warmup,margin=margin,hysteresis=hysteresis,debounce=debounce)
+    watchdog  = None
+    if twatchdog>0:
+        watchdog = InterlockWatchdog(interlock,[ymeteo1,ymeteo2],tstep=twatchdog,maxage=max(30.,3*tstep))
+        watchdog.start()
 
     # BATCH MODE
     if batchmode:
-        tformat    = '%d-%m-%Y %H:%M:%S'
+        pformat    = '%d-%m-%Y %H:%M:%S.%f' # printed to milliseconds
 
         # START MONITORING
-        with open(logname,'a+') as logfile:
-            logger = csv.writer(logfile)
+        with openLogger(logname,**logkwargs) as logger:
             print("Monitoring climate chamber...")
-            tval   = datetime.datetime.now()
+            tval   = now()
             tstop  = tval + datetime.timedelta(seconds=dtime) if dtime>0 else None
+            if clock: # stop at the end of the replayed log
+                tstop = min(tstop or clock.end(),clock.end())
             if not ymeteo1:
                 temp_YM1 = -1
                 dewp_YM1 = -1
             if not ymeteo2:
                 temp_YM2 = -1
                 dewp_YM2 = -1
-            print("  %20s: %10s %10s %10s %10s %10s %10s"%("timestamp","temp","setp","temp YM1","temp YM2","dewp YM1","dewp YM2"))
+            print("  %23s: %10s %10s %10s %10s %10s %10s"%("timestamp","temp","setp","temp YM1","temp YM2","dewp YM1","dewp YM2"))
             while not tstop or tstop>tval:
-                tval    = datetime.datetime.now()
-                temp    = chamber.getTemp()
-                setp    = chamber.getSetp()
+                tns, tchamber, tyocto, temp, setp, air, dry, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2 = sample()
+                tsec    = tns/1e9
+                tval    = datetime.datetime.fromtimestamp(tsec)
                 tempnom = max(0.001,abs(temp))
-                if ymeteo1:
-                    temp_YM1 = ymeteo1.getTemp()
-                    dewp_YM1 = ymeteo1.getDewp()
-                    checkInterlock(chamber,temp,dewp_YM1,warmup=warmup)
-                if ymeteo2:
-                    temp_YM2 = ymeteo2.getTemp()
-                    dewp_YM2 = ymeteo2.getDewp()
-                    checkInterlock(chamber,temp,dewp_YM2,warmup=warmup)
-                air     = chamber.getAir()
-                dry     = chamber.getDryer()
+                interlock.check(temp,*[d for m, d in [(ymeteo1,dewp_YM1),(ymeteo2,dewp_YM2)] if m],setp=setp,tnow=tsec)
                 run     = 0
                 # TODO: checkWarnings()
-                print("  %20s: %10.3f %10.3f %10.3f %10.3f %10.3f %10.3f"%(tval.strftime(tformat),temp,setp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2))
-                logger.writerow([tval.strftime(tformat),temp,setp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2,air,dry,run])
-                time.sleep(tstep)
+                print("  %23s: %10.3f %10.3f %10.3f %10.3f %10.3f %10.3f"%(tval.strftime(pformat)[:-3],temp,setp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2))
+                logger.writerow([tns,temp,setp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2,air,dry,run,tchamber,tyocto])
+                writeEvents(tns)
+                publish(tsec,temp=temp,setp=setp,temp_YM1=temp_YM1,temp_YM2=temp_YM2,
+                        dewp_YM1=dewp_YM1,dewp_YM2=dewp_YM2,air=air,dry=dry,run=run)
+                if server:
+                    server.update(time=tsec,temp=temp,setp=setp,temp_YM1=temp_YM1,temp_YM2=temp_YM2,
+                                  dewp_YM1=dewp_YM1,dewp_YM2=dewp_YM2,air=air,dry=dry,run=run,interlock=interlock.state,
+                                  nwarn=poller.values['nwarn'],status=poller.getRunStatus(),**poller.getMetrics(),
+                                  **(watchdog.getMetrics() if watchdog else { }),**getCacheStats(chamber))
+                time.sleep(max(0,clock.wait(tstep) if clock else tstep-(time.time_ns()-tns)/1e9)) # compensate latency
             print("Monitoring finished!")
 
     # GUI WINDOW
     else:
 
         # LOAD PREVIOUS DATA
-        tformat    = '%d-%m-%Y %H:%M:%S'
+        pformat    = '%d-%m-%Y %H:%M:%S.%f' # printed to milliseconds
         tvals, tempvals, setpvals = [ ], [ ], [ ]
         tempvals_YM1, tempvals_YM2, dewpvals_YM1, dewpvals_YM2 = [ ], [ ], [ ], [ ]
         runvals, airvals, dryvals = [ ], [ ], [ ]
         if os.path.isfile(logname):
             print("Loading old monitoring data from '%s'..."%(logname))
-            with open(logname,'r') as logfile:
-                logreader = csv.reader(logfile)
-                tnow   = datetime.datetime.now()
-                tback  = tnow - dtback
-                for stamp, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run in logreader:
-                    tval = datetime.datetime.strptime(stamp,tformat)
-                    if tval<tback: continue
-                    temp, setp = float(temp), float(setp)
-                    temp_YM1, temp_YM2, dewp_YM1, dewp_YM2 = float(temp_YM1), float(temp_YM2), float(dewp_YM1), float(dewp_YM2)
-                    air, dry, run = int(air), int(dry), int(run)
-                    tvals.append(tval)
-                    tempvals.append(temp)
-                    setpvals.append(setp)
-                    tempvals_YM1.append(temp_YM1)
-                    tempvals_YM2.append(temp_YM2)
-                    dewpvals_YM1.append(dewp_YM1)
-                    dewpvals_YM2.append(dewp_YM2)
-                    airvals.append(air)
-                    dryvals.append(dry)
-                    runvals.append(run)
-                    for yval in [temp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2]:
-                        if   yval<ymin: ymin = yval
-                        elif yval>ymax: ymax = yval
+            tback = now() - dtback
+            if isDatabase(logname):
+                rows = readDatabase(logname,tback)
+            elif isBinaryLog(logname):
+                rows = readBinaryLog(logname,tback)
+            else:
+                rows = readLog(logname,tback)
+            for tval, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run in rows:
+                tvals.append(tval)
+                tempvals.append(temp)
+                setpvals.append(setp)
+                tempvals_YM1.append(temp_YM1)
+                tempvals_YM2.append(temp_YM2)
+                dewpvals_YM1.append(dewp_YM1)
+                dewpvals_YM2.append(dewp_YM2)
+                airvals.append(air)
+                dryvals.append(dry)
+                runvals.append(run)
+                for yval in [temp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2]:
+                    if   yval<ymin: ymin = yval
+                    elif yval>ymax: ymax = yval
 
         # MONITOR DATA
-        with open(logname,'a+') as logfile:
-            logger = csv.writer(logfile)
+        with openLogger(logname,**logkwargs) as logger:
 
             # PLOT PARAMETERS
-            tnow = datetime.datetime.now()
+            tnow = now()
             tmin = tnow - dtwidth + dtmargin
             tmax = tnow + dtmargin
 
@@ -181,13 +293,16 @@ def monitor(chamber,ymeteo1=None,ymeteo2=None,**kwargs):
             # TEXT
             statustext = plt.text(0.98,0.98,"UNSET",horizontalalignment='right',verticalalignment='top',
                                   transform=axis2.transAxes,fontweight='bold')
-            statuscolors = { 'Manual': 'saddlebrown', 'Program': 'navy', 'Not': 'darkgreen' }
+            statuscolors = { 'Manual': 'saddlebrown', 'Program': 'navy', 'Not': 'darkgreen', 'connection': 'red' }
+            statusinfo = { }
             def updateStatus():
-                status = getRunStatus(chamber)
+                status = poller.getRunStatus() # from the latest poll, no extra commands
+                statusinfo['status'] = status
                 statustext.set_text(status)
                 for key in statuscolors:
                     if key in status:
                         statustext.set_color(statuscolors[key]); break
+            readChamber(poller,epoch())
             updateStatus()
 
             # BUTTONS
@@ -199,7 +314,8 @@ def monitor(chamber,ymeteo1=None,ymeteo2=None,**kwargs):
                 setTimeAxisMinorLocators(axis2,swidth)
                 fig.canvas.draw()
             def checkWarnings():
-                nwarn = checkActiveWarnings(chamber)
+                nwarn = poller.values['nwarn'] # scanned when the status bits flag warnings
+                statusinfo['nwarn'] = nwarn
                 if nwarn>0:
                     messagebutton.active = True
                     messageframe.set_visible(True)
@@ -230,9 +346,11 @@ def monitor(chamber,ymeteo1=None,ymeteo2=None,**kwargs):
 
             # START MONITORING
             print("Monitoring climate chamber...")
-            print("  %20s: %10s %10s %10s %10s %10s %10s"%("timestamp","temp","setp","temp YM1","temp YM2","dewp YM1","dewp YM2"))
-            tval  = datetime.datetime.now()
+            print("  %23s: %10s %10s %10s %10s %10s %10s"%("timestamp","temp","setp","temp YM1","temp YM2","dewp YM1","dewp YM2"))
+            tval  = now()
             tstop = tval + datetime.timedelta(seconds=dtime) if dtime>0 else None
+            if clock: # stop at the end of the replayed log
+                tstop = min(tstop or clock.end(),clock.end())
             if not ymeteo1:
                 temp_YM1 = -1
                 dewp_YM1 = -1
@@ -243,14 +361,12 @@ def monitor(chamber,ymeteo1=None,ymeteo2=None,**kwargs):
                 if not plt.fignum_exists(fig.number):
                     print("Monitor was closed!")
                     break
-                tval    = datetime.datetime.now()
+                tns, tchamber, tyocto, temp, setp, air, dry, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2 = sample()
+                tsec    = tns/1e9
+                tval    = datetime.datetime.fromtimestamp(tsec)
                 tvals.append(tval)
-                temp    = chamber.getTemp()
-                setp    = chamber.getSetp()
+                interlock.check(temp,*[d for m, d in [(ymeteo1,dewp_YM1),(ymeteo2,dewp_YM2)] if m],setp=setp,tnow=tsec)
                 if ymeteo1:
-                    temp_YM1 = ymeteo1.getTemp()
-                    dewp_YM1 = ymeteo1.getDewp()
-                    checkInterlock(chamber,temp,dewp_YM1,warmup=warmup)
                     dewpvals_YM1.append(dewp_YM1)
                     tempvals_YM1.append(temp_YM1)
                     dewpline_YM1.set_xdata(tvals)
@@ -258,19 +374,12 @@ def monitor(chamber,ymeteo1=None,ymeteo2=None,**kwargs):
                     templine_YM1.set_xdata(tvals)
                     templine_YM1.set_ydata(tempvals_YM1)
                 if ymeteo2:
-                    temp_YM2 = ymeteo2.getTemp()
-                    dewp_YM2 = ymeteo2.getDewp()
-                    checkInterlock(chamber,temp,dewp_YM2,warmup=warmup)
                     dewpvals_YM2.append(dewp_YM2)
                     tempvals_YM2.append(temp_YM2)
                     dewpline_YM2.set_xdata(tvals)
                     dewpline_YM2.set_ydata(dewpvals_YM2)
                     templine_YM2.set_xdata(tvals)
                     templine_YM2.set_ydata(tempvals_YM2)
-                air     = chamber.getAir()
-                dry     = chamber.getDryer()
-                air     = chamber.getAir()
-                dry     = chamber.getDryer()
                 run     = 0
                 tempvals.append(temp)
                 setpvals.append(setp)
@@ -279,8 +388,16 @@ def monitor(chamber,ymeteo1=None,ymeteo2=None,**kwargs):
                 runvals.append(run)
                 updateStatus()
                 checkWarnings()
-                print("  %20s: %10.3f %10.3f %10.3f %10.3f %10.3f %10.3f"%(tval.strftime(tformat),temp,setp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2))
-                logger.writerow([tval.strftime(tformat),temp,setp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2,air,dry,run])
+                print("  %23s: %10.3f %10.3f %10.3f %10.3f %10.3f %10.3f"%(tval.strftime(pformat)[:-3],temp,setp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2))
+                logger.writerow([tns,temp,setp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2,air,dry,run,tchamber,tyocto])
+                writeEvents(tns)
+                publish(tsec,temp=temp,setp=setp,temp_YM1=temp_YM1,temp_YM2=temp_YM2,
+                        dewp_YM1=dewp_YM1,dewp_YM2=dewp_YM2,air=air,dry=dry,run=run)
+                if server:
+                    server.update(time=tsec,temp=temp,setp=setp,temp_YM1=temp_YM1,temp_YM2=temp_YM2,
+                                  dewp_YM1=dewp_YM1,dewp_YM2=dewp_YM2,air=air,dry=dry,run=run,interlock=interlock.state,
+                                  **poller.getMetrics(),**(watchdog.getMetrics() if watchdog else { }),
+                                  **getCacheStats(chamber),**statusinfo)
                 templine.set_xdata(tvals)
                 templine.set_ydata(tempvals)
                 setpline.set_xdata(tvals)
@@ -295,14 +412,23 @@ def monitor(chamber,ymeteo1=None,ymeteo2=None,**kwargs):
                     axis1.set_xlim([tval-(tmax-tmin-dtmargin),tval+dtmargin])
                 fig.canvas.draw()
                 #fig.canvas.flush_events()
-                twait = tstep-(datetime.datetime.now()-tval).total_seconds() # compensate latency
-                if twait>0:
-                    plt.pause(twait)
+                if clock: # replay: keep the window responsive, also when running behind
+                    plt.pause(max(0.001,clock.wait(tstep)))
+                else:
+                    twait = tstep-(time.time_ns()-tns)/1e9 # compensate latency
+                    if twait>0:
+                        plt.pause(twait)
                 #time.sleep(tstep)
 
             print("Monitoring finished!")
             plt.show(block=True)
             #plt.waitforbuttonpress()
+    if watchdog:
+        watchdog.stop()
+    if server:
+        server.stop()
+    if snapshot:
+        snapshot.close()
 
 
 
@@ -310,6 +436,8 @@ def main(args):
 
     # CHECKS
     args.batchmode = not checkGUIMode(args.batchmode)
+    if args.output==None:
+        args.output = "replay.dat" if args.replay else "monitor.dat"
 
     # PARAMETERS
     kwargs = {
@@ -319,14 +447,43 @@ def main(args):
       'nsamples':  args.nsamples,  # number of readings
       'tstep':     args.stepsize , # seconds
       'twidth':    args.twidth,    # width of time axis in seconds
-      'warmup':    args.warmup     # force warm-up during interlock
+      'warmup':    args.warmup,    # force warm-up during interlock
+      'port':      args.port,      # HTTP port for dashboard, /metrics and /latest
+      'control':   args.control,   # enable dashboard buttons
+      'token':     args.token,     # token of dashboard buttons
+      'margin':    args.margin,    # interlock margin
+      'hysteresis':args.hysteresis,# interlock hysteresis
+      'debounce':  args.debounce,  # interlock debounce
+      'watchdog':  args.watchdog,  # interlock watchdog period
+      'horizon':   args.horizon,   # predictive interlock horizon
+      'window':    args.window,    # predictive interlock fit window
+      'plan':      parsePollingPlan(args.plan), # polling intervals
+      'sparse':    args.sparse,    # change-only logging
+      'deadband':  args.deadband,  # sparse logging deadband
+      'heartbeat': args.heartbeat, # sparse logging heartbeat
+      'share':     args.share,     # publish latest sample in shared memory
     }
 
+    # REPLAY
+    if args.replay:
+        if os.path.abspath(args.replay)==os.path.abspath(args.output):
+            raise IOError("Cannot replay '%s' into itself! Please choose another output with -o."%(args.replay))
+        parse   = lambda s: datetime.datetime.strptime(s,'%d-%m-%Y %H:%M') if s else None
+        source  = ReplaySource(args.replay,speedup=args.speedup,tstart=parse(args.rfrom),tstop=parse(args.rto))
+        chamber = ReplayChamber(source)
+        ymeteo1, ymeteo2 = source.getYoctoMeteos()
+        kwargs['clock'] = source.clock
+        monitor(chamber,ymeteo1,ymeteo2,**kwargs)
+        print("Replay sent %d write command(s) to the chamber."%(chamber.nwrites))
+        return
+
     # CONNECT
+    if args.stats:
+        enableSimServStats(args.stats)
     print("Connecting to climate chamber...")
-    chamber = connectClimateChamber()
-    ymeteo1 = connectYoctoMeteo(YOCTO.ymeteo1)
-    ymeteo2 = connectYoctoMeteo(YOCTO.ymeteo2)
+    chamber = connectClimateChamber(timeout=args.timeout,cache=args.cache)
+    ymeteo1 = connectYoctoMeteo(YOCTO.ymeteo1,callbacks=args.ycallbacks,freq=args.yfreq)
+    ymeteo2 = connectYoctoMeteo(YOCTO.ymeteo2,callbacks=args.ycallbacks,freq=args.yfreq)
 
     # MONITOR
     monitor(chamber,ymeteo1,ymeteo2,**kwargs)
@@ -346,16 +503,67 @@ if __name__ == '__main__':
                                              help="duration of data taking in seconds" )
     parser.add_argument('-n', '--nsamples',  dest='nsamples', type=int, default=-1, action='store',
                                              help="number of data readings; -1 for indefinite monitoring (until monitor window closes or monitoring is interrupted)" )
-    parser.add_argument('-s', '--stepsize',  dest='stepsize', type=int, default=10, action='store',
-                                             help="sampling frequency of data reading in seconds" )
+    parser.add_argument('-s', '--stepsize',  dest='stepsize', type=float, default=10, action='store',
+                                             help="time between samples in seconds, may be fractional, e.g. 0.5 (default: %(default)s)" )
     parser.add_argument('-w', '--width',     dest='twidth', type=float, default=1200, action='store',
                                              help="width of time axis in seconds" )
-    parser.add_argument('-o', '--output',    dest='output', type=str, default="monitor.dat", action='store',
-                                             help="output log file with monitoring data (csv format)" )
+    parser.add_argument('-o', '--output',    dest='output', type=str, default=None, action='store',
+                                             help="output log file with monitoring data (csv format; SQLite database if ending with .db, fixed-width binary with .bin); "
+                                                  "default: monitor.dat, or replay.dat with -R" )
     parser.add_argument('-b', '--batch',     dest='batchmode', default=False, action='store_true',
                                              help="monitor in batch mode (no GUI window)" )
+    parser.add_argument('-S', '--sparse',    dest='sparse', default=False, action='store_true',
+                                             help="change-only logging: write rows only on change or heartbeat, and discrete signals to an event stream" )
+    parser.add_argument('--deadband',        dest='deadband', type=float, default=0.1, action='store',
+                                             help="sparse logging: log temperatures only when they change by more than this (default: %(default)s)" )
+    parser.add_argument('--heartbeat',       dest='heartbeat', type=float, default=600, action='store',
+                                             help="sparse logging: log a row at least every this many seconds (default: %(default)s)" )
     parser.add_argument('-W', '--no-warm',   dest='warmup', default=True, action='store_false',
                                              help="do NOT force warm-up during interlock (temp<dewp+5)" )
+    parser.add_argument('--margin',          dest='margin', type=float, default=5., action='store',
+                                             help="interlock when temperature < dewpoint + margin (default: %(default)s)" )
+    parser.add_argument('--hysteresis',      dest='hysteresis', type=float, default=1., action='store',
+                                             help="interlock re-arms above dewpoint + margin + hysteresis (default: %(default)s)" )
+    parser.add_argument('--debounce',        dest='debounce', type=int, default=1, action='store',
+                                             help="number of consecutive samples below the margin to trip the interlock (default: %(default)s)" )
+    parser.add_argument('--timeout',         dest='timeout', type=float, default=5., action='store',
+                                             help="timeout in seconds of SimServ replies; GET commands are retried after reconnecting (default: %(default)s)" )
+    parser.add_argument('-C', '--cache',     dest='cache', default=False, action='store_true',
+                                             help="cache slow-changing values (setpoint, gradients, digital outputs, program) for up to 30 s, also in the polling batches" )
+    parser.add_argument('--poll',            dest='plan', nargs='+', default=None, metavar='CHANNEL=INTERVAL',
+                                             help="polling interval per channel in seconds (0: every step), 'change', 'status' or 'off'; "
+                                                  "channels: temp, setp, air, dry, status, prgm, name, warn; e.g. --poll air=60 dry=60 warn=120" )
+    parser.add_argument('--watchdog',        dest='watchdog', type=float, default=0, action='store',
+                                             help="also check the interlock in a separate thread every this many seconds, e.g. 0.5; "
+                                                  "without -Y, it uses the dewpoints of the last monitor sample; "
+                                                  "dewpoints older than 3 steps (at least 30 s) force a warm-up" )
+    parser.add_argument('--predict',         dest='horizon', type=float, default=0, action='store',
+                                             help="predictive interlock: trip if the forecast crosses the margin within this many seconds" )
+    parser.add_argument('--predict-window',  dest='window', type=float, default=300, action='store',
+                                             help="window in seconds of the temperature and dewpoint fits for --predict (default: %(default)s)" )
+    parser.add_argument('-p', '--port',      dest='port', type=int, default=None, action='store',
+                                             help="serve a live web dashboard, Prometheus /metrics and JSON /latest on this HTTP port" )
+    parser.add_argument('--web-control',     dest='control', default=False, action='store_true',
+                                             help="enable the Stop Run, Force warm and warning buttons of the web dashboard; "
+                                                  "only served on localhost, unless --web-token is given" )
+    parser.add_argument('--web-token',       dest='token', type=str, default=None, action='store',
+                                             help="serve the dashboard buttons on all interfaces, requiring this token: open http://<host>:<port>/?token=<token>" )
+    parser.add_argument('--no-share',        dest='share', default=True, action='store_false',
+                                             help="do NOT publish the latest sample in shared memory for status.py and quick_status.py" )
+    parser.add_argument('--stats',           dest='stats', type=str, default=None, action='store',
+                                             help="record SimServ command latencies and dump them to this JSON file on SIGUSR1 and at exit" )
+    parser.add_argument('-Y', '--yocto-callbacks', dest='ycallbacks', default=False, action='store_true',
+                                             help="let the YoctoMeteo modules push their values via callbacks instead of reading them every step" )
+    parser.add_argument('--yocto-freq',      dest='yfreq', type=str, default=None, action='store',
+                                             help="use timed reports at this frequency with callbacks, e.g. '1/s'; default: on value change" )
+    parser.add_argument('-R', '--replay',    dest='replay', type=str, default=None, action='store', metavar='LOG',
+                                             help="replay an existing log (csv, .db, .bin or .cca) instead of reading the chamber and YoctoMeteos" )
+    parser.add_argument('--speedup',         dest='speedup', type=float, default=100., action='store',
+                                             help="replay this many times faster than real time; 0 for as fast as possible (default: %(default)s)" )
+    parser.add_argument('--replay-from',     dest='rfrom', type=str, default=None, action='store', metavar="'DD-MM-YYYY HH:MM'",
+                                             help="replay rows from this time" )
+    parser.add_argument('--replay-to',       dest='rto', type=str, default=None, action='store', metavar="'DD-MM-YYYY HH:MM'",
+                                             help="replay rows until this time" )
     parser.add_argument('-v', '--verbose',   dest='verbose', default=False, action='store_true',
                                              help="set verbose" )
     args = parser.parse_args()
@@ -10,12 +10,18 @@
 # axis:     https://matplotlib.org/3.1.1/api/axes_api.html#axis-labels-title-and-legend
 import os, sys, time, datetime
 import csv
+from bisect import bisect_left
 import matplotlib
 #matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.gridspec as gridspec
 import numpy as np
+from utils import warning
+from sparselog import readLog, parseRow
+from archive import readArchiveLog, archext
+from sqlitelog import isDatabase, readDatabase
+from binlog import isBinaryLog, mapLog, getWindow, toDatetime64, binext
 
 
 def setTimeAxisMinorLocators(axis,twidth=None):
@@ -37,6 +43,59 @@ def setTimeAxisMinorLocators(axis,twidth=None):
         axis.xaxis.set_minor_locator(mdates.SecondLocator(bysecond=[i*2 for i in range(30)]))
 
 
+class LogFollower(object):
+    """Return the rows appended to a csv log since the last call, like 'tail -F':
+    the open file is read to its end after a rotation, before the new file is opened."""
+
+    def __init__(self,logname):
+        self.logname = logname
+        self.file    = None
+        self.inode   = None
+        self.rest    = b'' # incomplete last line
+        self.head    = b'' # first line, to recognize a file truncated in place
+
+    def read(self):
+        rows = self.readOpen()
+        try:
+            inode = os.stat(self.logname).st_ino
+        except OSError: # rotated, not yet recreated
+            return rows
+        if self.file==None or inode!=self.inode:
+            if self.file:
+                self.file.close()
+            self.file  = open(self.logname,'rb')
+            self.inode = os.fstat(self.file.fileno()).st_ino
+            self.rest  = b''
+            self.head  = b''
+            rows += self.readOpen()
+        elif os.fstat(self.file.fileno()).st_size<self.file.tell() or\
+             os.pread(self.file.fileno(),len(self.head),0)!=self.head: # truncated
+            self.file.seek(0)
+            self.head = b''
+            self.rest = b''
+            rows += self.readOpen()
+        return rows
+
+    def readOpen(self):
+        if self.file==None:
+            return [ ]
+        data = self.rest+self.file.read()
+        if not self.head and b'\n' in data:
+            self.head = data[:data.index(b'\n')+1]
+        iend = data.rfind(b'\n')+1
+        data, self.rest = data[:iend], data[iend:]
+        return [parseRow(line.decode('latin-1').split(',')) for line in data.splitlines()
+                if line.strip() and not line.startswith(b'#')]
+
+
+def saveFigure(fig,figname,formats=('png','pdf')):
+    """Save figure in each format via a temporary file, so readers never see half a file."""
+    for ext in formats:
+        fname = "%s.%s"%(figname,ext)
+        fig.savefig(fname+".tmp",format=ext,dpi=200)
+        os.replace(fname+".tmp",fname)
+
+
 def plotter(**kwargs):
     """Start monitoring."""
 
@@ -48,7 +107,11 @@ def plotter(**kwargs):
     twidth    = kwargs.get('twidth', 1000       )
     ymin      = kwargs.get('ymin',     10       )
     ymax      = kwargs.get('ymax',     40       )
-    dtback    = datetime.timedelta(days=2) # load only 1-day backlog for plot
+    tdense    = kwargs.get('dense',    None     ) # fill change-only logs to this step size
+    ndays     = kwargs.get('days',       2      ) # backlog to load
+    formats   = kwargs.get('formats', ['png','pdf'])
+    follow    = kwargs.get('follow',     0      ) # re-render every this many seconds when the log grows
+    dtback    = datetime.timedelta(days=ndays)
     dtwidth   = datetime.timedelta(seconds=twidth)
     dtmargin  = datetime.timedelta(seconds=0.02*twidth)
     if title==None:
@@ -60,35 +123,62 @@ def plotter(**kwargs):
     tvals, tempvals, setpvals = [ ], [ ], [ ]
     tempvals_YM1, tempvals_YM2, dewpvals_YM1, dewpvals_YM2 = [ ], [ ], [ ], [ ]
     runvals, airvals, dryvals = [ ], [ ], [ ]
-    if os.path.isfile(logname):
+    follower  = None
+    if follow and not (isBinaryLog(logname) or isDatabase(logname) or logname.endswith(archext)):
+        print("Following monitoring data in '%s'..."%(logname))
+        tback    = datetime.datetime.now() - dtback
+        follower = LogFollower(logname)
+        rows     = [r for r in follower.read() if r[0]>=tback]
+        for row in rows:
+            for values, value in zip([tvals,tempvals,setpvals,tempvals_YM1,tempvals_YM2,dewpvals_YM1,dewpvals_YM2,airvals,dryvals,runvals],row):
+                values.append(value)
+        if rows:
+            tlast = rows[-1][0]
+            ymin  = min([ymin]+[min(r[1],r[3],r[4],r[5],r[6]) for r in rows])
+            ymax  = max([ymax]+[max(r[1],r[3],r[4],r[5],r[6]) for r in rows])
+    elif os.path.isfile(logname) and isBinaryLog(logname):
+        print("Mapping monitoring data from '%s'..."%(logname))
+        tback  = datetime.datetime.now() - dtback
+        window = getWindow(mapLog(logname),time.mktime(tback.timetuple())) # views on the mapped file
+        tvals  = toDatetime64(window['time']) # copies only the window of times
+        tempvals, setpvals = window['temp'], window['setp']
+        tempvals_YM1, tempvals_YM2 = window['temp_YM1'], window['temp_YM2']
+        dewpvals_YM1, dewpvals_YM2 = window['dewp_YM1'], window['dewp_YM2']
+        airvals, dryvals, runvals  = window['air'], window['dry'], window['run']
+        if len(window):
+            tlast = datetime.datetime.fromtimestamp(float(window['time'][-1]))
+            for column in [tempvals,tempvals_YM1,tempvals_YM2,dewpvals_YM1,dewpvals_YM2]:
+                ymin = min(ymin,np.nanmin(column))
+                ymax = max(ymax,np.nanmax(column))
+    elif os.path.isfile(logname):
         print("Loading old monitoring data from '%s'..."%(logname))
-        with open(logname,'r') as logfile:
-            logreader = csv.reader(logfile)
-            tnow   = datetime.datetime.now()
-            tback  = tnow - dtback
-            for stamp, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run in logreader:
-                tval = datetime.datetime.strptime(stamp,tformat)
-                if tval<tback: continue
-                temp, setp = float(temp), float(setp)
-                temp_YM1, temp_YM2, dewp_YM1, dewp_YM2 = float(temp_YM1), float(temp_YM2), float(dewp_YM1), float(dewp_YM2)
-                air, dry, run = int(air), int(dry), int(run)
-                tvals.append(tval)
-                tempvals.append(temp)
-                setpvals.append(setp)
-                tempvals_YM1.append(temp_YM1)
-                tempvals_YM2.append(temp_YM2)
-                dewpvals_YM1.append(dewp_YM1)
-                dewpvals_YM2.append(dewp_YM2)
-                airvals.append(air)
-                dryvals.append(dry)
-                runvals.append(run)
-                if not tlast or tlast<tval:
-                    tlast = tval
-                for yval in [temp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2]:
-                    if   yval<ymin: ymin = yval
-                    elif yval>ymax: ymax = yval
+        tback = datetime.datetime.now() - dtback
+        if logname.endswith(archext): # columnar archive: only decode blocks in range
+            rows = readArchiveLog(logname,tback)
+        elif isDatabase(logname): # indexed range query
+            rows = readDatabase(logname,tback)
+        else:
+            rows = readLog(logname,tback,tstep=tdense)
+        for tval, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run in rows:
+            tvals.append(tval)
+            tempvals.append(temp)
+            setpvals.append(setp)
+            tempvals_YM1.append(temp_YM1)
+            tempvals_YM2.append(temp_YM2)
+            dewpvals_YM1.append(dewp_YM1)
+            dewpvals_YM2.append(dewp_YM2)
+            airvals.append(air)
+            dryvals.append(dry)
+            runvals.append(run)
+            if not tlast or tlast<tval:
+                tlast = tval
+            for yval in [temp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2]:
+                if   yval<ymin: ymin = yval
+                elif yval>ymax: ymax = yval
 
     # PLOT PARAMETERS
+    if tlast==None:
+        tlast = datetime.datetime.now()
     tmin = tlast - dtwidth + dtmargin
     tmax = tlast + dtmargin
 
@@ -143,15 +233,48 @@ def plotter(**kwargs):
 
     #fig.canvas.draw()
     #plt.show(block=True)
-    fig.savefig(figname+".png",dpi=200)
-    fig.savefig(figname+".pdf",dpi=200)
+    saveFigure(fig,figname,formats)
+
+    # FOLLOW: parse only appended rows, re-render only when there are new rows
+    lines = [None,templine,setpline,templine_YM1,templine_YM2,dewpline_YM1,dewpline_YM2,airline,dryline,None]
+    if follow and not follower:
+        warning("Follow mode needs a csv log file!")
+    while follower:
+        try:
+            time.sleep(follow)
+            rows = follower.read()
+        except KeyboardInterrupt:
+            print("Stopped following '%s'"%(logname))
+            break
+        if not rows:
+            continue
+        columns = [tvals,tempvals,setpvals,tempvals_YM1,tempvals_YM2,dewpvals_YM1,dewpvals_YM2,airvals,dryvals,runvals]
+        for row in rows:
+            for values, value in zip(columns,row):
+                values.append(value)
+            for yval in [row[1],row[3],row[4],row[5],row[6]]:
+                if   yval<ymin: ymin = yval
+                elif yval>ymax: ymax = yval
+        tlast = tvals[-1]
+        ntrim = bisect_left(tvals,tlast-dtback) # keep the backlog bounded; times are sorted
+        if ntrim>len(tvals)//4:
+            for values in columns:
+                del values[:ntrim]
+        for line, values in zip(lines,columns):
+            if line:
+                line.set_data(tvals,values)
+        axis1.set_xlim([tlast-dtwidth+dtmargin,tlast+dtmargin])
+        axis2.set_ylim([ymin,ymax])
+        saveFigure(fig,figname,formats)
+        print("Updated '%s' with %d new rows (last at %s)"%(figname,len(rows),tlast.strftime(tformat)))
 
 
 def main(args):
 
     # MONITOR
     plotter(log=args.input,name=args.output,
-            twidth=args.twidth,title=args.title,batch=args.batchmode)
+            twidth=args.twidth,title=args.title,batch=args.batchmode,dense=args.dense,days=args.days,
+            formats=args.formats,follow=args.follow)
 
 
 if __name__ == '__main__':
@@ -162,11 +285,19 @@ if __name__ == '__main__':
     parser.add_argument('-w', '--width',     dest='twidth', type=float, default=2400, action='store',
                                              help="width of time axis in seconds" )
     parser.add_argument('-i', '--input',     dest='input', type=str, default="monitor.dat", action='store',
-                                             help="input log file with monitoring data (csv format)" )
+                                             help="input log file with monitoring data (csv format, %s archive, SQLite .db or binary %s)"%(archext,binext) )
     parser.add_argument('-o', '--output',    dest='output', type=str, default="plot", action='store',
                                              help="name of output plot (png and pdf)" )
     parser.add_argument('-t', '--title',     dest='title', type=str, default=None, action='store',
                                              help="title of the plot" )
+    parser.add_argument('-d', '--dense',     dest='dense', type=float, default=None, action='store',
+                                             help="fill change-only logs (monitor.py --sparse) to a dense series with this step in seconds" )
+    parser.add_argument('-D', '--days',      dest='days', type=float, default=2, action='store',
+                                             help="number of days of data to load (default: %(default)s)" )
+    parser.add_argument('-f', '--follow',    dest='follow', type=float, default=0, action='store', metavar='SECONDS',
+                                             help="keep running, and re-render every this many seconds if new rows were appended to the log" )
+    parser.add_argument('-F', '--formats',   dest='formats', nargs='+', default=['png','pdf'], action='store',
+                                             help="formats of the output plot (default: %(default)s)" )
     parser.add_argument('-b', '--batch',     dest='batchmode', default=False, action='store_true',
                                              help="monitor in batch mode (no GUI window)" )
     parser.add_argument('-m', '--monitor',   dest='monitor', default=False, action='store_true',
@@ -0,0 +1,153 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Tiered polling plan: every chamber channel has its own interval and all due
+# reads of one tick are sent to SimServ in a single pipelined batch.
+# Intervals:
+#   0        every tick
+#   N        every N seconds
+#   'change' when the channel it depends on changes (program name)
+#   'status' when the chamber status bits flag warnings or alarms (warning scan),
+#            and every warnscan seconds while they stay set
+#   'off'    never
+# e.g.
+#  python monitor.py --poll air=60 dry=60 setp=30 warn=120
+import os, sys, time
+sys.path.append(os.path.dirname(__file__))
+from utils import warning
+from chamber_commands import pipelineSimServCmds, sendSimServCmd, checkActiveWarnings
+
+nan = float('nan')
+
+# CHANNELS: name -> (command, args, type, default interval)
+channel_dict = {
+  'temp':   ('GET CTRL_VAR VAL',      [1], float, 0  ),
+  'setp':   ('GET CTRL_VAR SETPOINT', [1], float, 0  ),
+  'air':    ('GET DIGI_OUT VAL',      [7], int,   30 ),
+  'dry':    ('GET DIGI_OUT VAL',      [8], int,   30 ),
+  'status': ('GET CHAMBER STATUS',    [ ], int,   0  ), # +4: warnings, +8: alarms
+  'prgm':   ('GET PRGM NUM',          [ ], int,   10 ),
+}
+# DEPENDENT READS: name -> default interval
+depend_dict = {
+  'name':   'change', # program name, when the program number changes
+  'warn':   'status', # full warning scan, when the status bits flag warnings or alarms
+}
+warnbits = 4|8
+warnscan = 60 # seconds between warning scans while the status bits stay set
+
+
+def parsePollingPlan(specs):
+    """Parse list of 'channel=interval' strings into a dict of intervals."""
+    plan = { }
+    for spec in specs or [ ]:
+        if '=' not in spec:
+            raise ValueError("Polling plan entry '%s' is not of the form channel=interval!"%(spec))
+        name, interval = spec.split('=',1)
+        if name not in channel_dict and name not in depend_dict:
+            raise ValueError("Unknown channel '%s'! Choose from %s"%(name,', '.join(list(channel_dict)+list(depend_dict))))
+        if interval not in ['change','status','off']:
+            interval = float(interval)
+        plan[name] = interval
+    return plan
+
+
+class Poller(object):
+    """Read the chamber channels that are due according to the polling plan."""
+
+    def __init__(self,chamber,plan=None,tstep=0):
+        self.chamber   = chamber
+        self.intervals = { n: c[3] for n, c in channel_dict.items() }
+        self.intervals.update(depend_dict)
+        self.intervals.update(plan or { })
+        self.tol       = 0.5*tstep # tolerance on intervals for jitter of the tick
+        self.tlast     = { }       # channel -> time of the last read
+        self.values    = { n: (nan if c[2]==float else -1) for n, c in channel_dict.items() }
+        self.values['name'] = ""
+        self.values['nwarn'] = 0
+        self.nticks    = 0
+        self.nreads    = 0 # number of commands sent
+        self.online    = True
+
+    def isDue(self,name,tnow):
+        interval = self.intervals[name]
+        if interval=='off':
+            return False
+        if name not in self.tlast or interval==0:
+            return True
+        return tnow-self.tlast[name]>=interval-self.tol
+
+    def poll(self,tnow=None):
+        """Read all due channels in one batch, then the dependent channels; return all latest values."""
+        if tnow==None:
+            tnow = time.time()
+        due  = [n for n in channel_dict if self.isDue(n,tnow)]
+        cmds = [ ]
+        for name in due:
+            cmd = (channel_dict[name][0],channel_dict[name][1])
+            if cmd not in cmds:
+                cmds.append(cmd)
+        try:
+            replies = pipelineSimServCmds(self.chamber,cmds) if cmds else [ ]
+            self.online = True
+        except IOError:
+            self.online = False
+            raise
+        self.nticks += 1
+        self.nreads += len(cmds)
+        oldvalues = dict(self.values)
+        for name in due:
+            cmdstr, args, type, interval = channel_dict[name]
+            code, output = replies[cmds.index((cmdstr,args))]
+            if code!=1 or not output:
+                warning("Could not read %s ('%s', code %s)"%(name,cmdstr,code))
+                continue
+            try:
+                self.values[name] = type(output[0])
+            except ValueError:
+                warning("Could not read %s ('%s', unexpected reply %r)"%(name,cmdstr,output[0]))
+                continue
+            self.tlast[name]  = tnow
+        self.pollDependent(oldvalues,tnow)
+        return self.values
+
+    def pollDependent(self,oldvalues,tnow):
+        """Read the program name and scan warnings only when needed."""
+        prgm   = self.values['prgm']
+        status = self.values['status']
+        if self.intervals['name']!='off':
+            changed = prgm!=oldvalues['prgm'] or 'name' not in self.tlast
+            if prgm<=0:
+                self.values['name'] = ""
+            elif changed or (self.intervals['name']!='change' and self.isDue('name',tnow)):
+                self.values['name'] = str(sendSimServCmd(self.chamber,'GET PRGM NAME',[prgm])[0])
+                self.tlast['name'] = tnow
+                self.nreads += 1
+        if self.intervals['warn']=='status':
+            if status>=0 and not status&warnbits:
+                self.values['nwarn'] = 0 # nothing to scan
+            elif status!=oldvalues['status'] or 'warn' not in self.tlast or\
+                 tnow-self.tlast['warn']>=warnscan-self.tol: # warnings may come and go while the bits stay set
+                self.scanWarnings(tnow)
+        elif self.isDue('warn',tnow):
+            self.scanWarnings(tnow)
+
+    def scanWarnings(self,tnow):
+        self.values['nwarn'] = checkActiveWarnings(self.chamber)
+        self.tlast['warn']   = tnow
+        self.nreads += 1
+
+    def getRunStatus(self):
+        """Describe the run status from the latest values, without sending commands."""
+        if not self.online:
+            return "No connection"
+        if self.values['prgm']>0:
+            return "Program '%s'"%(self.values['name'])
+        if self.values['status']>0 and self.values['status']&2: # test running
+            return "Manual run"
+        return "Not running"
+
+    def getMetrics(self):
+        return {
+          'poll_ticks': self.nticks,
+          'poll_reads': self.nreads,
+        }
@@ -4,6 +4,7 @@ import os, sys
 sys.path.append(os.path.dirname(__file__))
 from batch_chamber_commands import connectClimateChamber, defaultip,\
                             getRunStatus, checkActiveWarnings, getActiveWarnings
+from snapshot import readSnapshot
 
 def addRow(col1,col2="",just=38):
     return '\n    ' + col1.ljust(just) + '  ' + col2.ljust(just)
@@ -13,6 +14,18 @@ def getCurrentStatus(**kwargs):
   
     # SETTINGS
     ip       = kwargs.get('ip',  defaultip    )
+    direct   = kwargs.get('direct', False     ) # ask the chamber, even if the monitor is running
+
+    # LATEST SAMPLE of the running monitor, without chamber traffic
+    values = None if direct else readSnapshot(ip)
+    if values:
+        string   = "Climate chamber's currect status: %s (monitor, %.0f s ago)"%(values['runstatus'],values['age'])
+        string  += addRow("Setpoint:    %8.3f"%(values['setp']),
+                        "Compr. air:  %4s"%('ON' if values['air']==1 else 'OFF'))
+        string  += addRow("Temperature: %8.3f"%(values['temp']),
+                        "Dryer:       %4s"%('ON' if values['dry']==1 else 'OFF'))
+        print(string)
+        return
 
     # CONNECT
     chamber = connectClimateChamber(ip=ip)
@@ -33,7 +46,7 @@ def getCurrentStatus(**kwargs):
     chamber.disconnect()
   
 def main(args):
-    getCurrentStatus(out=args.output)
+    getCurrentStatus(out=args.output,direct=args.direct)
   
 
 if __name__ == '__main__':
@@ -42,6 +55,8 @@ if __name__ == '__main__':
     parser = ArgumentParser(prog="monitor",description=description,epilog="Good luck!")
     parser.add_argument('-o', '--output',    dest='output', type=str, default="status.txt", action='store',
                                             help="output log file with monitoring data (csv format)" )
+    parser.add_argument('-d', '--direct',    dest='direct', default=False, action='store_true',
+                                            help="ask the climate chamber, even if the monitor publishes its latest sample" )
     args = parser.parse_args()
     main(args)
   
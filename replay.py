@@ -0,0 +1,215 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Replay of an existing monitoring log through the monitor, instead of the chamber:
+#   ReplayClock    virtual time, running 'speedup' times faster than real time
+#   ReplayChamber  answers SimServ commands from the log row at the virtual time
+#   ReplayYocto    YoctoMeteo module reading its temperature and dewpoint from the log
+# Write commands (interlock warm-up, stop) are acknowledged and read back until the next row,
+# but do not change the replayed data. Use it to look at an incident again,
+# or to profile the plot, interlock and logging with hours of data in seconds.
+# e.g.
+#  python monitor.py -R monitor.dat --speedup 1000 -o replay.dat
+#  python monitor.py -R monitor.db --replay-from '24-03-2024 13:00' --speedup 0 -b -o /dev/null
+import os, sys, time, datetime
+from bisect import bisect_right
+sys.path.append(os.path.dirname(__file__))
+from chamber_commands import SR, CR, LF, cmd_dict
+from sparselog import readLog, readEvents, toEpoch
+from sqlitelog import isDatabase, readDatabase, readEvents as readDatabaseEvents
+from binlog import isBinaryLog, readBinaryLog
+from archive import readArchiveLog, archext
+
+# REPLIES: SimServ command ID -> (log column or event, argument)
+get_dict = cmd_dict['GET']
+get_ids  = set(i for d in get_dict.values() for i in d.values())
+col_dict = {
+  get_dict['CTRL_VAR']['VAL']:      { '1': 1 }, # temp
+  get_dict['CTRL_VAR']['SETPOINT']: { '1': 2 }, # setp
+  get_dict['CTRL_VAL']['SETPOINT']: { '1': 2 },
+  get_dict['DIGI_OUT']['VAL']:      { '7': 7, '8': 8 }, # air, dry
+}
+
+
+def readRows(logname,tstart=None,tstop=None):
+    """Read rows [time, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run]
+    and (time, name, value) events from any log format."""
+    if not os.path.isfile(logname):
+        raise IOError("Log file '%s' does not exist!"%(logname))
+    if isDatabase(logname):
+        rows   = readDatabase(logname,tstart,tstop)
+        events = readDatabaseEvents(logname,tstart)
+    elif isBinaryLog(logname):
+        rows   = readBinaryLog(logname,tstart)
+        events = [ ]
+    elif logname.endswith(archext):
+        rows   = readArchiveLog(logname,tstart)
+        events = [ ]
+    else:
+        rows   = readLog(logname,tstart)
+        events = readEvents(logname,tstart)
+    if tstop:
+        rows   = [r for r in rows if r[0]<=tstop]
+    return rows, [e for e in events if e[1] in ('prgm','nwarn')]
+
+
+class ReplayClock(object):
+    """Virtual time of the replay, from the first to the last row of the log.
+    With speedup<=0, the replay runs as fast as possible."""
+
+    def __init__(self,tstart,tstop,speedup=100.):
+        self.tstart  = tstart
+        self.tstop   = tstop
+        self.tnow    = tstart
+        self.speedup = speedup
+        self.treal   = time.time() # real time at the start of the replay
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.tnow)
+
+    def time(self):
+        return self.tnow
+
+    def wait(self,dt):
+        """Advance the virtual time by dt seconds; return the real time to wait,
+        so that the render and logging time is compensated."""
+        self.tnow += dt
+        if self.speedup<=0:
+            return 0
+        return (self.tnow-self.tstart)/self.speedup-(time.time()-self.treal)
+
+    def end(self):
+        """Return the time of the last row."""
+        return datetime.datetime.fromtimestamp(self.tstop)
+
+
+class ReplaySource(object):
+    """Rows of a log file, looked up at the virtual time of the replay clock."""
+
+    def __init__(self,logname,speedup=100.,tstart=None,tstop=None):
+        self.logname = logname
+        self.rows, events = readRows(logname,tstart,tstop)
+        if not self.rows:
+            raise IOError("No rows to replay in '%s'!"%(logname))
+        self.times   = [toEpoch(r[0]) for r in self.rows]
+        self.events  = { n: ([ ],[ ]) for n in ['prgm','nwarn'] } # name -> (times, values)
+        for tval, name, value in events:
+            self.events[name][0].append(toEpoch(tval))
+            self.events[name][1].append(value)
+        self.clock   = ReplayClock(self.times[0],self.times[-1],speedup)
+        print("Replaying %d rows of '%s' from %s to %s..."%(len(self.rows),logname,
+              self.rows[0][0].strftime('%d-%m-%Y %H:%M:%S'),self.rows[-1][0].strftime('%d-%m-%Y %H:%M:%S')))
+
+    def getRow(self):
+        """Return the last row at or before the virtual time."""
+        index = bisect_right(self.times,self.clock.tnow)-1
+        return self.rows[max(0,index)]
+
+    def getEvent(self,name):
+        """Return the value of the event stream at the virtual time; 0 without events."""
+        times, values = self.events[name]
+        index = bisect_right(times,self.clock.tnow)-1
+        return values[index] if index>=0 else 0
+
+    def getYoctoMeteos(self):
+        """Return replayed YoctoMeteo modules, or None for modules that are not in the log."""
+        modules = [ ]
+        for name, tcol, dcol in [('YM1',3,5),('YM2',4,6)]:
+            connected = any(r[tcol]!=-1 or r[dcol]!=-1 for r in self.rows)
+            modules.append(ReplayYocto(self,name,tcol,dcol) if connected else None)
+        return modules
+
+
+class ReplayChamber(object):
+    """Socket-like SimServ client answering from the replayed log; see chamber_commands.querySimServ."""
+
+    def __init__(self,source):
+        self.source  = source
+        self.ip      = 'replay'
+        self.buffer  = b''
+        self.written = { } # (command ID, args) -> value, until the next row
+        self.row     = None
+        self.nwrites = 0
+
+    def reply(self,cmd):
+        parts  = cmd.lstrip(LF).split(SR)
+        cmdid  = int(parts[0])
+        args   = [a.decode('latin-1') for a in parts[2:]]
+        row    = self.source.getRow()
+        if row is not self.row: # forget writes when the replay moves on
+            self.written.clear()
+            self.row = row
+        if (cmdid,tuple(args)) in self.written:
+            return b'1'+SR+self.written[(cmdid,tuple(args))].encode('latin-1')
+        nwarn  = self.source.getEvent('nwarn')
+        prgm   = self.source.getEvent('prgm')
+        if cmdid in col_dict and args and args[0] in col_dict[cmdid]:
+            value = row[col_dict[cmdid][args[0]]]
+        elif cmdid==get_dict['CHAMBER']['STATUS']:
+            value = (3 if row[9]>0 or prgm>0 else 1) + (4 if nwarn>0 else 0)
+        elif cmdid==get_dict['PRGM']['NUM']:
+            value = prgm
+        elif cmdid==get_dict['PRGM']['STATUS']:
+            value = int(prgm>0)
+        elif cmdid==get_dict['PRGM']['NAME']:
+            value = "Replayed program %s"%(args[0] if args else prgm)
+        elif cmdid==get_dict['GRAD_UP']['VAL'] or cmdid==get_dict['GRAD_DWN']['VAL']:
+            value = 1.
+        elif cmdid==get_dict['MSG']['NUM']:
+            value = nwarn
+        elif cmdid==get_dict['MSG']['STATUS']:
+            value = 1
+        elif cmdid==get_dict['MSG']['TYPE']:
+            value = 2
+        elif cmdid==get_dict['MSG']['TEXT']:
+            value = "Replayed warning %s"%(args[0] if args else '')
+        elif cmdid in get_ids:
+            return b'-8' # data could not be read
+        else: # write command: acknowledge, and read back the same value until the next row
+            self.nwrites += 1
+            if len(args)>=2:
+                self.written[(getReadbackId(cmdid),tuple(args[:-1]))] = args[-1]
+            return b'1'
+        return b'1'+SR+str(value).encode('latin-1')
+
+    def send(self,data):
+        replies = [self.reply(c) for c in data.split(CR) if c.strip(LF)]
+        self.buffer += b''.join(r+CR+LF for r in replies)
+
+    def recv(self,size):
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def disconnect(self):
+        self.buffer = b''
+
+    def getTemp(self):
+        return float(self.source.getRow()[1])
+
+
+def getReadbackId(cmdid):
+    """Return the ID of the GET command reading back a SET command."""
+    set_dict = cmd_dict['SET']
+    for group, ids in set_dict.items():
+        for name, setid in ids.items():
+            if setid==cmdid and name in get_dict.get(group,{ }):
+                return get_dict[group][name]
+    return cmdid
+
+
+class ReplayYocto(object):
+    """YoctoMeteo module replayed from the temperature and dewpoint columns of the log."""
+    online = True
+
+    def __init__(self,source,name,tcol,dcol):
+        self.source = source
+        self.name   = name
+        self.tcol   = tcol
+        self.dcol   = dcol
+
+    def getTempDewp(self):
+        row = self.source.getRow()
+        return row[self.tcol], row[self.dcol]
+
+    def getTemp(self): return self.getTempDewp()[0]
+    def getDewp(self): return self.getTempDewp()[1]
+    def get_serialNumber(self): return "replay-%s"%(self.name)
@@ -10,7 +10,7 @@ import matplotlib.gridspec as gridspec
 import numpy as np
 from utils import warning, checkGUIMode
 from monitor import monitor
-from chamber_commands import connectClimateChamber
+from chamber_commands import connectClimateChamber, writeTransaction
 import yocto_commands as YOCTO
 from yocto_commands import connectYoctoMeteo, disconnectYoctoMeteo
 from argparse import ArgumentParser
@@ -24,7 +24,7 @@ parser.add_argument('-t', '--time',      dest='dtime', type=int, default=-1, act
                                          help="duration of data taking in seconds" )
 parser.add_argument('-n', '--nsamples',  dest='nsamples', type=int, default=-1, action='store',
                                          help="number of data readings; -1 for indefinite monitoring (until monitor window closes or monitoring is interrupted)" )
-parser.add_argument('-s', '--stepsize',  dest='stepsize', type=int, default=8, action='store',
+parser.add_argument('-s', '--stepsize',  dest='stepsize', type=float, default=8, action='store',
                                          help="sampling frequency of data reading in seconds" )
 parser.add_argument('-w', '--width',     dest='twidth', type=float, default=1000, action='store',
                                          help="width of time axis in seconds" )
@@ -45,13 +45,18 @@ def startManualRun(chamber,target=20.0,gradient=3,air=True,dryer=True):
     """Start manual run."""
     assert isinstance(target,float) or isinstance(target,int), "Target temperature (%s) is not a number!"%(target)
     print("Setting up manual run with target temperature = %.1f and gradient %.1f K/min..."%(target,gradient))
-    chamber.sendSimServCmd('SET CTRL_VAR SETPOINT',[1,target])
-    chamber.sendSimServCmd('SET GRAD_UP VAL', [1,gradient])
-    chamber.sendSimServCmd('SET GRAD_DWN VAL',[1,gradient])
-    chamber.sendSimServCmd('SET DIGI_OUT VAL', [7,int(air)]) # AIR1  ON
-    chamber.sendSimServCmd('SET DIGI_OUT VAL',[8,int(dryer)])  # DRYER ON
     print("Starting manual run...")
-    chamber.sendSimServCmd('START MANUAL',[1,1])
+    diffs = writeTransaction(chamber,[
+      ('SET CTRL_VAR SETPOINT', [1,target]),
+      ('SET GRAD_UP VAL',       [1,gradient]),
+      ('SET GRAD_DWN VAL',      [1,gradient]),
+      ('SET DIGI_OUT VAL',      [7,int(air)]),   # AIR1  ON
+      ('SET DIGI_OUT VAL',      [8,int(dryer)]), # DRYER ON
+      ('START MANUAL',          [1,1]),
+    ])
+    if diffs:
+        warning("Manual run not set up as requested!")
+    return not diffs
 
 
 def stopManualRun(chamber):
@@ -10,7 +10,7 @@ import matplotlib.gridspec as gridspec
 import numpy as np
 from utils import warning, checkGUIMode
 from monitor import monitor
-from chamber_commands import connectClimateChamber
+from chamber_commands import connectClimateChamber, isPrgmRunning
 import yocto_commands as YOCTO
 from yocto_commands import connectYoctoMeteo, disconnectYoctoMeteo
 from argparse import ArgumentParser
@@ -22,7 +22,7 @@ parser.add_argument('-r', '--nruns',     dest='nruns', type=int, default=1, acti
                                          help="number of program runtroughs" )
 parser.add_argument('-n', '--nsamples',  dest='nsamples', type=int, default=-1, action='store',
                                          help="number of data readings; -1 for indefinite monitoring (until monitor window closes or monitoring is interrupted)" )
-parser.add_argument('-s', '--stepsize',  dest='stepsize', type=int, default=10, action='store',
+parser.add_argument('-s', '--stepsize',  dest='stepsize', type=float, default=10, action='store',
                                          help="sampling frequency of data reading in seconds" )
 parser.add_argument('-w', '--width',     dest='twidth', type=float, default=1000, action='store',
                                          help="width of time axis in seconds" )
@@ -48,7 +48,9 @@ def startProgram(chamber,prgmid,nruns=1):
     checkProgram(chamber,prgmid)
     print("Starting program %s..."%(prgmid))
     chamber.sendSimServCmd('START PRGM',[prgmid,nruns])
-    time.sleep(2)
+    if not chamber.waitFor(isPrgmRunning,timeout=30):
+        warning("Program %s did not start!"%(prgmid))
+        return
     prgmname = str(chamber.sendSimServCmd('GET PRGM NAME')[0])
     print("Started pogram '%s'"%(prgmname))
 
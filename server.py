@@ -0,0 +1,245 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Serve the latest monitoring values over HTTP:
+#   /metrics  Prometheus text format
+#   /latest   JSON snapshot
+#   /         live dashboard (dashboard.html), rendered in the browser
+#   /events   new samples as Server-Sent Events, after a backlog of recent samples
+#   /warnings, POST /stop, POST /warmup: chamber actions, only if enabled; they require
+#            the token of the server (X-Monitor-Token header), if any, and POSTs must be JSON
+#            from the dashboard's own origin, so other web pages cannot send them (CSRF)
+# prometheus: https://prometheus.io/docs/instrumenting/exposition_formats/
+# http:       https://docs.python.org/3/library/http.server.html
+# SSE:        https://html.spec.whatwg.org/multipage/server-sent-events.html
+import os, sys, time
+import json
+import hmac
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+sys.path.append(os.path.dirname(__file__))
+from utils import warning
+
+dashboard = os.path.join(os.path.dirname(os.path.abspath(__file__)),"dashboard.html")
+
+# METRICS: snapshot key -> (metric name, help)
+metric_dict = {
+  'temp':     ('chamber_temperature_celsius',   "Climate chamber temperature."),
+  'setp':     ('chamber_setpoint_celsius',      "Climate chamber target temperature."),
+  'air':      ('chamber_compressed_air',        "Compressed air (1: on, 0: off)."),
+  'dry':      ('chamber_dryer',                 "Dryer (1: on, 0: off)."),
+  'run':      ('chamber_run',                   "Run status (1: running, 0: not running)."),
+  'nwarn':    ('chamber_active_warnings',       "Number of active alarms and warnings."),
+  'temp_YM1': ('yocto_temperature_celsius{module="YM1"}', "YoctoMeteo temperature."),
+  'temp_YM2': ('yocto_temperature_celsius{module="YM2"}', "YoctoMeteo temperature."),
+  'dewp_YM1': ('yocto_dewpoint_celsius{module="YM1"}',    "YoctoMeteo dewpoint."),
+  'dewp_YM2': ('yocto_dewpoint_celsius{module="YM2"}',    "YoctoMeteo dewpoint."),
+  'interlock_trips':        ('interlock_trips',                 "Number of interlock trips."),
+  'interlock_reaction':     ('interlock_reaction_seconds',      "Time from the last good check to the warm-up of the last trip."),
+  'interlock_reaction_max': ('interlock_reaction_max_seconds',  "Longest time from the last good check to the warm-up."),
+  'watchdog_checks':        ('watchdog_checks',                 "Number of interlock watchdog checks."),
+  'watchdog_errors':        ('watchdog_errors',                 "Number of failed interlock watchdog checks."),
+  'watchdog_check_time':    ('watchdog_check_seconds',          "Duration of the last interlock watchdog check."),
+  'watchdog_check_max':     ('watchdog_check_max_seconds',      "Longest interlock watchdog check."),
+  'watchdog_age':           ('watchdog_age_seconds',            "Time since the last interlock watchdog check."),
+  'cache_hits':             ('chamber_cache_hits',              "Chamber values served from the client cache."),
+  'cache_misses':           ('chamber_cache_misses',            "Cacheable chamber values read from the chamber."),
+  'cache_hit_rate':         ('chamber_cache_hit_rate',          "Fraction of cacheable reads served from the cache."),
+  'poll_ticks':             ('poll_ticks',                      "Number of polling ticks."),
+  'poll_reads':             ('poll_reads',                      "Number of chamber reads by the polling plan."),
+}
+
+
+def toJSON(values):
+    """Dump to JSON, with NaN as null for the browser."""
+    return json.dumps({ k: (None if isinstance(v,float) and v!=v else v) for k, v in values.items() })
+
+
+class MonitorRequestHandler(BaseHTTPRequestHandler):
+    """Answer requests from the server's in-memory snapshot;
+    only the enabled actions talk to the chamber."""
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path=='/metrics':
+            self.reply(self.server.getMetrics(),'text/plain; version=0.0.4')
+        elif path=='/latest':
+            self.reply(toJSON(self.server.getLatest()),'application/json')
+        elif path in ['','/index.html']:
+            self.reply(self.server.page,'text/html; charset=utf-8')
+        elif path=='/events':
+            self.stream()
+        elif path=='/warnings':
+            self.act('warnings')
+        else:
+            self.send_error(404,"Use /, /events, /metrics or /latest")
+
+    def do_POST(self):
+        path   = self.path.split('?')[0].rstrip('/')
+        length = int(self.headers.get('Content-Length',0) or 0)
+        data   = self.rfile.read(length) if length>0 else b''
+        ctype  = self.headers.get('Content-Type','').split(';')[0].strip().lower()
+        origin = self.headers.get('Origin',None)
+        if ctype!='application/json': # no simple cross-site form POSTs
+            self.reply(json.dumps({'ok': False, 'message': "Content-Type must be application/json"}),'application/json',code=415)
+            return
+        if origin!=None and origin.split('://',1)[-1]!=self.headers.get('Host',''):
+            self.reply(json.dumps({'ok': False, 'message': "Foreign origin %s"%(origin)}),'application/json',code=403)
+            return
+        try:
+            body = json.loads(data or b'{}')
+        except ValueError:
+            body = None
+        if not isinstance(body,dict):
+            self.reply(json.dumps({'ok': False, 'message': "Malformed JSON"}),'application/json',code=400)
+            return
+        if path in ['/stop','/warmup']:
+            if body.get('confirm')!=True: # the page asks the user first
+                self.reply(json.dumps({'ok': False, 'message': "Not confirmed"}),'application/json',code=400)
+            else:
+                self.act(path[1:])
+        else:
+            self.send_error(404,"Use POST /stop or /warmup")
+
+    def act(self,action):
+        """Run a chamber action registered by the monitor."""
+        func  = self.server.actions.get(action,None)
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get('X-Monitor-Token',''),token):
+            self.reply(json.dumps({'ok': False, 'message': "Invalid token"}),'application/json',code=403)
+            return
+        if func==None:
+            self.reply(json.dumps({'ok': False, 'message': "Action '%s' not enabled"%(action)}),'application/json',code=403)
+            return
+        try:
+            result = func()
+        except Exception as err:
+            warning("Web action '%s' failed: %s"%(action,err))
+            self.reply(json.dumps({'ok': False, 'message': str(err)}),'application/json',code=500)
+            return
+        print("Web dashboard: %s from %s"%(action,self.client_address[0]))
+        self.reply(json.dumps({'ok': True, 'result': result}),'application/json')
+
+    def stream(self):
+        """Send backlog and new samples as Server-Sent Events until the client goes away.
+        Each sample is serialized once in update(), so extra viewers only cost a write."""
+        server = self.server
+        try:
+            since = int(self.headers.get('Last-Event-ID',-1)) # resume after reconnect
+        except ValueError:
+            since = -1
+        self.send_response(200)
+        self.send_header('Content-Type','text/event-stream')
+        self.send_header('Cache-Control','no-cache')
+        self.end_headers()
+        if since>server.seq: # ID of an earlier monitor run
+            since = -1
+        try:
+            while server.running:
+                with server.newsample:
+                    if server.seq<=since:
+                        server.newsample.wait(server.tkeepalive)
+                    events = [e for e in server.history if e[0]>since]
+                if events:
+                    self.wfile.write(b''.join(e[1] for e in events))
+                    since = events[-1][0]
+                else:
+                    self.wfile.write(b': keep-alive\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError,ConnectionResetError):
+            pass
+
+    def reply(self,body,ctype,code=200):
+        body = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type',ctype)
+        self.send_header('Content-Length',str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self,*args):
+        pass # keep the monitor output clean
+
+
+class MonitorServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the latest monitoring snapshot."""
+    daemon_threads = True
+
+    def __init__(self,port=8000,host='',nhistory=2000,token=None):
+        ThreadingHTTPServer.__init__(self,(host,port),MonitorRequestHandler)
+        self.latest     = { }   # replaced as a whole, so readers never see half an update
+        self.nsamples   = 0
+        self.tstart     = time.time()
+        self.thread     = None
+        self.running    = True
+        self.seq        = -1
+        self.history    = deque(maxlen=nhistory) # (seq, encoded event) for new viewers
+        self.newsample  = threading.Condition()
+        self.tkeepalive = 15.
+        self.actions    = { } # name -> function, for dashboard buttons
+        self.token      = token # required for the actions, if set
+        self.page       = open(dashboard,encoding='utf-8').read() if os.path.isfile(dashboard) else "<p>No dashboard.html found</p>"
+
+    def update(self,**values):
+        """Publish a new sample; called from the monitor loop."""
+        values.setdefault('time',time.time())
+        self.nsamples += 1
+        self.latest = values
+        with self.newsample:
+            self.seq += 1
+            self.history.append((self.seq,("id: %d\ndata: %s\n\n"%(self.seq,toJSON(values))).encode('utf-8')))
+            self.newsample.notify_all()
+
+    def getLatest(self):
+        latest = dict(self.latest)
+        latest['nsamples'] = self.nsamples
+        return latest
+
+    def getMetrics(self):
+        latest  = self.latest
+        lines   = [ ]
+        written = set()
+        for key, (name, help) in metric_dict.items():
+            value = latest.get(key,None)
+            if value is None: continue
+            base = name.split('{')[0]
+            if base not in written:
+                lines.append("# HELP %s %s"%(base,help))
+                lines.append("# TYPE %s gauge"%(base))
+                written.add(base)
+            lines.append("%s %s"%(name,float(value)))
+        lines.append("# HELP monitor_samples_total Number of samples taken by the monitor.")
+        lines.append("# TYPE monitor_samples_total counter")
+        lines.append("monitor_samples_total %d"%(self.nsamples))
+        if 'time' in latest:
+            lines.append("# HELP monitor_last_sample_timestamp_seconds Time of the last sample.")
+            lines.append("# TYPE monitor_last_sample_timestamp_seconds gauge")
+            lines.append("monitor_last_sample_timestamp_seconds %.3f"%(latest['time']))
+        lines.append("# HELP monitor_uptime_seconds Time since the monitor server started.")
+        lines.append("# TYPE monitor_uptime_seconds gauge")
+        lines.append("monitor_uptime_seconds %.3f"%(time.time()-self.tstart))
+        return '\n'.join(lines)+'\n'
+
+    def start(self):
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever,name="MonitorServer",daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        with self.newsample:
+            self.newsample.notify_all()
+        self.shutdown()
+        self.server_close()
+
+
+def startMonitorServer(port=8000,host='',token=None):
+    """Start HTTP server for the monitor; return None if the port is not available."""
+    try:
+        server = MonitorServer(port,host,token=token).start()
+    except OSError as err:
+        warning("Could not start HTTP server on port %s: %s"%(port,err))
+        return None
+    print("Serving monitoring data on http://%s:%d/ (dashboard), /metrics and /latest"%(host or 'localhost',port))
+    return server
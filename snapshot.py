@@ -0,0 +1,171 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Latest sample of the running monitor in a fixed-layout shared memory block,
+# so local status queries need no connection to the chamber:
+#   header  magic 'CCMS', version, size of the sample
+#   seq     seqlock counter: odd while the monitor writes, even when the sample is complete
+#   sample  sample number, time, chamber values, YoctoMeteo readings, status bits,
+#           program number, number of active alarms and warnings, run status and interlock state
+# Readers copy the sample and retry if the counter changed or was odd (seqlock),
+# so the writer never waits for readers. Values that were not read are NaN or -1.
+# shared_memory: https://docs.python.org/3/library/multiprocessing.shared_memory.html
+# seqlock:       https://en.wikipedia.org/wiki/Seqlock
+# e.g.
+#  python monitor.py -b &
+#  python snapshot.py
+import os, sys, time
+import struct
+from multiprocessing import shared_memory, resource_tracker
+
+# LAYOUT
+magic    = b'CCMS'
+version  = 1
+hdrfmt   = '<4sHH8x' # magic, version, sample size
+seqfmt   = '<Q'
+fields   = [ # name, format
+  ('sample',   'Q'  ), ('time',     'd'  ), ('tstep',    'd'  ), ('pid',   'i'), ('status', 'i'),
+  ('temp',     'd'  ), ('setp',     'd'  ),
+  ('temp_YM1', 'd'  ), ('temp_YM2', 'd'  ), ('dewp_YM1', 'd'  ), ('dewp_YM2', 'd'  ),
+  ('air',      'b'  ), ('dry',      'b'  ), ('run',      'b'  ), ('pad',   'x'),
+  ('prgm',     'i'  ), ('nwarn',    'i'  ),
+  ('runstatus','64s'), ('interlock','16s'),
+]
+samplefmt = '<'+''.join(f for n, f in fields)
+names     = [n for n, f in fields if f!='x']
+seqoffset = struct.calcsize(hdrfmt)
+offset    = seqoffset+struct.calcsize(seqfmt)
+size      = offset+struct.calcsize(samplefmt)
+published = set() # blocks written by this process
+
+
+def getSnapshotName(ip):
+    """Return the name of the shared memory block of the monitor of a chamber."""
+    return "ccmonitor_%s"%(str(ip).replace('.','_').replace(':','_'))
+
+
+class SnapshotWriter(object):
+    """Publish the latest sample of the monitor in shared memory."""
+
+    def __init__(self,ip,tstep=0):
+        self.name  = getSnapshotName(ip)
+        self.tstep = tstep
+        self.seq   = 0
+        self.nsamples = 0
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name,create=True,size=size)
+        except FileExistsError: # left by a monitor that was killed
+            self.shm = shared_memory.SharedMemory(name=self.name)
+            if self.shm.size<size:
+                self.shm.close()
+                self.shm.unlink()
+                self.shm = shared_memory.SharedMemory(name=self.name,create=True,size=size)
+        published.add(self.name)
+        struct.pack_into(seqfmt,self.shm.buf,seqoffset,1) # odd: no complete sample yet
+        struct.pack_into(hdrfmt,self.shm.buf,0,magic,version,struct.calcsize(samplefmt))
+
+    def publish(self,**values):
+        """Write a new sample; missing values are NaN or -1."""
+        self.nsamples += 1
+        values.setdefault('time',time.time())
+        row = [ ]
+        for name, fmt in fields:
+            if fmt=='x':
+                continue
+            value = values.get(name,None)
+            if name=='sample':
+                value = self.nsamples
+            elif name=='tstep':
+                value = self.tstep
+            elif name=='pid':
+                value = os.getpid()
+            elif fmt.endswith('s'):
+                value = str(value or "").encode('latin-1','replace')
+            elif value==None:
+                value = float('nan') if fmt=='d' else -1
+            elif fmt!='d':
+                value = int(value)
+            row.append(value)
+        data = struct.pack(samplefmt,*row)
+        buf  = self.shm.buf
+        self.seq += 1
+        struct.pack_into(seqfmt,buf,seqoffset,2*self.seq-1) # odd: writing
+        buf[offset:offset+len(data)] = data
+        struct.pack_into(seqfmt,buf,seqoffset,2*self.seq)   # even: complete
+
+    def close(self):
+        """Remove the block, so readers fall back to the chamber."""
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def openSnapshot(ip):
+    """Attach to the shared memory block of a monitor; None if there is none."""
+    try:
+        if sys.version_info>=(3,13):
+            return shared_memory.SharedMemory(name=getSnapshotName(ip),track=False)
+        shm = shared_memory.SharedMemory(name=getSnapshotName(ip))
+    except (FileNotFoundError,ValueError):
+        return None
+    if getSnapshotName(ip) not in published: # do not remove the block of the monitor at exit
+        resource_tracker.unregister(shm._name,'shared_memory')
+    return shm
+
+
+def readSnapshot(ip,maxage=None,nretry=100):
+    """Return the latest sample of the monitor of a chamber as a dict, or None
+    if no monitor is publishing, or if the sample is older than maxage seconds
+    (default: three monitor steps, at least 10 s)."""
+    shm = openSnapshot(ip)
+    if shm==None:
+        return None
+    try:
+        buf = shm.buf
+        if len(buf)<size or struct.unpack_from(hdrfmt,buf,0)[:2]!=(magic,version):
+            return None
+        for itry in range(nretry):
+            seq1 = struct.unpack_from(seqfmt,buf,seqoffset)[0]
+            if seq1%2: # being written
+                time.sleep(0)
+                continue
+            data = bytes(buf[offset:size])
+            if struct.unpack_from(seqfmt,buf,seqoffset)[0]==seq1:
+                break
+        else:
+            return None
+        del buf
+    finally:
+        shm.close()
+    values = dict(zip(names,struct.unpack(samplefmt,data)))
+    for name in ['runstatus','interlock']:
+        values[name] = values[name].rstrip(b'\x00').decode('latin-1')
+    values['age'] = time.time()-values['time']
+    if maxage==None:
+        maxage = max(10.,3*values['tstep'])
+    if values['age']>maxage:
+        return None
+    return values
+
+
+def main(args):
+    values = readSnapshot(args.ip,maxage=args.maxage)
+    if values==None:
+        print("No recent sample of a running monitor for %s."%(args.ip))
+        sys.exit(1)
+    for name in names+['age']:
+        print("  %-10s %s"%(name,values[name]))
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from chamber_commands import defaultip
+    description = '''Print the latest sample of the running monitor from shared memory.'''
+    parser = ArgumentParser(prog="snapshot",description=description,epilog="Good luck!")
+    parser.add_argument('-i', '--ip',        dest='ip', type=str, default=defaultip, action='store',
+                                             help="IP address of the climate chamber (default: %(default)s)" )
+    parser.add_argument('-a', '--max-age',   dest='maxage', type=float, default=None, action='store',
+                                             help="maximal age of the sample in seconds (default: three monitor steps, at least 10 s)" )
+    args = parser.parse_args()
+    main(args)
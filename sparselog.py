@@ -0,0 +1,307 @@
+#! /usr/bin/env python
+# coding: latin-1
+# Change-only logging: continuous channels are only written when they move out
+# of a deadband or when the heartbeat expires; discrete signals (air, dryer, run,
+# program, alarms) are written as transitions to a side stream 'monitor_events.dat':
+#   stamp,name,value
+# The log keeps the usual csv columns, so it can still be read as a normal log;
+# readLog merges the events and can fill the sparse rows back to a dense series.
+# Log schemas, recognized by the first line of the file:
+#   1  no header: stamp as '%d-%m-%Y %H:%M:%S' (whole seconds)
+#   2  header '#schema=2,...': stamp as epoch nanoseconds, plus the epoch nanoseconds at which
+#      the chamber and YoctoMeteo reads completed, to measure the skew between both sources
+# New files get schema 2; existing files keep their schema, so older readers are not broken.
+# e.g.
+#  python monitor.py -b --sparse --deadband 0.1 --heartbeat 600
+#  python sparselog.py -i monitor.dat -o monitor_dense.dat -s 10
+#  python sparselog.py -i monitor.dat -k # skew between chamber and YoctoMeteo reads
+import os, sys, time, datetime
+import csv
+
+# LOG COLUMNS: stamp, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run[, tchamber, tyocto]
+tformat    = '%d-%m-%Y %H:%M:%S'
+schema     = 2 # latest schema, for new files
+schemahead = "#schema=%d,time_ns,temp,setp,temp_YM1,temp_YM2,dewp_YM1,dewp_YM2,air,dry,run,tchamber_ns,tyocto_ns"
+contcols   = [1,3,4,5,6] # continuous columns with deadband
+exactcols  = [2]         # setpoint: every change
+discrcols  = { 'air': 7, 'dry': 8, 'run': 9 } # discrete columns, also logged as events
+
+
+def getEventName(logname):
+    """Return the name of the event stream of a log file."""
+    base, ext = os.path.splitext(logname)
+    return base+"_events"+(ext or ".dat")
+
+
+def toNanoseconds(stamp):
+    """Convert a stamp (epoch nanoseconds, formatted string or datetime) to epoch nanoseconds."""
+    if isinstance(stamp,datetime.datetime):
+        return int(time.mktime(stamp.timetuple()))*1000000000+stamp.microsecond*1000
+    if isinstance(stamp,str) and not stamp.isdigit():
+        return toNanoseconds(datetime.datetime.strptime(stamp,tformat))
+    return int(stamp)
+
+
+def toEpoch(stamp):
+    """Convert a stamp to epoch seconds."""
+    return toNanoseconds(stamp)/1e9
+
+
+def parseStamp(stamp):
+    """Convert the stamp field of either schema to datetime."""
+    if stamp.isdigit():
+        tns = int(stamp)
+        return datetime.datetime.fromtimestamp(tns//1000000000).replace(microsecond=(tns%1000000000)//1000)
+    return datetime.datetime.strptime(stamp,tformat)
+
+
+def openSchema(logfile):
+    """Return the schema of a log file opened with 'a+' or 'w+';
+    an empty file gets the header of the latest schema."""
+    logfile.seek(0)
+    line = logfile.readline()
+    logfile.seek(0,os.SEEK_END)
+    if not line:
+        logfile.write(schemahead%(schema)+'\n')
+        return schema
+    if line.startswith('#schema='):
+        return int(line[8:].split(',',1)[0])
+    return 1
+
+
+def isSame(value,last,deadband=0):
+    """Compare sample to last written value; NaN only equals NaN."""
+    if value!=value or last!=last:
+        return value!=value and last!=last
+    return abs(value-last)<=deadband
+
+
+class CSVLogWriter(object):
+    """Drop-in for csv.writer that writes rows in the schema of the log file.
+    Rows are [stamp, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run, tchamber, tyocto],
+    the stamps in epoch nanoseconds; rows without read times, or with string stamps, are accepted too."""
+
+    def __init__(self,logfile):
+        self.schema = openSchema(logfile)
+        self.logger = csv.writer(logfile)
+
+    def formatStamp(self,stamp):
+        if self.schema>=2:
+            return toNanoseconds(stamp)
+        if isinstance(stamp,str):
+            return stamp
+        return parseStamp(str(toNanoseconds(stamp))).strftime(tformat)
+
+    def formatRow(self,row):
+        if self.schema>=2:
+            tchamber, tyocto = (list(row[10:12])+[-1,-1])[:2]
+            return [self.formatStamp(row[0])]+list(row[1:10])+[tchamber,tyocto]
+        return [self.formatStamp(row[0])]+list(row[1:10])
+
+    def writerow(self,row):
+        self.logger.writerow(self.formatRow(row))
+
+
+class SparseLogWriter(CSVLogWriter):
+    """Drop-in for csv.writer that only writes changed rows, and discrete transitions as events."""
+
+    def __init__(self,logfile,eventfile,deadband=0.1,heartbeat=600):
+        CSVLogWriter.__init__(self,logfile)
+        self.events    = csv.writer(eventfile)
+        self.eventfile = eventfile
+        self.deadband  = deadband
+        self.heartbeat = heartbeat
+        self.last      = None # last written row
+        self.tlast     = None # time of last written row
+        self.prev      = None # last sample, if not written
+        self.nskipped  = 0
+        self.states    = { }  # event name -> last value
+        self.nrows     = 0
+        self.nwritten  = 0
+
+    def isChanged(self,row):
+        last = self.last
+        for i in contcols:
+            if not isSame(row[i],last[i],self.deadband): return True
+        for i in exactcols+list(discrcols.values()):
+            if not isSame(row[i],last[i]): return True
+        return False
+
+    def writerow(self,row):
+        """Write the sample if it changed or the heartbeat expired."""
+        self.nrows += 1
+        tval = toEpoch(row[0])
+        self.writeevents(row[0],**{ n: row[i] for n, i in discrcols.items() })
+        if self.last==None or self.isChanged(row) or tval-self.tlast>=self.heartbeat:
+            if self.prev and self.nskipped>=2: # end of a flat period: keep its last sample for interpolation
+                self.logger.writerow(self.formatRow(self.prev))
+                self.nwritten += 1
+            self.logger.writerow(self.formatRow(row))
+            self.nwritten += 1
+            self.last, self.tlast = row, tval
+            self.prev, self.nskipped = None, 0
+        else:
+            self.prev = row
+            self.nskipped += 1
+
+    def flush(self):
+        """Write the last sample, if it was skipped."""
+        if self.prev:
+            self.logger.writerow(self.formatRow(self.prev))
+            self.nwritten += 1
+            self.last, self.prev, self.nskipped = self.prev, None, 0
+
+    def writeevents(self,stamp,**values):
+        """Write a transition event for each value that changed."""
+        for name, value in values.items():
+            if self.states.get(name,None)!=value:
+                self.events.writerow([self.formatStamp(stamp),name,value])
+                self.states[name] = value
+        self.eventfile.flush()
+
+
+def readEvents(logname,tback=None):
+    """Read the event stream of a log file as a list of (time, name, value)."""
+    events    = [ ]
+    eventname = getEventName(logname)
+    if not os.path.isfile(eventname):
+        return events
+    with open(eventname,'r') as eventfile:
+        for stamp, name, value in csv.reader(eventfile):
+            tval = parseStamp(stamp)
+            if tback and tval<tback: continue
+            events.append((tval,name,int(value)))
+    return events
+
+
+def parseRow(fields):
+    """Convert the csv fields of a log row to [time, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run]."""
+    stamp, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run = fields[:10]
+    return [parseStamp(stamp),float(temp),float(setp),float(temp_YM1),float(temp_YM2),
+            float(dewp_YM1),float(dewp_YM2),int(air),int(dry),int(run)]
+
+
+def readLog(logname,tback=None,tstep=None,maxgap=900):
+    """Read log file into rows [time, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run].
+    Discrete transitions from the event stream are merged as extra rows. If tstep is given,
+    sparse rows are held to give a dense series; gaps longer than maxgap seconds stay gaps."""
+    rows = [ ]
+    if not os.path.isfile(logname):
+        return rows
+    with open(logname,'r') as logfile:
+        for fields in csv.reader(logfile):
+            if not fields or fields[0].startswith('#'): # schema header
+                continue
+            row = parseRow(fields)
+            if tback and row[0]<tback: continue
+            rows.append(row)
+    events = [e for e in readEvents(logname,tback) if e[1] in discrcols]
+    if events and rows:
+        rows = mergeEvents(rows,events)
+    if tstep:
+        rows = fillRows(rows,tstep,maxgap)
+    return rows
+
+
+def readTimings(logname):
+    """Read the times of schema-2 rows as a list of (stamp, tchamber, tyocto) in epoch nanoseconds;
+    rows without read times are skipped."""
+    timings = [ ]
+    if not os.path.isfile(logname):
+        return timings
+    with open(logname,'r') as logfile:
+        for fields in csv.reader(logfile):
+            if len(fields)<12 or not fields[0].isdigit():
+                continue
+            tchamber, tyocto = int(fields[10]), int(fields[11])
+            if tchamber>0 and tyocto>0:
+                timings.append((int(fields[0]),tchamber,tyocto))
+    return timings
+
+
+def printSkew(logname):
+    """Print the read latency of the chamber and YoctoMeteo modules, and their skew."""
+    timings = readTimings(logname)
+    if not timings:
+        print("No read times in '%s'; only logs with schema 2 have them."%(logname))
+        return
+    quantile = lambda vals, q: sorted(vals)[min(len(vals)-1,int(q*len(vals)))]
+    print("Read times of %d rows in '%s' [ms]:"%(len(timings),logname))
+    print("  %-22s %10s %10s %10s %10s"%("","median","95%","max","min"))
+    for name, vals in [("chamber after sample", [(c-t)/1e6 for t, c, y in timings]),
+                       ("Yocto after sample",   [(y-t)/1e6 for t, c, y in timings]),
+                       ("Yocto after chamber",  [(y-c)/1e6 for t, c, y in timings])]:
+        print("  %-22s %10.3f %10.3f %10.3f %10.3f"%(name,quantile(vals,0.5),quantile(vals,0.95),max(vals),min(vals)))
+
+
+def mergeEvents(rows,events):
+    """Apply discrete transitions as step functions, inserting a row at each transition."""
+    merged = [ ]
+    states = { }
+    ievent = 0
+    for row in rows:
+        while ievent<len(events) and events[ievent][0]<=row[0]:
+            tval, name, value = events[ievent]
+            states[name] = value
+            if merged and tval<row[0]: # transition between rows: hold continuous values
+                if tval>merged[-1][0]:
+                    merged.append([tval]+merged[-1][1:])
+                merged[-1][discrcols[name]] = value
+            ievent += 1
+        for name, value in states.items():
+            row[discrcols[name]] = value
+        merged.append(row)
+    return merged
+
+
+def fillRows(rows,tstep,maxgap=900):
+    """Fill sparse rows to a dense series by holding each row for every tstep."""
+    dense  = [ ]
+    dtstep = datetime.timedelta(seconds=tstep)
+    for row, next in zip(rows,rows[1:]+[None]):
+        dense.append(row)
+        if next==None or (next[0]-row[0]).total_seconds()>maxgap:
+            continue
+        tval = row[0]+dtstep
+        while tval<next[0]:
+            dense.append([tval]+row[1:])
+            tval += dtstep
+    return dense
+
+
+def main(args):
+
+    # SKEW
+    if args.skew:
+        printSkew(args.input)
+        return
+
+    # READ
+    print("Reading '%s'..."%(args.input))
+    tstart = time.time()
+    rows   = readLog(args.input,tstep=args.tstep,maxgap=args.maxgap)
+
+    # WRITE
+    with open(args.output,'w+') as outfile:
+        logger = CSVLogWriter(outfile)
+        for row in rows:
+            logger.writerow(row)
+    print("Wrote %d dense rows to '%s' in %.1f s"%(len(rows),args.output,time.time()-tstart))
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    description = '''Reconstruct a dense monitoring log from a change-only log and its event stream.'''
+    parser = ArgumentParser(prog="sparselog",description=description,epilog="Good luck!")
+    parser.add_argument('-i', '--input',     dest='input', type=str, default="monitor.dat", action='store',
+                                             help="input change-only log file (csv format)" )
+    parser.add_argument('-o', '--output',    dest='output', type=str, default="monitor_dense.dat", action='store',
+                                             help="output dense log file (csv format)" )
+    parser.add_argument('-s', '--stepsize',  dest='tstep', type=float, default=10, action='store',
+                                             help="step size of the dense series in seconds (default: %(default)s)" )
+    parser.add_argument('-g', '--maxgap',    dest='maxgap', type=float, default=900, action='store',
+                                             help="do not fill gaps longer than this many seconds (default: %(default)s)" )
+    parser.add_argument('-k', '--skew',      dest='skew', action='store_true',
+                                             help="print the read times of the chamber and YoctoMeteo modules, and their skew, instead" )
+    args = parser.parse_args()
+    main(args)
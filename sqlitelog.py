@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+# coding: latin-1
+# SQLite storage backend for monitoring data:
+#   chamber (chamber, time, temp, setp, air, dry, run)
+#   yocto   (chamber, module, time, temp, dewp)
+#   events  (chamber, time, name, value)
+# The database runs in WAL mode, so several tools can read while the monitor writes;
+# samples are inserted in batches of one transaction every nbatch samples or tbatch seconds.
+# sqlite3: https://docs.python.org/3/library/sqlite3.html
+# WAL:     https://www.sqlite.org/wal.html
+# e.g.
+#  python monitor.py -b -o monitor.db
+#  python plotter.py -i monitor.db
+import os, sys, time, datetime
+import sqlite3
+sys.path.append(os.path.dirname(__file__))
+from sparselog import toEpoch
+
+dbexts  = ('.db','.sqlite')
+schema  = """
+CREATE TABLE IF NOT EXISTS chamber (chamber TEXT, time REAL, temp REAL, setp REAL, air INTEGER, dry INTEGER, run INTEGER);
+CREATE TABLE IF NOT EXISTS yocto   (chamber TEXT, module TEXT, time REAL, temp REAL, dewp REAL);
+CREATE TABLE IF NOT EXISTS events  (chamber TEXT, time REAL, name TEXT, value INTEGER);
+CREATE INDEX IF NOT EXISTS chamber_time ON chamber (chamber, time);
+CREATE INDEX IF NOT EXISTS yocto_time   ON yocto   (chamber, module, time);
+CREATE INDEX IF NOT EXISTS events_time  ON events  (chamber, time);
+"""
+
+
+def isDatabase(fname):
+    return fname.lower().endswith(dbexts)
+
+
+def connectDatabase(dbname,readonly=False):
+    """Connect to database, creating the tables if needed."""
+    if readonly:
+        return sqlite3.connect('file:%s?mode=ro'%(dbname),uri=True,timeout=10)
+    db = sqlite3.connect(dbname,timeout=10)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL") # durable at checkpoints, enough for monitoring
+    db.executescript(schema)
+    return db
+
+
+class SQLiteLogWriter(object):
+    """Drop-in for csv.writer that inserts monitoring rows into a SQLite database in batches."""
+
+    def __init__(self,dbname,chamber='chamber',nbatch=30,tbatch=60):
+        self.db       = connectDatabase(dbname)
+        self.chamber  = chamber
+        self.nbatch   = nbatch # maximal number of samples per transaction
+        self.tbatch   = tbatch # maximal time in seconds between transactions
+        self.samples  = [ ]
+        self.yoctos   = [ ]
+        self.events   = [ ]
+        self.states   = { }    # event name -> last value
+        self.tcommit  = time.time()
+        self.ncommits = 0
+
+    def writerow(self,row):
+        """Buffer row [stamp, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run];
+        the read times of the chamber and YoctoMeteo modules, if any, are not stored."""
+        stamp, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run = row[:10]
+        tval = toEpoch(stamp)
+        self.samples.append((self.chamber,tval,temp,setp,air,dry,run))
+        for module, ytemp, ydewp in [('YM1',temp_YM1,dewp_YM1),('YM2',temp_YM2,dewp_YM2)]:
+            if ytemp!=-1 or ydewp!=-1: # module connected
+                self.yoctos.append((self.chamber,module,tval,ytemp,ydewp))
+        self.writeevents(stamp,air=air,dry=dry,run=run)
+        if len(self.samples)>=self.nbatch or time.time()-self.tcommit>=self.tbatch:
+            self.commit()
+
+    def writeevents(self,stamp,**values):
+        """Buffer a transition event for each value that changed."""
+        tval = None
+        for name, value in values.items():
+            if self.states.get(name,None)!=value:
+                if tval==None:
+                    tval = toEpoch(stamp)
+                self.events.append((self.chamber,tval,name,value))
+                self.states[name] = value
+
+    def commit(self):
+        """Insert all buffered rows in one transaction."""
+        with self.db:
+            self.db.executemany("INSERT INTO chamber VALUES (?,?,?,?,?,?,?)",self.samples)
+            self.db.executemany("INSERT INTO yocto VALUES (?,?,?,?,?)",self.yoctos)
+            self.db.executemany("INSERT INTO events VALUES (?,?,?,?)",self.events)
+        self.samples, self.yoctos, self.events = [ ], [ ], [ ]
+        self.tcommit   = time.time()
+        self.ncommits += 1
+
+    def flush(self):
+        if self.samples or self.events:
+            self.commit()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+def getChambers(dbname):
+    """Return the names of the chambers in the database."""
+    db = connectDatabase(dbname,readonly=True)
+    try:
+        return [c for c, in db.execute("SELECT DISTINCT chamber FROM chamber")]
+    finally:
+        db.close()
+
+
+def readDatabase(dbname,tback=None,tstop=None,chamber=None):
+    """Read rows [time, temp, setp, temp_YM1, temp_YM2, dewp_YM1, dewp_YM2, air, dry, run]
+    in a time range with an indexed query; YoctoMeteo values are -1 without a row (module not connected,
+    as in the log files), and NaN for a NULL value (module offline)."""
+    db = connectDatabase(dbname,readonly=True)
+    try:
+        if chamber==None:
+            chamber = db.execute("SELECT chamber FROM chamber ORDER BY rowid DESC LIMIT 1").fetchone()
+            if chamber==None:
+                return [ ]
+            chamber = chamber[0]
+        tmin  = time.mktime(tback.timetuple()) if tback else 0
+        tmax  = time.mktime(tstop.timetuple()) if tstop else 1e18
+        query = """
+          SELECT c.time, c.temp, c.setp,
+                 CASE WHEN y1.rowid IS NULL THEN -1 ELSE y1.temp END, CASE WHEN y2.rowid IS NULL THEN -1 ELSE y2.temp END,
+                 CASE WHEN y1.rowid IS NULL THEN -1 ELSE y1.dewp END, CASE WHEN y2.rowid IS NULL THEN -1 ELSE y2.dewp END,
+                 c.air, c.dry, c.run
+          FROM chamber c
+          LEFT JOIN yocto y1 ON y1.chamber=c.chamber AND y1.module='YM1' AND y1.time=c.time
+          LEFT JOIN yocto y2 ON y2.chamber=c.chamber AND y2.module='YM2' AND y2.time=c.time
+          WHERE c.chamber=? AND c.time>=? AND c.time<=?
+          ORDER BY c.time"""
+        nan  = float('nan')
+        rows = [ ]
+        for row in db.execute(query,(chamber,tmin,tmax)):
+            row = [nan if v is None else v for v in row] # NULL from gaps with NaN
+            rows.append([datetime.datetime.fromtimestamp(row[0])]+row[1:])
+        return rows
+    finally:
+        db.close()
+
+
+def readEvents(dbname,tback=None,chamber=None):
+    """Read events as a list of (time, name, value)."""
+    db = connectDatabase(dbname,readonly=True)
+    try:
+        tmin   = time.mktime(tback.timetuple()) if tback else 0
+        query  = "SELECT time, name, value FROM events WHERE time>=?"
+        params = [tmin]
+        if chamber!=None:
+            query += " AND chamber=?"
+            params.append(chamber)
+        return [(datetime.datetime.fromtimestamp(t),n,v) for t, n, v in db.execute(query+" ORDER BY time",params)]
+    finally:
+        db.close()
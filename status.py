@@ -7,6 +7,7 @@ from chamber_commands import connectClimateChamber, defaultip,\
                              getRunStatus, checkActiveWarnings, getActiveWarnings
 import yocto_commands as YOCTO
 from yocto_commands import connectYoctoMeteo, disconnectYoctoMeteo
+from snapshot import readSnapshot
 
 
 def addRow(col1,col2="",just=38):
@@ -44,59 +45,94 @@ def getCurrentStatus(**kwargs):
     ip       = kwargs.get('ip',  defaultip    )
     logname  = kwargs.get('out', "status.txt" )
     verbose  = kwargs.get('verbose', False )
+    direct   = kwargs.get('direct',  False ) # ask the chamber, even if the monitor is running
     tformat  = '%d-%m-%Y %H:%M:%S'
 
-    # CONNECT
-    if verbose:
-        print("Connecting to climate chamber...")
-    chamber = connectClimateChamber(ip=ip)
-    ymeteo1 = connectYoctoMeteo(YOCTO.ymeteo1)
-    ymeteo2 = connectYoctoMeteo(YOCTO.ymeteo2)
-
-    # GET STATUS
-    if verbose:
-        print("Checking status...")
-    tnow = datetime.datetime.now()
-    nalarms, nwarns, nmsgs = 0, 0, 0
-    if chamber==None:
-        string  = "  Climate chamber not found in network."
+    # LATEST SAMPLE of the running monitor
+    values  = None if direct else readSnapshot(ip)
+    chamber = None
+    if values:
         if verbose:
-            string += addRow("IP address:  %s"%(ip))
-            string += addRow("Time stamp:  %s"%(tnow.strftime(tformat)))
-        string += addRow("Setpoint:    ", "Compr. air:  ")
-        string += addRow("Temperature: ", "Dryer:       ")
-        if verbose:
-            string += addRow("Temp. YM1:   ", "Messages:    ")
-            string += addRow("Temp. YM2:   ", "Warnings:    ")
-            string += addRow("Dewp. YM1:   ", "Alarms:      ")
-            string += addRow("Dewp. YM2:   ")
-    else:
-        temp_YM1, temp_YM2, dewp_YM1, dewp_YM2 = "", "", "", ""
-        if ymeteo1:
-            temp_YM1 = "%.3f"%ymeteo1.getTemp()
-            dewp_YM1 = "%.3f"%ymeteo1.getDewp()
-        if ymeteo2:
-            temp_YM2 = "%.3f"%ymeteo2.getTemp()
-            dewp_YM2 = "%.3f"%ymeteo2.getDewp()
-        nalarms  = checkActiveWarnings(chamber,type=1)
-        nwarns   = checkActiveWarnings(chamber,type=2)
-        nmsgs    = checkActiveWarnings(chamber,type=4)
-        string   = "Climate chamber's currect status: %s"%(getRunStatus(chamber))
+            print("Using the latest sample of the running monitor (%.1f s old)..."%(values['age']))
+        tnow     = datetime.datetime.fromtimestamp(values['time'])
+        flags    = max(0,values['status'])
+        nalarms, nwarns, nmsgs = 0, 0, 0
+        if flags&12: # warnings or alarms: ask the chamber for the messages
+            chamber = connectClimateChamber(ip=ip)
+            nalarms = checkActiveWarnings(chamber,type=1)
+            nwarns  = checkActiveWarnings(chamber,type=2)
+            nmsgs   = checkActiveWarnings(chamber,type=4)
+        yocto    = lambda v: "" if v==-1 or v!=v else "%.3f"%v
+        string   = "Climate chamber's currect status: %s"%(values['runstatus'])
         if verbose:
             string  += addRow("IP address:  %s"%(ip))
             string  += addRow("Time stamp:  %s"%(tnow.strftime(tformat)))
-        string  += addRow("Setpoint:    %8.3f"%(chamber.getSetp()),
-                          "Compr. air:  %4s"%('ON' if chamber.getAir()==1 else 'OFF'))
-        string  += addRow("Temperature: %8.3f"%(chamber.getTemp()),
-                          "Dryer:       %4s"%('ON' if chamber.getDryer()==1 else 'OFF'))
+        string  += addRow("Setpoint:    %8.3f"%(values['setp']),
+                          "Compr. air:  %4s"%('ON' if values['air']==1 else 'OFF'))
+        string  += addRow("Temperature: %8.3f"%(values['temp']),
+                          "Dryer:       %4s"%('ON' if values['dry']==1 else 'OFF'))
         if verbose:
-            string  += addRow("Temp. YM1:   %8s"%(temp_YM1),
+            string  += addRow("Temp. YM1:   %8s"%(yocto(values['temp_YM1'])),
                           "Messages:    %4d"%(nmsgs))
-            string  += addRow("Temp. YM2:   %8s"%(temp_YM2),
+            string  += addRow("Temp. YM2:   %8s"%(yocto(values['temp_YM2'])),
                           "Warnings:    %4d"%(nwarns))
-            string  += addRow("Dewp. YM1:   %8s"%(dewp_YM1),
+            string  += addRow("Dewp. YM1:   %8s"%(yocto(values['dewp_YM1'])),
                           "Alarms:      %4d"%(nalarms))
-            string  += addRow("Dewp. YM2:   %8s"%(dewp_YM2))
+            string  += addRow("Dewp. YM2:   %8s"%(yocto(values['dewp_YM2'])),
+                          "Interlock:   %s"%(values['interlock']))
+
+    # CONNECT
+    else:
+        if verbose:
+            print("Connecting to climate chamber...")
+        chamber = connectClimateChamber(ip=ip)
+        ymeteo1 = connectYoctoMeteo(YOCTO.ymeteo1)
+        ymeteo2 = connectYoctoMeteo(YOCTO.ymeteo2)
+
+        # GET STATUS
+        if verbose:
+            print("Checking status...")
+        tnow = datetime.datetime.now()
+        nalarms, nwarns, nmsgs = 0, 0, 0
+        if chamber==None:
+            string  = "  Climate chamber not found in network."
+            if verbose:
+                string += addRow("IP address:  %s"%(ip))
+                string += addRow("Time stamp:  %s"%(tnow.strftime(tformat)))
+            string += addRow("Setpoint:    ", "Compr. air:  ")
+            string += addRow("Temperature: ", "Dryer:       ")
+            if verbose:
+                string += addRow("Temp. YM1:   ", "Messages:    ")
+                string += addRow("Temp. YM2:   ", "Warnings:    ")
+                string += addRow("Dewp. YM1:   ", "Alarms:      ")
+                string += addRow("Dewp. YM2:   ")
+        else:
+            temp_YM1, temp_YM2, dewp_YM1, dewp_YM2 = "", "", "", ""
+            if ymeteo1:
+                temp_YM1 = "%.3f"%ymeteo1.getTemp()
+                dewp_YM1 = "%.3f"%ymeteo1.getDewp()
+            if ymeteo2:
+                temp_YM2 = "%.3f"%ymeteo2.getTemp()
+                dewp_YM2 = "%.3f"%ymeteo2.getDewp()
+            nalarms  = checkActiveWarnings(chamber,type=1)
+            nwarns   = checkActiveWarnings(chamber,type=2)
+            nmsgs    = checkActiveWarnings(chamber,type=4)
+            string   = "Climate chamber's currect status: %s"%(getRunStatus(chamber))
+            if verbose:
+                string  += addRow("IP address:  %s"%(ip))
+                string  += addRow("Time stamp:  %s"%(tnow.strftime(tformat)))
+            string  += addRow("Setpoint:    %8.3f"%(chamber.getSetp()),
+                              "Compr. air:  %4s"%('ON' if chamber.getAir()==1 else 'OFF'))
+            string  += addRow("Temperature: %8.3f"%(chamber.getTemp()),
+                              "Dryer:       %4s"%('ON' if chamber.getDryer()==1 else 'OFF'))
+            if verbose:
+                string  += addRow("Temp. YM1:   %8s"%(temp_YM1),
+                              "Messages:    %4d"%(nmsgs))
+                string  += addRow("Temp. YM2:   %8s"%(temp_YM2),
+                              "Warnings:    %4d"%(nwarns))
+                string  += addRow("Dewp. YM1:   %8s"%(dewp_YM1),
+                              "Alarms:      %4d"%(nalarms))
+                string  += addRow("Dewp. YM2:   %8s"%(dewp_YM2))
 
     if verbose:
         print("Status check finished!")
@@ -121,14 +157,16 @@ def getCurrentStatus(**kwargs):
     # DISCONNECT
     if verbose:
         print("Closing connection...")
-    chamber.disconnect()
-    disconnectYoctoMeteo()
+    if chamber:
+        chamber.disconnect()
+    if not values:
+        disconnectYoctoMeteo()
 
 
 def main(args):
 
     # CHECK STATUS
-    getCurrentStatus(out=args.output, verbose=args.verbose)
+    getCurrentStatus(out=args.output, verbose=args.verbose, direct=args.direct)
 
 
 if __name__ == '__main__':
@@ -137,6 +175,8 @@ if __name__ == '__main__':
     parser = ArgumentParser(prog="monitor",description=description,epilog="Good luck!")
     parser.add_argument('-o', '--output',    dest='output', type=str, default="status.txt", action='store',
                                              help="output log file with monitoring data (csv format)" )
+    parser.add_argument('-d', '--direct',    dest='direct', default=False, action='store_true',
+                                             help="ask the climate chamber, even if the monitor publishes its latest sample" )
     parser.add_argument('-v', '--verbose',   dest='verbose', default=False, action='store_true',
                                              help="set verbose" )
     args = parser.parse_args()
@@ -10,7 +10,8 @@ import matplotlib.gridspec as gridspec
 import numpy as np
 from utils import warning, checkGUIMode
 from monitor import monitor
-from chamber_commands import connectClimateChamber, sendSimServCmd, unpackSimServData
+from chamber_commands import connectClimateChamber, sendSimServCmd, unpackSimServData,\
+                             isChamberRunning, isChamberStopped, isPrgmStopped
 import yocto_commands as YOCTO
 from yocto_commands import connectYoctoMeteo, disconnectYoctoMeteo
 from argparse import ArgumentParser
@@ -27,7 +28,7 @@ parser.add_argument('-t', '--time',      dest='dtime', type=int, default=-1, act
                                          help="duration of data taking in seconds" )
 parser.add_argument('-n', '--nsamples',  dest='nsamples', type=int, default=-1, action='store',
                                          help="number of data readings; -1 for indefinite monitoring (until monitor window closes or monitoring is interrupted)" )
-parser.add_argument('-s', '--stepsize',  dest='stepsize', type=int, default=8, action='store',
+parser.add_argument('-s', '--stepsize',  dest='stepsize', type=float, default=8, action='store',
                                          help="sampling frequency of data reading in seconds" )
 parser.add_argument('-w', '--width',     dest='twidth', type=float, default=1000, action='store',
                                          help="width of time axis in seconds" )
@@ -77,8 +78,12 @@ def main(args):
     # STOP & MONITOR
     if args.warmup:
         chamber.forceWarmUp(args.target,args.gradient)
+        if chamber.waitFor(isChamberRunning,timeout=30):
+            print("Warm-up is running.")
     else:
         chamber.stop()
+        if chamber.waitFor(lambda c: isPrgmStopped(c) and isChamberStopped(c),timeout=30):
+            print("Climate chamber stopped.")
 
     if args.monitor:
         ymeteo1 = connectYoctoMeteo(YOCTO.ymeteo1)
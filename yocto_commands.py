@@ -4,7 +4,8 @@
 # Sources:
 #  https://www.yoctopuce.com/EN/products/yocto-meteo/doc.html
 #  https://www.yoctopuce.com/EN/doc/reference/yoctolib-python-EN.html
-import os, sys
+import os, sys, time
+import threading
 from math import log
 sys.path.append(os.path.join(os.path.dirname(__file__),"yoctolib_python","Sources"))
 from utils import warning
@@ -18,6 +19,8 @@ ymeteo1 = 'METEOMK1-28B37'
 ymeteo2 = 'METEOMK1-28AF9'
 
 # SHORT HAND COMMANDS
+nan       = float('nan') # value of modules that are offline, or of stale callback values
+nstale    = 5            # number of update periods after which callback values are stale
 getYMTemp = lambda m: m.temp.get_currentValue()
 getYMPres = lambda m: m.pres.get_currentValue()
 getYMHumi = lambda m: m.humi.get_currentValue()
@@ -25,12 +28,232 @@ getYMDewp = lambda m: computeDewPoint(m.temp.get_currentValue(),m.humi.get_curre
 
 # YOCTO METEO CLASS
 class YoctoMeteo(YModule):
-  def getTemp(self):    return getYMTemp(self)
-  def getHumi(self):    return getYMHumi(self)
-  def getDewp(self):    return getYMDewp(self)
-  def getPres(self):    return getYMPres(self)
+  online = True # updated by the session on unplug/replug
+  def getTemp(self):    return getYMTemp(self) if self.online else nan
+  def getHumi(self):    return getYMHumi(self) if self.online else nan
+  def getDewp(self):    return getYMDewp(self) if self.online else nan
+  def getPres(self):    return getYMPres(self) if self.online else nan
   def close(self):      return disconnectYoctoMeteo(self)
   def disconnect(self): return disconnectYoctoMeteo(self)
+  def getTempDewp(self):
+    """Read temperature and dewpoint with one temperature read."""
+    if not self.online:
+      return nan, nan
+    temp = getYMTemp(self)
+    return temp, computeDewPoint(temp,getYMHumi(self))
+  
+
+# YOCTO METEO CLASS with callbacks
+class YoctoMeteoCallback(YoctoMeteo):
+  """YoctoMeteo whose values are pushed by the Yocto API callbacks.
+  The latest values are kept in a (temp, humi, pres, dewp, time) tuple,
+  which is only replaced by the event thread, so reads need no lock and no USB traffic.
+  Values older than maxage seconds are stale and read as NaN."""
+  maxage = 10. # set from the update period by startYoctoMeteoCallbacks
+  def getTemp(self):    return self.latest[0] if self.isFresh() else nan
+  def getHumi(self):    return self.latest[1] if self.isFresh() else nan
+  def getPres(self):    return self.latest[2] if self.isFresh() else nan
+  def getDewp(self):    return self.latest[3] if self.isFresh() else nan
+  def getLatest(self):  return self.latest
+  def isFresh(self):    return self.online and self.getAge()<=self.maxage
+  def getAge(self):
+    """Seconds since the last update. Value callbacks only fire on changes,
+    so without timed reports the age counts from the last pump of the event thread."""
+    tlast = self.latest[4]
+    if not self.freq and yoctoevents!=None:
+      tlast = max(tlast,yoctoevents.tbeat)
+    return time.time()-tlast
+  def getTempDewp(self):
+    latest = self.latest
+    return (latest[0], latest[3]) if self.isFresh() else (nan, nan)
+  
+
+class YoctoEventThread(threading.Thread):
+  """Background thread pumping YAPI.HandleEvents for all callbacks,
+  and YAPI.UpdateDeviceList every tupdate seconds to detect (un)plugged modules."""
+  
+  def __init__(self,tsleep=0.05,tupdate=2.0):
+    threading.Thread.__init__(self,name="YoctoEvents",daemon=True)
+    self.tsleep  = tsleep
+    self.tupdate = tupdate
+    self.tbeat   = time.time() # time of the last pump without error
+    self.running = True
+  
+  def run(self):
+    errmsg = YRefParam()
+    tnext  = time.time()
+    while self.running:
+      try:
+        if self.tupdate and time.time()>=tnext:
+          tnext = time.time()+self.tupdate
+          YAPI.UpdateDeviceList(errmsg)
+        YAPI.HandleEvents(errmsg)
+        self.tbeat = time.time()
+      except Exception as err: # keep pumping: callback values of all modules depend on it
+        warning("YoctoMeteo event thread: %s"%(err))
+        time.sleep(max(self.tsleep,1.0))
+      time.sleep(self.tsleep)
+  
+  def stop(self):
+    self.running = False
+  
+
+yoctoevents = None # event thread shared by all modules
+
+def startYoctoEventThread():
+  """Start the event thread once."""
+  global yoctoevents
+  if yoctoevents==None or not yoctoevents.is_alive():
+    yoctoevents = YoctoEventThread()
+    yoctoevents.start()
+  return yoctoevents
+  
+
+def stopYoctoEventThread():
+  global yoctoevents
+  if yoctoevents!=None:
+    yoctoevents.stop()
+    yoctoevents.join(1)
+    yoctoevents = None
+  
+
+def startYoctoMeteoCallbacks(module,freq=None):
+  """Switch module to callback acquisition.
+  With freq (e.g. '1/s' or '30/m'), use timed reports (averaged values) at that frequency;
+  otherwise use value callbacks, fired whenever a value changes."""
+  temp, humi, pres = module.temp.get_currentValue(), module.humi.get_currentValue(), module.pres.get_currentValue()
+  module.latest = (temp,humi,pres,computeSafeDewPoint(temp,humi),time.time())
+  module.freq   = freq
+  module.maxage = nstale*(getReportPeriod(freq) or 2.0) # value callbacks: event thread updates every 2 s
+  def update(index,value):
+    temp, humi, pres, dewp, tval = module.latest
+    if   index==0: temp = value
+    elif index==1: humi = value
+    else:          pres = value
+    if index<2:
+      dewp = computeSafeDewPoint(temp,humi)
+    module.latest = (temp,humi,pres,dewp,time.time()) # single atomic swap
+  for index, sensor in enumerate([module.temp,module.humi,module.pres]):
+    if freq:
+      sensor.set_reportFrequency(freq)
+      sensor.registerTimedReportCallback(lambda f, m, i=index: update(i,m.get_averageValue()))
+    else:
+      sensor.registerValueCallback(lambda f, v, i=index: update(i,float(v)))
+  module.__class__ = YoctoMeteoCallback
+  startYoctoEventThread()
+  return module
+  
+
+# YOCTO METEO SESSION
+class YoctoMeteoSession(object):
+  """Share one registered hub between all YoctoMeteo modules:
+  the hub is registered on the first connect and freed after the last disconnect,
+  modules are tracked by serial number through (un)plugging, and read in parallel."""
+  
+  def __init__(self,hub='usb',nthreads=4):
+    self.hub      = hub
+    self.nrefs    = 0
+    self.modules  = { } # serial -> YoctoMeteo
+    self.nthreads = nthreads
+    self.pool     = None
+    self.lock     = threading.RLock()
+  
+  def acquire(self):
+    """Register the hub, if not done yet."""
+    with self.lock:
+      if self.nrefs==0:
+        errmsg = YRefParam()
+        if YAPI.RegisterHub(self.hub,errmsg)!=YAPI.SUCCESS:
+          warning("init error %s. Please check the USB cable!"%errmsg.value)
+          return False
+        YAPI.RegisterDeviceArrivalCallback(self.arrival)
+        YAPI.RegisterDeviceRemovalCallback(self.removal)
+        startYoctoEventThread()
+      self.nrefs += 1
+      return True
+  
+  def release(self,all=False):
+    """Release one reference (or all); free the API after the last one."""
+    with self.lock:
+      if self.nrefs==0:
+        return
+      self.nrefs = 0 if all else self.nrefs-1
+      if self.nrefs==0:
+        stopYoctoEventThread()
+        if self.pool:
+          self.pool.shutdown(wait=False)
+          self.pool = None
+        self.modules.clear()
+        YAPI.FreeAPI()
+  
+  def discover(self):
+    """Return the serial numbers of all connected YoctoMeteo modules."""
+    serials = [ ]
+    module  = YModule.FirstModule()
+    while module:
+      if 'Meteo' in module.get_productName():
+        serials.append(module.get_serialNumber())
+      module = module.nextModule()
+    return serials
+  
+  def getModule(self,serial):
+    """Return the YoctoMeteo module with this serial number."""
+    with self.lock:
+      module = self.modules.get(serial,None)
+      if module==None:
+        module = YModule.FindModule(serial)
+        module.humi = YHumidity.FindHumidity(serial+'.humidity')
+        module.pres = YPressure.FindPressure(serial+'.pressure')
+        module.temp = YTemperature.FindTemperature(serial+'.temperature')
+        module.__class__ = YoctoMeteo
+        self.modules[serial] = module
+      return module
+  
+  def arrival(self,device):
+    module = self.modules.get(device.get_serialNumber(),None)
+    if module!=None and not module.online:
+      warning("YoctoMeteo %s is online."%(device.get_serialNumber()))
+      try:
+        if getattr(module,'callbacks',False) and not isinstance(module,YoctoMeteoCallback): # not plugged in at connect
+          startYoctoMeteoCallbacks(module,freq=module.freq)
+        elif isinstance(module,YoctoMeteoCallback) and module.freq:
+          for sensor in [module.temp,module.humi,module.pres]:
+            sensor.set_reportFrequency(module.freq) # reset by power cycle
+      except Exception as err:
+        warning("Could not set up YoctoMeteo %s: %s"%(device.get_serialNumber(),err))
+        return
+      module.online = True
+  
+  def removal(self,device):
+    module = self.modules.get(device.get_serialNumber(),None)
+    if module!=None:
+      warning("YoctoMeteo %s was unplugged!"%(device.get_serialNumber()))
+      module.online = False
+  
+  def read(self,*modules):
+    """Read (temp, dewp) of all modules in parallel; (-1, -1) for modules that are None."""
+    def readModule(module):
+      if not module:
+        return -1, -1
+      try:
+        return module.getTempDewp()
+      except Exception as err:
+        warning("Could not read YoctoMeteo %s: %s"%(module.get_serialNumber(),err))
+        return nan, nan
+    active = [m for m in modules if m]
+    if len(active)<2:
+      return [readModule(m) for m in modules]
+    if self.pool==None:
+      from concurrent.futures import ThreadPoolExecutor
+      self.pool = ThreadPoolExecutor(max_workers=self.nthreads,thread_name_prefix="YoctoRead")
+    return list(self.pool.map(readModule,modules))
+  
+
+yoctosession = YoctoMeteoSession()
+
+def readYoctoMeteos(*modules):
+  """Read (temp, dewp) of several modules in parallel."""
+  return yoctosession.read(*modules)
   
 
 def connectRaspberryPi(ip):
@@ -48,41 +271,54 @@ def findYoctoMeteo(fatal=False):
   return False
   
 
-def connectYoctoMeteo(target='any'):
-  """Connect Yocto Meteo."""
-  
-  # SETUP the API to use local USB devices
-  errmsg = YRefParam()
-  if YAPI.RegisterHub('usb',errmsg)==YAPI.SUCCESS:
-    
-    # RETRIEVE any humidity sensor
-    if target=='any':
-      sensor = YHumidity.FirstHumidity()
-      if not sensor:
-        warning("No module connected. Please check the USB cable!")
-        return None
-      module = sensor.get_module()
-      target = module.get_serialNumber()
-    else:
-      module = YModule.FindModule(target)
-    if not module.isOnline():
-      warning("Device not connected. Please check the USB cable!")
+def connectYoctoMeteo(target='any',callbacks=False,freq=None):
+  """Connect Yocto Meteo.
+  With callbacks=True, values are pushed by the Yocto API instead of read on each call."""
+  
+  # SETUP the API to use local USB devices, once for all modules
+  if not yoctosession.acquire():
+    return None
+  
+  # RETRIEVE any YoctoMeteo module
+  if target=='any':
+    serials = yoctosession.discover()
+    if not serials:
+      warning("No module connected. Please check the USB cable!")
+      yoctosession.release()
       return None
-    
-    # ASSIGN sensors
-    module.humi  = YHumidity.FindHumidity(target+'.humidity')
-    module.pres  = YPressure.FindPressure(target+'.pressure')
-    module.temp  = YTemperature.FindTemperature(target+'.temperature')
-    module.__class__ = YoctoMeteo
+    target = serials[0]
+  module = yoctosession.getModule(target)
+  module.callbacks, module.freq = callbacks, freq
+  if not module.isOnline(): # offline placeholder, brought online by the session when plugged in
+    warning("YoctoMeteo %s not connected. Please check the USB cable! It will be read once plugged in."%(target))
+    module.online = False
     return module
-  else:
-    warning("init error %s. Please check the USB cable!"%errmsg.value)
-    return None
+  module.online = True
+  if callbacks and not isinstance(module,YoctoMeteoCallback):
+    startYoctoMeteoCallbacks(module,freq=freq)
+  return module
   
 
 def disconnectYoctoMeteo(*args):
-  """Disconnect Yocto Meteo."""
-  YAPI.FreeAPI()
+  """Disconnect Yocto Meteo; without a module, disconnect all."""
+  yoctosession.release(all=(len(args)==0))
+  
+
+def getReportPeriod(freq):
+  """Return the period in seconds of a report frequency like '1/s', '30/m' or '6/h', or None."""
+  try:
+    number, unit = freq.split('/')
+    return {'s': 1., 'm': 60., 'h': 3600.}[unit]/float(number)
+  except (AttributeError,ValueError,KeyError,ZeroDivisionError):
+    return None
+  
+
+def computeSafeDewPoint(T,RH):
+  """Compute the dewpoint, or NaN for a humidity out of range (e.g. RH<=0)."""
+  try:
+    return computeDewPoint(T,RH)
+  except (ValueError,ZeroDivisionError):
+    return nan
   
 
 def computeDewPoint(T,RH):